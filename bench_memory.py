@@ -0,0 +1,91 @@
+import argparse
+import dataclasses
+import sys
+import os
+import tracemalloc
+from datetime import datetime, timedelta
+
+# Ensure src is in pythonpath
+sys.path.append(os.path.join(os.getcwd(), 'src'))
+
+from crfms.domain.values import Money, Kilometers, FuelLevel, ChargeItem
+from crfms.domain.fleet import Location, VehicleClass, Vehicle
+from crfms.domain.users import Customer
+from crfms.domain.rental import Reservation, RentalAgreement, Invoice
+
+
+def unslotted(cls):
+    """ Rebuilds a dataclass without __slots__, i.e. how the entity looked before. """
+    specs = []
+    for f in dataclasses.fields(cls):
+        spec = dataclasses.field(
+            default=f.default, default_factory=f.default_factory,
+            init=f.init, repr=f.repr, compare=f.compare
+        )
+        specs.append((f.name, f.type, spec))
+    return dataclasses.make_dataclass(
+        cls.__name__, specs, frozen=cls.__dataclass_params__.frozen
+    )
+
+def bytes_per_object(factory, count: int) -> float:
+    """ Average traced bytes of 'count' objects built by factory(i). """
+    keep = [None] * count
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(count):
+        keep[i] = factory(i)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CRFMS entity memory benchmark")
+    parser.add_argument("--count", type=int, default=1_000_000, help="Objects per entity type to report for (default: 1M)")
+    parser.add_argument("--sample", type=int, default=50_000, help="Objects actually traced per type (default: 50k)")
+    args = parser.parse_args()
+    sample = min(args.sample, args.count)
+
+    # Shared references, so only the measured object itself is counted
+    now = datetime(2025, 11, 1, 9, 0)
+    location = Location(name="Bench", address="1 Bench St")
+    vc = VehicleClass(name="Economy", base_rate=Money(50.0))
+    customer = Customer(first_name="B", last_name="Ench", email="bench@mail.com")
+    km = Kilometers(10000)
+    fuel = FuelLevel(1.0)
+    money = Money(75.0)
+    vehicle = Vehicle("BENCH", km, fuel, vc, location)
+    reservation = Reservation(customer, vc, location, location, now, now + timedelta(days=1), money)
+    agreement = RentalAgreement(reservation, vehicle, now, km, fuel, now + timedelta(days=1))
+    plate = "34-AAA"
+    label = "Late Return Fee"
+    amount = 12.5
+
+    cases = [
+        (Money, lambda cls, i: cls(10_000 + i)),  # above the interned range
+        (Kilometers, lambda cls, i: cls(i)),
+        (FuelLevel, lambda cls, i: cls(amount)),
+        (ChargeItem, lambda cls, i: cls(label, money)),
+        (Vehicle, lambda cls, i: cls(plate, km, fuel, vc, location)),
+        (Reservation, lambda cls, i: cls(customer, vc, location, location, now, now, money)),
+        (RentalAgreement, lambda cls, i: cls(reservation, vehicle, now, km, fuel, now)),
+        (Invoice, lambda cls, i: cls(agreement)),
+    ]
+
+    # tracemalloc slows allocation down a lot, so a sample is traced and
+    # the per-object cost is scaled up to --count
+    print(f"Bytes per object (tracemalloc, {sample:,} traced) and MB per {args.count:,} objects:\n")
+    print(f"   {'Entity':<16}{'before':>10}{'after':>10}{'MB before':>12}{'MB after':>10}{'saved':>8}")
+    for cls, build in cases:
+        old_cls = unslotted(cls)
+        before = bytes_per_object(lambda i: build(old_cls, i), sample)
+        after = bytes_per_object(lambda i: build(cls, i), sample)
+        mb_before = before * args.count / 2**20
+        mb_after = after * args.count / 2**20
+        print(
+            f"   {cls.__name__:<16}{before:>10.1f}{after:>10.1f}"
+            f"{mb_before:>12.1f}{mb_after:>10.1f}{1 - after / before:>8.0%}"
+        )
+
+if __name__ == "__main__":
+    main()
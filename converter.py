@@ -5,49 +5,42 @@ import os
 # Ensure src is in pythonpath so we can import our modules
 sys.path.append(os.path.join(os.getcwd(), 'src'))
 
-from crfms.persistence.json_io import load_from_json, save_to_json
-from crfms.persistence.proto_io import load_from_proto, save_to_proto
+from crfms.persistence.convert import convert
+from crfms.persistence.parallel import load_snapshot
+from crfms.persistence.sectioned import MAGIC, write_sectioned
+from crfms.persistence.snapshot import write_snapshot
 
 def main():
     parser = argparse.ArgumentParser(description="CRFMS Format Converter")
-    
-    # Create a group so user must pick one direction
-    group = parser.add_mutually_exclusive_group(required=True)
-    group.add_argument("--to-proto", action="store_true", help="Convert JSON input to Protocol Buffers output")
-    group.add_argument("--to-json", action="store_true", help="Convert Protocol Buffers input to JSON output")
-    
-    parser.add_argument("input_file", help="Path to input file")
-    parser.add_argument("output_file", help="Path to output file")
+    parser.add_argument("input_file", help="Path to a line snapshot or sectioned container")
+    parser.add_argument("output_file", help="Path to output file (the other format)")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Decode the input in this many processes and re-encode the entities (default: 1, copy records as they are)"
+    )
     
     args = parser.parse_args()
     
-    if args.to_proto:
-        print(f"Converting JSON ({args.input_file}) -> Proto ({args.output_file})...")
-        try:
-            # 1. Load from JSON
-            db = load_from_json(args.input_file)
-            # 2. Save to Proto
-            save_to_proto(db, args.output_file)
-            print("Conversion successful.")
-        except Exception as e:
-            print(f"Error converting to Proto: {e}")
-            import traceback
-            traceback.print_exc()
-            sys.exit(1)
-            
-    elif args.to_json:
-        print(f"Converting Proto ({args.input_file}) -> JSON ({args.output_file})...")
-        try:
-            # 1. Load from Proto
-            db = load_from_proto(args.input_file)
-            # 2. Save to JSON
-            save_to_json(db, args.output_file)
-            print("Conversion successful.")
-        except Exception as e:
-            print(f"Error converting to JSON: {e}")
-            import traceback
-            traceback.print_exc()
-            sys.exit(1)
+    with open(args.input_file, "rb") as f:
+        is_sectioned = f.read(len(MAGIC)) == MAGIC
+    target = "lines" if is_sectioned else "sectioned"
+    
+    print(f"Converting {args.input_file} -> {target} ({args.output_file})...")
+    try:
+        if args.workers > 1:
+            db = load_snapshot(args.input_file, args.workers)
+            if is_sectioned:
+                write_snapshot(db, args.output_file)
+            else:
+                write_sectioned(db, args.output_file)
+        else:
+            convert(args.input_file, args.output_file)
+        print("Conversion successful.")
+    except Exception as e:
+        print(f"Error converting to {target}: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
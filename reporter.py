@@ -6,24 +6,34 @@ from collections import defaultdict
 # Ensure src is in pythonpath
 sys.path.append(os.path.join(os.getcwd(), 'src'))
 
-from crfms.persistence.json_io import load_from_json
-from crfms.persistence.proto_io import load_from_proto
+from crfms.persistence.parallel import load_snapshot
+from crfms.persistence.sectioned import MAGIC, SectionedSnapshot
 from crfms.domain.rental import InvoiceStatus
+from crfms.domain.values import Money
+
+# The only sections the report reads; other entities are decoded on demand
+REPORTED = ("vehicles", "rental_agreements", "invoices")
+
+def _load(path, workers):
+    """ Reads only the reported sections of a sectioned container; anything else is loaded whole. """
+    with open(path, "rb") as f:
+        is_sectioned = f.read(len(MAGIC)) == MAGIC
+    if is_sectioned and workers <= 1:
+        with SectionedSnapshot(path) as snap:
+            return snap.load(REPORTED)
+    return load_snapshot(path, workers)
 
 def main():
     parser = argparse.ArgumentParser(description="CRFMS Reporting Tool")
-    parser.add_argument("input_file", help="Path to snapshot file")
-    parser.add_argument("--format", choices=["json", "proto"], default="json", help="Format of input file (default: json)")
+    parser.add_argument("input_file", help="Path to a line snapshot or sectioned container")
+    parser.add_argument("--workers", type=int, default=1, help="Processes decoding the snapshot (default: 1)")
     
     args = parser.parse_args()
     
-    print(f"Loading data from {args.input_file} ({args.format})...")
+    print(f"Loading data from {args.input_file} ({args.workers} workers)...")
     
     try:
-        if args.format == "json":
-            db = load_from_json(args.input_file)
-        else:
-            db = load_from_proto(args.input_file)
+        db = _load(args.input_file, args.workers)
     except Exception as e:
         print(f"Error loading file: {e}")
         sys.exit(1)
@@ -56,13 +66,10 @@ def main():
     print(f"   - Completed Rentals: {completed_count}")
     
     # Metric 3: Total Revenue (from Paid Invoices)
-    total_revenue = 0.0
-    pending_revenue = 0.0
-    for inv in db.invoices.values():
-        if inv.status == InvoiceStatus.PAID:
-            total_revenue += inv.total_amount.value
-        elif inv.status == InvoiceStatus.PENDING:
-            pending_revenue += inv.total_amount.value
+    # Sums raw cents, so the totals are exact
+    invoices = db.invoices.values()
+    total_revenue = Money.sum(inv.total_amount for inv in invoices if inv.status == InvoiceStatus.PAID).value
+    pending_revenue = Money.sum(inv.total_amount for inv in invoices if inv.status == InvoiceStatus.PENDING).value
             
     print(f"\n3. Financial Overview:")
     print(f"   - Total Revenue (Paid):    ${total_revenue:,.2f}")
@@ -70,13 +77,16 @@ def main():
 
     # Metric 4: Top Customers
     print("\n4. Top Customers by Spending:")
-    cust_spending = defaultdict(float)
+    cust_spending = defaultdict(int)
     for inv in db.invoices.values():
         if inv.status == InvoiceStatus.PAID:
             c = inv.rental_agreement.reservation.customer
-            cust_spending[c.email] += inv.total_amount.value
+            cust_spending[c.email] += inv.total_amount.cents
             
-    sorted_cust = sorted(cust_spending.items(), key=lambda x: x[1], reverse=True)[:3]
+    sorted_cust = [
+        (email, cents / 100)
+        for email, cents in sorted(cust_spending.items(), key=lambda x: x[1], reverse=True)[:3]
+    ]
     
     if not sorted_cust:
         print(" (No spending data) ")
@@ -1,5 +1,8 @@
+import asyncio
+import time
 import uuid
-from ..domain.ports import Payment
+from typing import Dict, Optional
+from ..domain.ports import Payment, AsyncPayment
 from ..domain.users import Customer
 from ..domain.values import Money
 
@@ -7,16 +10,17 @@ class FakePaymentError(Exception):
     """Exeption to simulate a failed payment."""
     pass
 
-class FakePaymentAdapter(Payment):
-    """ A fake implementation of the Payment port to test. """
-    
-    def __init__(self):
+class _FakeProcessor:
+    """ The simulated processor behind both fake adapters. 'latency' is in seconds per call. """
+
+    def __init__(self, latency: float = 0.0):
         self.should_succeed = True
+        self.latency = latency
 
-    def authorize_deposit(self, customer: Customer, amount: Money) -> str:
+    def _authorize(self, customer: Customer, amount: Money) -> str:
         print(f"--- PAYMENT (DEPOSIT) ---")
         print(f"Authorizing ${amount.value:.2f} for {customer.email}...")
-        
+
         if self.should_succeed:
             tx_id = f"fake_auth_{uuid.uuid4().hex[:10]}"
             print(f"Success! TX ID: {tx_id}")
@@ -25,15 +29,66 @@ class FakePaymentAdapter(Payment):
             print(f"Failure! (Simulated)")
             raise FakePaymentError("Simulated payment authorization failure")
 
-    def finalize_payment(self, customer: Customer, amount: Money) -> str:
-        """  'finalize_payment' method for succesfull paynemt."""
+    def _charge(self, customer: Customer, amount: Money) -> str:
         print(f"--- PAYMENT (FINALIZE) ---")
         print(f"Charging ${amount.value:.2f} to {customer.email}...")
-        
+
         if self.should_succeed:
             tx_id = f"fake_charge_{uuid.uuid4().hex[:10]}"
             print(f"Success! TX ID: {tx_id}")
             return tx_id
         else:
             print(f"Failure! (Simulated)")
-            raise FakePaymentError("Simulated payment finalization failure")
\ No newline at end of file
+            raise FakePaymentError("Simulated payment finalization failure")
+
+class FakePaymentAdapter(_FakeProcessor, Payment):
+    """ A fake implementation of the Payment port to test. """
+
+    def authorize_deposit(self, customer: Customer, amount: Money) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._authorize(customer, amount)
+
+    def finalize_payment(self, customer: Customer, amount: Money) -> str:
+        """  'finalize_payment' method for succesfull paynemt."""
+        if self.latency:
+            time.sleep(self.latency)
+        return self._charge(customer, amount)
+
+class FakeAsyncPaymentAdapter(_FakeProcessor, AsyncPayment):
+    """ A fake implementation of the AsyncPayment port; waits 'latency' without blocking. """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency)
+        self.charges: Dict[str, str] = {}  # idempotency key -> transaction ID
+        self.authorizations: Dict[str, str] = {}  # idempotency key -> transaction ID
+
+    async def authorize_deposit(
+        self,
+        customer: Customer,
+        amount: Money,
+        idempotency_key: Optional[str] = None
+    ) -> str:
+        await asyncio.sleep(self.latency)
+        if idempotency_key in self.authorizations:
+            return self.authorizations[idempotency_key]
+
+        tx_id = self._authorize(customer, amount)
+        if idempotency_key is not None:
+            self.authorizations[idempotency_key] = tx_id
+        return tx_id
+
+    async def finalize_payment(
+        self,
+        customer: Customer,
+        amount: Money,
+        idempotency_key: Optional[str] = None
+    ) -> str:
+        await asyncio.sleep(self.latency)
+        if idempotency_key in self.charges:
+            return self.charges[idempotency_key]
+
+        tx_id = self._charge(customer, amount)
+        if idempotency_key is not None:
+            self.charges[idempotency_key] = tx_id
+        return tx_id
@@ -6,6 +6,7 @@ from .values import Kilometers, FuelLevel, Money
 from typing import List, Optional
 from math import ceil
 from .values import Clock
+from .observable import Observable
 
 # Enum
 
@@ -18,39 +19,55 @@ class VehicleState(Enum):
     CLEANING = auto()
 
 
+# A plan falls due this many km before its odometer threshold
+MAINTENANCE_MARGIN_KM = 500
+
+
 # Entities
 
-@dataclass
+@dataclass(slots=True)
 class Location:
     """ Rental branch entity. """
     name: str
     address: str
     id: UUID = field(default_factory=uuid4)
 
-@dataclass
-class VehicleClass:
+@dataclass(slots=True)
+class VehicleClass(Observable):
     """ Vehicle class entity. """
+    _watched = frozenset({"name", "base_rate"})
+
+    _watchers: Optional[list] = field(default=None, init=False, repr=False, compare=False)
     name: str
     base_rate: Money
     id: UUID = field(default_factory=uuid4)
 
-@dataclass
-class AddOn:
+@dataclass(slots=True)
+class AddOn(Observable):
     """ Add-on entity."""
+    _watched = frozenset({"name", "daily_rate"})
+
+    _watchers: Optional[list] = field(default=None, init=False, repr=False, compare=False)
     name: str
     daily_rate: Money
     id: UUID = field(default_factory=uuid4)
 
-@dataclass
-class InsuranceTier:
+@dataclass(slots=True)
+class InsuranceTier(Observable):
     """ Insurance tier entity. """
+    _watched = frozenset({"name", "daily_rate"})
+
+    _watchers: Optional[list] = field(default=None, init=False, repr=False, compare=False)
     name: str
     daily_rate: Money
     id: UUID = field(default_factory=uuid4)
 
-@dataclass
-class Vehicle:
+@dataclass(slots=True)
+class Vehicle(Observable):
     """ Concrete vehicle. """
+    _watched = frozenset({"state", "location", "vehicle_class", "odometer", "fuel_level"})
+
+    _watchers: Optional[list] = field(default=None, init=False, repr=False, compare=False)
     license_plate: str
     odometer: Kilometers
     fuel_level: FuelLevel
@@ -62,8 +79,12 @@ class Vehicle:
 
     def is_maintenance_due(self, clock: Clock) -> bool:
         """ Checks if any maintenance record for this vehicle is due."""
+        if not self.maintenance_records:
+            return False
+
+        now = clock.now()
         for record in self.maintenance_records:
-            if record.is_due(self, clock):
+            if record.is_due(self, clock, now):
                 return True
         return False
         
@@ -77,9 +98,14 @@ class Vehicle:
             
         return True
 
-@dataclass
-class MaintenanceRecord:
+@dataclass(slots=True)
+class MaintenanceRecord(Observable):
     """Maintenance record entity."""
+    _watched = frozenset({
+        "odometer_threshold", "time_threshold", "last_service_date", "last_service_odometer"
+    })
+
+    _watchers: Optional[list] = field(default=None, init=False, repr=False, compare=False)
     vehicle: Vehicle
     service_type: str 
     id: UUID = field(default_factory=uuid4)
@@ -88,23 +114,28 @@ class MaintenanceRecord:
     last_service_date: datetime | None = None
     last_service_odometer: Kilometers | None = None
 
-    def is_due(self, vehicle: Vehicle, clock: Clock) -> bool:
-        """Checks if this maintenance is due for the given vehicle."""
-        current_time = clock.now()
-        
+    @property
+    def due_odometer(self) -> Optional[int]:
+        """ Odometer reading at which this plan falls due (MAINTENANCE_MARGIN_KM early). """
         if self.odometer_threshold and self.last_service_odometer:
+            return self.last_service_odometer.value + self.odometer_threshold.value - MAINTENANCE_MARGIN_KM
+        return None
 
-            km_since_service = vehicle.odometer.value - self.last_service_odometer.value
-            km_until_due = self.odometer_threshold.value - km_since_service
-            
-            if km_until_due <= 500:
-                return True
-                
+    @property
+    def due_time(self) -> Optional[datetime]:
+        """ Time at which this plan falls due. """
         if self.time_threshold and self.last_service_date:
+            return self.last_service_date + self.time_threshold
+        return None
 
-            time_since_service = current_time - self.last_service_date
+    def is_due(self, vehicle: Vehicle, clock: Clock, now: Optional[datetime] = None) -> bool:
+        """Checks if this maintenance is due for the given vehicle."""
+        due_odometer = self.due_odometer
+        if due_odometer is not None and vehicle.odometer.value >= due_odometer:
+            return True
 
-            if time_since_service >= self.time_threshold:
-                return True
-                
-        return False
\ No newline at end of file
+        due_time = self.due_time
+        if due_time is not None and (now or clock.now()) >= due_time:
+            return True
+
+        return False
@@ -0,0 +1,47 @@
+from typing import Callable, ClassVar, FrozenSet, Any
+
+# Watcher signature: (entity, attribute_name, old_value)
+Watcher = Callable[[Any, str, Any], None]
+
+_MISSING = object()
+
+
+class Observable:
+    """
+    Mixin for mutable entities.
+    Tells registered watchers when one of the '_watched' attributes changes,
+    so indexes outside the entity can stay up to date.
+    Entities should declare '_watchers' as their first field, so it is
+    already set while __init__ assigns the others.
+    """
+    __slots__ = ()
+
+    _watched: ClassVar[FrozenSet[str]] = frozenset()
+
+    def __setattr__(self, name: str, value: Any):
+        watchers = getattr(self, "_watchers", None) if name in self._watched else None
+        if not watchers:
+            object.__setattr__(self, name, value)
+            return
+
+        old = getattr(self, name, _MISSING)
+        object.__setattr__(self, name, value)
+        if old is not _MISSING:
+            for watcher in list(watchers):
+                watcher(self, name, old)
+
+    def notify(self, name: str, old: Any = None):
+        """ Tells watchers about an in-place change, e.g. an item appended to a list attribute. """
+        for watcher in list(self._watchers or ()):
+            watcher(self, name, old)
+
+    def watch(self, watcher: Watcher):
+        """ Registers a callback for changes of watched attributes. """
+        if self._watchers is None:
+            self._watchers = []
+        self._watchers.append(watcher)
+
+    def unwatch(self, watcher: Watcher):
+        """ Removes a previously registered callback. """
+        if self._watchers and watcher in self._watchers:
+            self._watchers.remove(watcher)
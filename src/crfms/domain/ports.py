@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Optional, Tuple
 
 # This is to avoid "circular imports". It's really important dor bugfix.
 if TYPE_CHECKING:
@@ -36,4 +36,53 @@ class Payment(ABC):
         Attempts final payment for the full rental amount.
         Returns a 'transaction_id'.
         """
-        pass
\ No newline at end of file
+        pass
+
+class AsyncPayment(ABC):
+    """ Port for a payment processor called without blocking, e.g. over the network. """
+
+    @abstractmethod
+    async def authorize_deposit(
+        self,
+        customer: 'Customer',
+        amount: 'Money',
+        idempotency_key: Optional[str] = None
+    ) -> str:
+        """
+        Authorizes a deposit on a customer's card.
+        Returns a 'transaction_id'; like finalize_payment, repeated calls with
+        the same 'idempotency_key' authorize only once.
+        """
+        pass
+
+    @abstractmethod
+    async def finalize_payment(
+        self,
+        customer: 'Customer',
+        amount: 'Money',
+        idempotency_key: Optional[str] = None
+    ) -> str:
+        """
+        Attempts final payment for the full rental amount.
+        Repeated calls with the same 'idempotency_key' charge only once and
+        return the same 'transaction_id', so a timed-out call can be retried.
+        """
+        pass
+
+# Mutation Log Port
+
+class MutationLog(ABC):
+    """ Port for recording the state changes made by the services. """
+
+    @abstractmethod
+    def record(self, event: str, entity: Any, **details):
+        """
+        Records one mutation, e.g. 'reservation_created' with the new reservation.
+        'details' carries extra values that are not on the entity.
+        """
+        pass
+
+    def record_many(self, records: Iterable[Tuple[str, Any, Dict[str, Any]]]):
+        """ Records several mutations, given as (event, entity, details), in order. """
+        for event, entity, details in records:
+            self.record(event, entity, **details)
@@ -1,10 +1,76 @@
 from abc import ABC, abstractmethod
-from typing import List, TYPE_CHECKING
-from datetime import timedelta
+from dataclasses import dataclass
+from math import ceil
+from time import perf_counter
+from typing import Any, Callable, List, Optional, Sequence, Tuple, TYPE_CHECKING
+from datetime import datetime, timedelta
 from .values import Money, ChargeItem
 
 if TYPE_CHECKING: #to avoid circular imports.
     from .rental import RentalAgreement
+    from .fleet import VehicleClass, AddOn, InsuranceTier, Location
+    from .rates import RateBook
+
+# (vehicle class ID, billable days, sorted add-on IDs, insurance tier ID, rule keys), IDs as
+# ints because tuples of ints hash much faster than tuples of UUIDs
+ChargeKey = Tuple[int, int, Tuple[int, ...], Optional[int], Tuple]
+
+
+# Shared pricing context
+
+@dataclass(slots=True)
+class PricingContext:
+    """
+    Quantities derived from an agreement once, for every rule and penalty to read.
+    Values that need the return are 0 while the car is still out.
+    A quote has no agreement; it only carries what the booking decides.
+    """
+    agreement: Optional['RentalAgreement']
+    vehicle_class: 'VehicleClass'
+    add_ons: Sequence['AddOn']
+    insurance: Optional['InsuranceTier']
+    days: int           # Billable days: started days, at least 1 once returned
+    mileage_days: int   # Days the mileage allowance is granted for
+    hours_late: int     # Started hours past the due time, 0 within the first hour
+    driven_km: int
+    pickup_time: Optional[datetime] = None
+    location: Optional['Location'] = None   # Pickup branch
+
+    @classmethod
+    def of(cls, agreement: 'RentalAgreement') -> 'PricingContext':
+        reservation = agreement.reservation
+        booked = (agreement.vehicle.vehicle_class, reservation.add_ons, reservation.insurance)
+        where = (agreement.pickup_time, reservation.pickup_location)
+        if agreement.return_time is None:
+            return cls(agreement, *booked, 0, 0, 0, 0, *where)
+
+        seconds = (agreement.return_time - agreement.pickup_time).total_seconds()
+        days = ceil(seconds / 86400)
+
+        hours_late = 0
+        if agreement.return_time > agreement.due_time:
+            seconds_late = (agreement.return_time - agreement.due_time).total_seconds()
+            if seconds_late > 3600:
+                hours_late = ceil(seconds_late / 3600)
+
+        driven_km = 0
+        if agreement.end_odometer is not None:
+            driven_km = agreement.end_odometer.value - agreement.start_odometer.value
+
+        return cls(agreement, *booked, max(days, 1), days, hours_late, driven_km, *where)
+
+    @classmethod
+    def for_quote(
+        cls,
+        vehicle_class: 'VehicleClass',
+        days: int,
+        add_ons: Sequence['AddOn'] = (),
+        insurance: Optional['InsuranceTier'] = None,
+        pickup_time: Optional[datetime] = None,
+        location: Optional['Location'] = None
+    ) -> 'PricingContext':
+        """ Context for pricing a prospective booking of 'days' billable days. """
+        return cls(None, vehicle_class, add_ons, insurance, days, days, 0, 0, pickup_time, location)
 
 
 # The Strategy Interface
@@ -17,6 +83,19 @@ class PricingRule(ABC):
         """ Calculates the charges for this rule based on the agreement."""
         pass
 
+    def charges_for(self, context: PricingContext) -> List[ChargeItem]:
+        """ Calculates the charges from a shared context. Rules that don't use it fall back to calculate_charges. """
+        if context.agreement is None:
+            raise ValueError(f"{type(self).__name__} needs a rental agreement and cannot price a quote.")
+        return self.calculate_charges(context.agreement)
+
+    def cache_key(self, context: PricingContext) -> Any:
+        """
+        What this rule's charges depend on beyond the class, days, add-ons and
+        insurance, for caches of computed charges. None: nothing else.
+        """
+        return None
+
 
 # The Main Pricing Policy
 
@@ -27,65 +106,168 @@ class PricingPolicy:
     """
     def __init__(self, rules: List[PricingRule]):
         self._rules = rules
+        self._keyed_rules = [rule for rule in rules if type(rule).cache_key is not PricingRule.cache_key]
+        # Rules that price from the agreement itself may read more than their cache keys say
+        self._context_only = all(type(rule).charges_for is not PricingRule.charges_for for rule in rules)
+
+    def cache_key(self, context: PricingContext) -> Tuple:
+        """ The extra cache key parts of all rules (see PricingRule.cache_key). """
+        return tuple(rule.cache_key(context) for rule in self._keyed_rules)
+
+    def charge_key(self, context: PricingContext) -> Optional[ChargeKey]:
+        """
+        Contexts with equal keys get equal charges, so computed charges can be
+        shared under it. None when a rule prices from the agreement itself.
+        """
+        if not self._context_only:
+            return None
+        insurance = context.insurance
+        return (
+            context.vehicle_class.id.int, context.days, tuple(sorted(add_on.id.int for add_on in context.add_ons)),
+            insurance.id.int if insurance is not None else None, self.cache_key(context)
+        )
     
     def calculate_total(self, agreement: 'RentalAgreement') -> List[ChargeItem]:
         """ Calculates all charges for the rental agreement. """
+        return self.charges_for(PricingContext.of(agreement))
+
+    def charges_for(self, context: PricingContext) -> List[ChargeItem]:
+        """ Calculates all charges from an already derived context. """
         all_charges: List[ChargeItem] = []
         for rule in self._rules:
-            all_charges.extend(rule.calculate_charges(agreement))
+            all_charges.extend(rule.charges_for(context))
             
         return all_charges
 
+    def total_amount(self, agreement: 'RentalAgreement') -> Money:
+        """ Sums the rule charges for the agreement as one exact amount. """
+        return Money.sum(charge.amount for charge in self.calculate_total(agreement))
 
-# Concrete Rules
+    def compile(self, profile: bool = False) -> 'CompiledPricingPolicy':
+        """ Builds the rule list into a fixed evaluation plan, optionally timing each rule. """
+        return CompiledPricingPolicy(self._rules, profile)
 
-def _get_rental_days(agreement: 'RentalAgreement') -> int:
-    """Calculates the duration in days."""
-    if agreement.return_time is None:
-        return 0
-        
-    duration = agreement.return_time - agreement.pickup_time
-    
-    """ Rounds up to the nearest day."""
-    days = (duration.total_seconds() / (24 * 3600))
-    if days <= 0:
-        return 1
-    
-    int_days = int(days)
-    if days > int_days:
-        return int_days + 1
-    return int_days
+
+class CompiledPricingPolicy(PricingPolicy):
+    """
+    A PricingPolicy whose rules are resolved once into a tuple of bound
+    charges_for calls. Every agreement is priced in one pass over that plan
+    from a single PricingContext. With profile=True it also keeps the number
+    of calls and the total time spent in each rule.
+    """
+    def __init__(self, rules: List[PricingRule], profile: bool = False):
+        super().__init__(list(rules))
+        self._plan: Tuple[Callable[[PricingContext], List[ChargeItem]], ...] = tuple(
+            rule.charges_for for rule in self._rules
+        )
+        self.profile = profile
+        self._calls = [0] * len(self._plan)
+        self._seconds = [0.0] * len(self._plan)
+
+    def charges_for(self, context: PricingContext) -> List[ChargeItem]:
+        if not self.profile:
+            return [charge for step in self._plan for charge in step(context)]
+
+        all_charges: List[ChargeItem] = []
+        for index, step in enumerate(self._plan):
+            started = perf_counter()
+            all_charges.extend(step(context))
+            self._seconds[index] += perf_counter() - started
+            self._calls[index] += 1
+        return all_charges
+
+    def rule_timings(self) -> List[Tuple[str, int, float]]:
+        """ (rule class name, calls, total seconds) for each rule, in plan order. """
+        return [
+            (type(rule).__name__, calls, seconds)
+            for rule, calls, seconds in zip(self._rules, self._calls, self._seconds)
+        ]
+
+    def reset_timings(self):
+        self._calls = [0] * len(self._plan)
+        self._seconds = [0.0] * len(self._plan)
+
+
+# Concrete Rules
 
 class BaseDailyRateRule(PricingRule):
     """ Calculates the base charge for the vehicle class's daily rate. """
     def calculate_charges(self, agreement: 'RentalAgreement') -> List[ChargeItem]:
-        days = _get_rental_days(agreement)
+        return self.charges_for(PricingContext.of(agreement))
+
+    def charges_for(self, context: PricingContext) -> List[ChargeItem]:
+        days = context.days
         if days == 0:
             return []
-        base_rate = agreement.vehicle.vehicle_class.base_rate
-        total = base_rate.value * days
+        vehicle_class = context.vehicle_class
+        total = vehicle_class.base_rate * days
         
         return [
             ChargeItem(
-                description=f"Base Rate: {agreement.vehicle.vehicle_class.name}",
-                amount=Money(value=total)
+                description=f"Base Rate: {vehicle_class.name}",
+                amount=total
+            )
+        ]
+
+class SeasonalRateRule(PricingRule):
+    """
+    Base charge from a RateBook: each day is billed at the class's rate in
+    force at the pickup branch when that day starts, falling back to the
+    class's base rate where the book has no rate. Use it instead of
+    BaseDailyRateRule.
+    """
+    def __init__(self, rate_book: 'RateBook'):
+        self.rate_book = rate_book
+
+    def calculate_charges(self, agreement: 'RentalAgreement') -> List[ChargeItem]:
+        return self.charges_for(PricingContext.of(agreement))
+
+    def charges_for(self, context: PricingContext) -> List[ChargeItem]:
+        days = context.days
+        if days == 0:
+            return []
+        vehicle_class = context.vehicle_class
+        location_id = context.location.id if context.location is not None else None
+        table = self.rate_book.table(vehicle_class.id, location_id)
+
+        if table is None or context.pickup_time is None:
+            total = vehicle_class.base_rate * days
+        else:
+            total = table.charge(context.pickup_time, days, vehicle_class.base_rate)
+
+        return [
+            ChargeItem(
+                description=f"Base Rate: {vehicle_class.name}",
+                amount=total
             )
         ]
 
+    def cache_key(self, context: PricingContext) -> Any:
+        location_id = context.location.id if context.location is not None else None
+        table = self.rate_book.table(context.vehicle_class.id, location_id)
+        crossed = None
+        if table is not None and context.pickup_time is not None:
+            crossed = table.crossed(context.pickup_time, context.days)
+        return (self.rate_book.version, location_id.int if location_id is not None else None, crossed)
+
 class PerDayAddOnRule(PricingRule):
     """ Calculates the charge for all selected daily add-ons."""
     def calculate_charges(self, agreement: 'RentalAgreement') -> List[ChargeItem]:
-        days = _get_rental_days(agreement)
-        if days == 0 or not agreement.reservation.add_ons:
+        return self.charges_for(PricingContext.of(agreement))
+
+    def charges_for(self, context: PricingContext) -> List[ChargeItem]:
+        days = context.days
+        add_ons = context.add_ons
+        if days == 0 or not add_ons:
             return []
 
         charges: List[ChargeItem] = []
-        for add_on in agreement.reservation.add_ons:
-            total = add_on.daily_rate.value * days 
+        for add_on in add_ons:
+            total = add_on.daily_rate * days
             charges.append(
                 ChargeItem(
                     description=f"Add-on: {add_on.name}",
-                    amount=Money(value=total)
+                    amount=total
                 )
             )
         return charges
@@ -93,16 +275,19 @@ class PerDayAddOnRule(PricingRule):
 class InsuranceRule(PricingRule):
     """ Calculates the charge for the selected insurance tier. """
     def calculate_charges(self, agreement: 'RentalAgreement') -> List[ChargeItem]:
-        days = _get_rental_days(agreement)
-        insurance = agreement.reservation.insurance
+        return self.charges_for(PricingContext.of(agreement))
+
+    def charges_for(self, context: PricingContext) -> List[ChargeItem]:
+        days = context.days
+        insurance = context.insurance
         
         if days == 0 or insurance is None:
             return []
             
-        total = insurance.daily_rate.value * days
+        total = insurance.daily_rate * days
         return [
             ChargeItem(
                 description=f"Insurance: {insurance.name}",
-                amount=Money(value=total)
+                amount=total
             )
         ]
@@ -0,0 +1,202 @@
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from .values import Money
+
+_DAY = timedelta(days=1)
+_WEEKEND = 5  # datetime.weekday() of Saturday; Saturday and Sunday are weekend days
+
+
+@dataclass(frozen=True, slots=True)
+class RateSegment:
+    """
+    Daily rates from 'start' until the next segment starts.
+    A rate of None means the vehicle class's base rate applies.
+    """
+    start: datetime
+    daily_rate: Optional[Money]
+    weekend_rate: Optional[Money] = None
+
+
+class RateTable:
+    """
+    Daily rates of one vehicle class (optionally at one location) over time.
+    The segments are sorted by start, so the rate at any moment is a bisect
+    away. A table is never changed in place: with_rate returns a new one,
+    which is how RateBook keeps every earlier version.
+    """
+    __slots__ = ("_starts", "_segments")
+
+    def __init__(self, segments: Tuple[RateSegment, ...] = ()):
+        self._segments = segments
+        self._starts = tuple(segment.start for segment in segments)
+
+    def __len__(self) -> int:
+        return len(self._segments)
+
+    @property
+    def segments(self) -> Tuple[RateSegment, ...]:
+        return self._segments
+
+    def segment_at(self, when: datetime) -> Optional[RateSegment]:
+        """ The segment in force at 'when', or None before the first one. O(log n). """
+        index = bisect_right(self._starts, when) - 1
+        return self._segments[index] if index >= 0 else None
+
+    def with_rate(
+        self,
+        start: datetime,
+        end: Optional[datetime],
+        daily_rate: Optional[Money],
+        weekend_rate: Optional[Money] = None
+    ) -> 'RateTable':
+        """ A copy where [start, end) (open-ended when end is None) has the given rates. """
+        if end is not None and end <= start:
+            raise ValueError("A rate period must end after it starts.")
+
+        segments = list(self._segments)
+        if end is not None:
+            # What was in force at 'end' continues after the new period
+            after = self.segment_at(end)
+            restored = RateSegment(end, after.daily_rate, after.weekend_rate) if after else RateSegment(end, None)
+
+        first = bisect_left(self._starts, start)
+        last = len(segments) if end is None else bisect_left(self._starts, end)
+        replaced = [RateSegment(start, daily_rate, weekend_rate)]
+        if end is not None and (last == len(segments) or segments[last].start != end):
+            replaced.append(restored)
+        segments[first:last] = replaced
+        return RateTable(tuple(segments))
+
+    def charge(self, start: datetime, days: int, base_rate: Money) -> Money:
+        """
+        Price of 'days' rental days from 'start', where each day is billed at the
+        rates in force when it starts. Walks the segments the rental touches
+        and counts their days (and weekend days) arithmetically, so the cost
+        is O(log n + segments touched), whatever the number of days.
+        """
+        if days <= 0:
+            return Money(0)
+
+        segments, starts = self._segments, self._starts
+        if not segments:
+            return base_rate * days
+
+        count = len(segments)
+        first_weekday = start.weekday()
+        index = bisect_right(starts, start) - 1
+        day_from = 0
+        if index < 0:
+            # Days before the first segment use the base rate
+            day_from = self._first_day(start, days, starts[0])
+            index = 0
+        cents = base_rate.cents * day_from
+
+        while index < count and day_from < days:
+            segment = segments[index]
+            day_to = self._first_day(start, days, starts[index + 1]) if index + 1 < count else days
+            if day_to > day_from:
+                weekend = _weekend_days(first_weekday, day_from, day_to)
+                daily = segment.daily_rate if segment.daily_rate is not None else base_rate
+                weekend_rate = segment.weekend_rate if segment.weekend_rate is not None else daily
+                cents += daily.cents * (day_to - day_from - weekend) + weekend_rate.cents * weekend
+                day_from = day_to
+            index += 1
+
+        return Money.of_cents(cents)
+
+    def crossed(self, start: datetime, days: int) -> Tuple:
+        """
+        Everything charge() depends on besides the rates: the index of the
+        segment in force on the first day, the first day billed under each
+        later segment the rental reaches, and the first day's weekday if any
+        of those segments has a weekend rate. Rentals with equal results cost
+        the same, so this keys cached charges. O(log n + segments touched).
+        """
+        starts = self._starts
+        index = bisect_right(starts, start) - 1
+        last = bisect_right(starts, start + (days - 1) * _DAY) - 1 if days > 0 else index
+        reached = range(index + 1, last + 1)
+        first_days = tuple(self._first_day(start, days, starts[i]) for i in reached)
+        weekend = any(self._segments[i].weekend_rate is not None for i in range(max(index, 0), last + 1))
+        return (index, first_days, start.weekday() if weekend else None)
+
+    @staticmethod
+    def _first_day(start: datetime, days: int, boundary: datetime) -> int:
+        """ Index of the first rental day that starts at or after 'boundary', within [0, days]. """
+        if boundary <= start:
+            return 0
+        return min(-((start - boundary) // _DAY), days)
+
+
+def _weekend_days(first_weekday: int, day_from: int, day_to: int) -> int:
+    """ How many of the rental days [day_from, day_to) start on a Saturday or Sunday. """
+    def before(count: int) -> int:
+        # Weekend days among the 'count' days that follow a Monday
+        weeks, rest = divmod(count, 7)
+        return weeks * 2 + max(0, rest - _WEEKEND)
+
+    return before(first_weekday + day_to) - before(first_weekday + day_from)
+
+
+class RateBook:
+    """
+    Versioned rate tables per (vehicle class, location).
+    A table for location None applies to the class at every location
+    without its own table. Every change makes a new version of the book;
+    tables can be read as they were at any earlier version.
+    """
+    def __init__(self):
+        self._version = 0
+        self._history: Dict[Tuple[UUID, Optional[UUID]], Tuple[List[int], List[RateTable]]] = {}
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def set_rate(
+        self,
+        class_id: UUID,
+        location_id: Optional[UUID],
+        start: datetime,
+        end: Optional[datetime],
+        daily_rate: Optional[Money],
+        weekend_rate: Optional[Money] = None
+    ) -> int:
+        """ Sets the rates of a class (at a location, or everywhere) for [start, end). Returns the new version. """
+        key = (class_id, location_id)
+        current = self.table(class_id, location_id, exact=True) or RateTable()
+        updated = current.with_rate(start, end, daily_rate, weekend_rate)
+
+        self._version += 1
+        versions, tables = self._history.setdefault(key, ([], []))
+        versions.append(self._version)
+        tables.append(updated)
+        return self._version
+
+    def table(
+        self,
+        class_id: UUID,
+        location_id: Optional[UUID] = None,
+        version: Optional[int] = None,
+        exact: bool = False
+    ) -> Optional[RateTable]:
+        """
+        The table for a class at a location as of 'version' (default: latest).
+        Falls back to the class-wide table unless 'exact' is set.
+        """
+        found = self._table_at((class_id, location_id), version)
+        if found is None and location_id is not None and not exact:
+            found = self._table_at((class_id, None), version)
+        return found
+
+    def _table_at(self, key: Tuple[UUID, Optional[UUID]], version: Optional[int]) -> Optional[RateTable]:
+        history = self._history.get(key)
+        if history is None:
+            return None
+        versions, tables = history
+        index = len(tables) - 1 if version is None else bisect_right(versions, version) - 1
+        return tables[index] if index >= 0 else None
@@ -1,14 +1,14 @@
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import Enum, auto
 from uuid import UUID, uuid4
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from .users import Customer
 from .fleet import Vehicle, VehicleClass, Location, AddOn, InsuranceTier
 from .values import Money, ChargeItem, Kilometers, FuelLevel
-from math import ceil
 from .values import Clock, Kilometers
-from .pricing import PricingPolicy
+from .pricing import PricingPolicy, PricingContext, ChargeKey
+from .observable import Observable
 
 
 # Enums
@@ -18,6 +18,10 @@ class ReservationStatus(Enum):
     CONFIRMED = auto()
     CANCELLED = auto()
     COMPLETED = auto()
+    NO_SHOW = auto()
+
+# A reservation not picked up this long after its pickup time no longer holds a car
+NO_SHOW_GRACE = timedelta(hours=2)
 
 class InvoiceStatus(Enum):
     PENDING = auto()
@@ -28,11 +32,21 @@ class BillingPaymentStatus(Enum):
     SUCCESS = auto()
     FAILURE = auto()
 
+# Descriptions of the penalty charge lines on invoices
+LATE_FEE = "Late Return Fee"
+MILEAGE_FEE = "Mileage Overage Fee"
+FUEL_CHARGE = "Fuel Refill Charge"
+
 # Rental Entities
 
-@dataclass
-class Reservation:
+@dataclass(slots=True)
+class Reservation(Observable):
     """ customer's reservation entity. """
+    _watched = frozenset({
+        "status", "pickup_time", "return_time", "vehicle_class", "pickup_location", "return_location"
+    })
+
+    _watchers: Optional[list] = field(default=None, init=False, repr=False, compare=False)
     customer: Customer
     vehicle_class: VehicleClass
     pickup_location: Location
@@ -45,9 +59,12 @@ class Reservation:
     insurance: Optional[InsuranceTier] = None
     status: ReservationStatus = ReservationStatus.PENDING
 
-@dataclass
-class RentalAgreement:
+@dataclass(slots=True)
+class RentalAgreement(Observable):
     """ Active rental entity. """
+    _watched = frozenset({"reservation", "due_time", "return_time", "end_odometer", "end_fuel_level"})
+
+    _watchers: Optional[list] = field(default=None, init=False, repr=False, compare=False)
     reservation: Reservation
     vehicle: Vehicle
 
@@ -74,57 +91,87 @@ class RentalAgreement:
         late_fee_per_hour: Money
     ) -> List[ChargeItem]:
         """ Calculates all rental charges AND penalties """
-        if not all([self.return_time, self.end_odometer, self.end_fuel_level]):
+        final = FinalCharges(
+            pricing_policy, daily_mileage_allowance, mileage_overage_fee_per_km, fuel_refill_charge, late_fee_per_hour
+        )
+        return final.price(self)[0]
+
 
+class FinalCharges:
+    """
+    Prices returned agreements with one pricing policy and one set of penalty
+    fees. Kept for a batch of returns, it builds the fee lines once and
+    prices the rules once per charge key (see PricingPolicy.charge_key),
+    so agreements booked alike share their rule charges. It does not follow
+    rate changes, so build a new one for every batch.
+    """
+    def __init__(
+        self,
+        pricing_policy: PricingPolicy,
+        daily_mileage_allowance: Kilometers,
+        mileage_overage_fee_per_km: Money,
+        fuel_refill_charge: Money,
+        late_fee_per_hour: Money
+    ):
+        self.pricing_policy = pricing_policy
+        self.daily_mileage_allowance = daily_mileage_allowance
+        self.mileage_overage_fee_per_km = mileage_overage_fee_per_km
+        self.late_fee_per_hour = late_fee_per_hour
+        self._fuel_charge = ChargeItem(FUEL_CHARGE, fuel_refill_charge)
+        self._late_fees: Dict[int, ChargeItem] = {}
+        self._rule_charges: Dict[ChargeKey, Tuple[List[ChargeItem], Money]] = {}
+
+    def price(self, agreement: RentalAgreement) -> Tuple[List[ChargeItem], Money]:
+        """ All rule charges and penalties of a returned agreement, and their total. """
+        if agreement.return_time is None or agreement.end_odometer is None or agreement.end_fuel_level is None:
             raise ValueError("Cannot calculate charges before vehicle is returned.")
-            
-        all_charges: List[ChargeItem] = []
-        all_charges.extend(pricing_policy.calculate_total(self))
-        
-        # Late Fee
-        if self.return_time > self.due_time:
 
-            time_late = self.return_time - self.due_time
+        context = PricingContext.of(agreement)
+        key = self.pricing_policy.charge_key(context)
+        shared = self._rule_charges.get(key) if key is not None else None
+        if shared is None:
+            charges = self.pricing_policy.charges_for(context)
+            shared = (charges, Money.sum(charge.amount for charge in charges))
+            if key is not None:
+                self._rule_charges[key] = shared
+        charges, total = list(shared[0]), shared[1]
 
-            if time_late.total_seconds() > 3600:
-        
-                hours_late = ceil(time_late.total_seconds() / 3600)
-                fee = late_fee_per_hour.value * hours_late
-                all_charges.append(
-                    ChargeItem("Late Return Fee", Money(value=fee))
+        # Late Fee
+        if context.hours_late:
+            fee = self._late_fees.get(context.hours_late)
+            if fee is None:
+                fee = self._late_fees[context.hours_late] = ChargeItem(
+                    LATE_FEE, self.late_fee_per_hour * context.hours_late
                 )
-                
+            charges.append(fee)
+            total += fee.amount
+
         # Mileage Overage
-        rental_days = ceil((self.return_time - self.pickup_time).total_seconds() / 86400)
-        allowance_km = daily_mileage_allowance.value * rental_days
-        driven_km = self.end_odometer.value - self.start_odometer.value
-        
-        if driven_km > allowance_km:
-
-            overage_km = driven_km - allowance_km
-            fee = mileage_overage_fee_per_km.value * overage_km
-            all_charges.append(
-                ChargeItem("Mileage Overage Fee", Money(value=fee))
-            )
-            
+        allowance_km = self.daily_mileage_allowance.value * context.mileage_days
+        if context.driven_km > allowance_km:
+            fee = ChargeItem(MILEAGE_FEE, self.mileage_overage_fee_per_km * (context.driven_km - allowance_km))
+            charges.append(fee)
+            total += fee.amount
+
         # Fuel Refill
-        if self.end_fuel_level.value < self.start_fuel_level.value:
+        if agreement.end_fuel_level.value < agreement.start_fuel_level.value:
+            charges.append(self._fuel_charge)
+            total += self._fuel_charge.amount
 
-            all_charges.append(
-                ChargeItem("Fuel Refill Charge", fuel_refill_charge)
-            )
-            
-        return all_charges
+        return charges, total
 
 
 # Billing Entities
 
-@dataclass
-class Invoice:
+@dataclass(slots=True)
+class Invoice(Observable):
     """
     Entity representing a bill.
     Generates a list of ChargeItems.
     """
+    _watched = frozenset({"status", "charge_items", "total_amount"})
+
+    _watchers: Optional[list] = field(default=None, init=False, repr=False, compare=False)
     rental_agreement: RentalAgreement
     id: UUID = field(default_factory=uuid4)
     status: InvoiceStatus = InvoiceStatus.PENDING
@@ -133,10 +180,9 @@ class Invoice:
 
     def calculate_total(self):
         """ Sums all chargessto get the final total. """
-        total_val = sum(item.amount.value for item in self.charge_items)
-        self.total_amount = Money(value=total_val)
+        self.total_amount = Money.sum(item.amount for item in self.charge_items)
 
-@dataclass
+@dataclass(slots=True)
 class BillingPayment:
     """ Paying invoice entity. """
     invoice: Invoice
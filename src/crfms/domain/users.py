@@ -4,7 +4,7 @@ from .fleet import Location
 
 # Entities
 
-@dataclass
+@dataclass(slots=True)
 class Customer:
     """ Customer entity."""
     first_name: str
@@ -12,7 +12,7 @@ class Customer:
     email: str
     id: UUID = field(default_factory=uuid4)
 
-@dataclass
+@dataclass(slots=True)
 class BranchAgent:
     """ Branch agent entity. """
     first_name: str
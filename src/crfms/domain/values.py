@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
 from datetime import datetime
 from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Tuple
 from uuid import UUID, uuid4
 
 
@@ -33,7 +34,7 @@ class FixedClock(Clock):
 
 # Measurement Value Objects
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Kilometers:
     """
     Value Object for distance.
@@ -45,7 +46,7 @@ class Kilometers:
 
         return Kilometers(self.value + other.value)
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class FuelLevel:
     """
     Value Object for fuel level.
@@ -53,27 +54,148 @@ class FuelLevel:
     """
     value: float
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True, init=False)
 class Money:
-    """A Value Object (float) representing money."""
-    value: float
-    
+    """
+    A Value Object representing money as an exact number of cents.
+    Money(50.0) and Money(value=50.0) still work; common amounts are interned,
+    so building the same small amount again returns the same object.
+    """
+    cents: int
+
+    def __new__(cls, value: float = 0.0) -> 'Money':
+
+        return cls.of_cents(round(value * 100))
+
+    @classmethod
+    def of_cents(cls, cents: int) -> 'Money':
+        """ Returns the Money for an integer number of cents, interned if it is common. """
+        money = _INTERNED.get(cents)
+        if money is None:
+            money = object.__new__(cls)
+            object.__setattr__(money, "cents", cents)
+            if 0 <= cents < _INTERN_LIMIT:
+                _INTERNED[cents] = money
+        return money
+
+    @classmethod
+    def sum(cls, amounts: Iterable['Money']) -> 'Money':
+        """ Adds many amounts as raw ints, without building intermediate Money objects. """
+        return cls.of_cents(sum(amount.cents for amount in amounts))
+
+    @property
+    def value(self) -> float:
+        """ The amount in currency units, for display and older callers. """
+        return self.cents / 100
+
+    def __reduce__(self):
+        # Rebuild through of_cents, so unpickling never touches an interned object
+        return (Money.of_cents, (self.cents,))
+
     def __add__(self, other: 'Money') -> 'Money':
 
         if not isinstance(other, Money):
             return NotImplemented
             
-        return Money(self.value + other.value)
+        return Money.of_cents(self.cents + other.cents)
 
     def __sub__(self, other: 'Money') -> 'Money':
         
         if not isinstance(other, Money):
             return NotImplemented
             
-        return Money(self.value - other.value)
+        return Money.of_cents(self.cents - other.cents)
+
+    def __mul__(self, factor: int) -> 'Money':
+        """ Multiplies by a quantity (days, hours, km). Whole numbers stay exact. """
+        if not isinstance(factor, (int, float)):
+            return NotImplemented
+
+        return Money.of_cents(round(self.cents * factor))
+
+    __rmul__ = __mul__
+
+# Amounts from 0 up to $1000.00 are interned on first use
+_INTERN_LIMIT = 100_000
+_INTERNED: Dict[int, Money] = {}
     
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ChargeItem:
     """Value Object for one line item on an invoice. """
     description: str
-    amount: Money
\ No newline at end of file
+    amount: Money
+
+
+# Caches
+
+class CacheStats:
+    """ Hit/miss counters for a cache, plus the further counters named in COUNTERS. """
+    COUNTERS: Tuple[str, ...] = ()
+
+    def reset_stats(self):
+        self.hits = self.misses = 0
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """ The counters, the hit rate and the number of cached entries. """
+        stats = {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate}
+        stats.update((name, getattr(self, name)) for name in self.COUNTERS)
+        stats["size"] = len(self)
+        return stats
+
+class ValueCache(CacheStats):
+    """ Flyweights for the frozen value objects and charge descriptions, used for one load. """
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        self.reset_stats()
+        self._values: Dict[Tuple[Any, ...], Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def _get(self, key: Tuple[Any, ...], build) -> Any:
+        value, cached = self._intern(key, build)
+        if cached:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return value
+
+    def _intern(self, key: Tuple[Any, ...], build) -> Tuple[Any, bool]:
+        """ The value for 'key', built and kept on a miss, and whether it was cached. Counts nothing. """
+        value = self._values.get(key)
+        if value is not None:
+            return value, True
+
+        value = build()
+        if len(self._values) < self.max_size:
+            self._values[key] = value
+        return value, False
+
+    def kilometers(self, value: int) -> Kilometers:
+        return self._get((Kilometers, value), lambda: Kilometers(value))
+
+    def fuel_level(self, value: float) -> FuelLevel:
+        return self._get((FuelLevel, value), lambda: FuelLevel(value))
+
+    def money(self, value: float) -> Money:
+        return self._get((Money, value), lambda: Money(value))
+
+    def description(self, text: str) -> str:
+        return self._get((str, text), lambda: text)
+
+    def charge_item(self, description: str, amount: Money) -> ChargeItem:
+        return self._get(
+            (ChargeItem, description, amount.cents),
+            lambda: ChargeItem(self._intern((str, description), lambda: description)[0], amount)
+        )
+
+    def clear(self):
+        self._values.clear()
+        self.reset_stats()
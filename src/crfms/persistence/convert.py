@@ -0,0 +1,47 @@
+import json
+import os
+from typing import Iterator, Tuple
+from uuid import UUID
+
+from .snapshot import iter_snapshot
+from .sectioned import MAGIC, SECTIONS, SectionedSnapshot, write_sectioned_stream
+
+# Streaming conversion between line snapshots and sectioned containers.
+# Records are already flat and reference other entities by ID, so they are
+# copied record by record without building any domain objects.
+
+
+def lines_to_sectioned(src: str, dst: str):
+    """ Converts a line snapshot into a sectioned container, one record at a time. """
+    def items() -> Iterator[Tuple[str, bytes, bytes]]:
+        for collection, record in iter_snapshot(src):
+            raw_id = UUID(hex=record["id"]).bytes
+            yield collection, raw_id, json.dumps(record, separators=(",", ":")).encode()
+
+    write_sectioned_stream(dst, items())
+
+def sectioned_to_lines(src: str, dst: str, seq: int = 0):
+    """
+    Converts a sectioned container into a line snapshot.
+    Payloads are copied as they are, without being decoded.
+    """
+    tmp_path = dst + ".tmp"
+    with SectionedSnapshot(src) as snap, open(tmp_path, "wb") as f:
+        f.write(json.dumps({"seq": seq}).encode() + b"\n")
+        for name in SECTIONS:
+            prefix = f'{{"c":"{name}","r":'.encode()
+            for payload in snap.payloads(name):
+                f.write(prefix)
+                f.write(payload)
+                f.write(b"}\n")
+    os.replace(tmp_path, dst)
+
+def convert(src: str, dst: str):
+    """ Converts in whichever direction the source file calls for. """
+    with open(src, "rb") as f:
+        is_sectioned = f.read(len(MAGIC)) == MAGIC
+
+    if is_sectioned:
+        sectioned_to_lines(src, dst)
+    else:
+        lines_to_sectioned(src, dst)
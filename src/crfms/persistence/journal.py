@@ -0,0 +1,278 @@
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+from uuid import UUID
+
+from ..domain.ports import MutationLog
+from ..domain.fleet import VehicleState
+from ..domain.rental import ReservationStatus, InvoiceStatus
+from ..domain.values import ValueCache
+from ..services.database import Database
+from .snapshot import read_snapshot, write_snapshot, snapshot_sequence, make_resolver
+from .records import (
+    encode_reservation, decode_reservation, encode_agreement, decode_agreement,
+    encode_invoice, decode_invoice, encode_payment, decode_payment,
+    encode_maintenance_record, decode_maintenance_record
+)
+
+SNAPSHOT_FILE = "snapshot.jsonl"
+_SEGMENT_PREFIX = "journal-"
+_SEGMENT_SUFFIX = ".log"
+
+
+# Journal records. Each event has an encoder (service side) and an applier (replay side).
+
+def _encode_event(event: str, entity: Any, details: Dict[str, Any]) -> Dict[str, Any]:
+    if event == "reservation_created":
+        return {"r": encode_reservation(entity)}
+    if event in ("reservation_cancelled", "reservation_expired"):
+        return {"id": entity.id.hex}
+    if event == "vehicle_picked_up":
+        return {"a": encode_agreement(entity), "token": details["token"]}
+    if event == "vehicle_returned":
+        return {"a": encode_agreement(entity.rental_agreement), "i": encode_invoice(entity)}
+    if event == "rental_extended":
+        return {"a": encode_agreement(entity)}
+    if event == "payment_recorded":
+        return {"p": encode_payment(entity), "s": entity.invoice.status.name}
+    if event in ("maintenance_registered", "service_completed"):
+        return {"v": entity.vehicle.id.hex, "m": encode_maintenance_record(entity)}
+    raise ValueError(f"Unknown journal event: {event}")
+
+def apply_record(db: Database, record: Dict[str, Any], values: ValueCache):
+    """ Re-applies one journal record to the database, sharing value objects through 'values'. """
+    event = record["e"]
+    resolve = make_resolver(db)
+
+    if event == "reservation_created":
+        reservation = decode_reservation(record["r"], resolve, values)
+        db.reservations[reservation.id] = reservation
+
+    elif event == "reservation_cancelled":
+        db.reservations[UUID(hex=record["id"])].status = ReservationStatus.CANCELLED
+
+    elif event == "reservation_expired":
+        db.reservations[UUID(hex=record["id"])].status = ReservationStatus.NO_SHOW
+
+    elif event == "vehicle_picked_up":
+        agreement = decode_agreement(record["a"], resolve, values)
+        agreement.vehicle.state = VehicleState.RENTED
+        db.rental_agreements[agreement.id] = agreement
+        db.agreements_by_token[record["token"]] = agreement
+
+    elif event == "vehicle_returned":
+        returned = decode_agreement(record["a"], resolve, values)
+        agreement = db.rental_agreements[returned.id]
+        agreement.return_time = returned.return_time
+        agreement.end_odometer = returned.end_odometer
+        agreement.end_fuel_level = returned.end_fuel_level
+
+        invoice = decode_invoice(record["i"], resolve, values)
+        agreement.vehicle.state = VehicleState.CLEANING
+        db.invoices[invoice.id] = invoice
+        db.invoices_by_agreement[agreement.id] = invoice
+
+    elif event == "rental_extended":
+        extended = decode_agreement(record["a"], resolve, values)
+        db.rental_agreements[extended.id].due_time = extended.due_time
+
+    elif event == "payment_recorded":
+        payment = decode_payment(record["p"], resolve, values)
+        payment.invoice.status = InvoiceStatus[record["s"]]
+        db.payments[payment.id] = payment
+
+    elif event == "maintenance_registered":
+        vehicle = db.vehicles[UUID(hex=record["v"])]
+        vehicle.maintenance_records.append(decode_maintenance_record(record["m"], vehicle, values))
+        vehicle.notify("maintenance_records")
+
+    elif event == "service_completed":
+        vehicle = db.vehicles[UUID(hex=record["v"])]
+        completed = decode_maintenance_record(record["m"], vehicle, values)
+        for plan in vehicle.maintenance_records:
+            if plan.id == completed.id:
+                plan.last_service_date = completed.last_service_date
+                plan.last_service_odometer = completed.last_service_odometer
+        vehicle.notify("maintenance_records")
+
+    else:
+        raise ValueError(f"Unknown journal event: {event}")
+
+
+class Journal(MutationLog):
+    """
+    Append-only write-ahead journal of service mutations.
+
+    Records are buffered and written in groups: a batch is flushed and
+    fsynced when it reaches 'batch_size' records or when the background
+    flusher wakes up every 'flush_interval' seconds, whichever is first.
+    recover() rebuilds the state from the last snapshot plus the journal,
+    and compact() folds the sealed journal segments into a new snapshot
+    on a background thread. Reference data (customers, branches, classes,
+    vehicles) is not journaled: checkpoint() it into the snapshot.
+    """
+    def __init__(self, directory: str, batch_size: int = 128, flush_interval: float = 0.05):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+        self._buffer: List[str] = []
+        self._seq = self._last_sequence()
+        self._file = self._open_segment(self._seq + 1)
+
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory, SNAPSHOT_FILE)
+
+    # Writing
+
+    def record(self, event: str, entity: Any, **details):
+        """ Buffers one mutation record. It becomes durable with the next group flush. """
+        data = _encode_event(event, entity, details)
+        with self._lock:
+            self._seq += 1
+            data["n"] = self._seq
+            data["e"] = event
+            self._buffer.append(json.dumps(data, separators=(",", ":")))
+
+            if len(self._buffer) >= self.batch_size:
+                self._flush_locked()
+
+    def record_many(self, records: Iterable[Tuple[str, Any, Dict[str, Any]]]):
+        """ Buffers a batch of mutation records under a single lock acquisition. """
+        encoded = [(event, _encode_event(event, entity, details)) for event, entity, details in records]
+        with self._lock:
+            for event, data in encoded:
+                self._seq += 1
+                data["n"] = self._seq
+                data["e"] = event
+                self._buffer.append(json.dumps(data, separators=(",", ":")))
+
+            if len(self._buffer) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self):
+        """ Writes and fsyncs all buffered records. """
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        self._file.write("\n".join(self._buffer) + "\n")
+        self._buffer.clear()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """ Stops the background flusher and flushes what is left. """
+        self._closed.set()
+        self._flusher.join()
+        with self._lock:
+            self._flush_locked()
+            self._file.close()
+
+    # Recovery and compaction
+
+    def recover(self) -> Database:
+        """
+        Loads the last snapshot and replays every newer journal record on top of it.
+        An empty directory recovers to an empty Database.
+        """
+        self.flush()
+        values = ValueCache()
+        with self._compaction_lock:
+            db, seq = read_snapshot(self.snapshot_path, values)
+            for record in self._read_segments(self._segments()):
+                if record["n"] > seq:
+                    apply_record(db, record, values)
+        return db
+
+    def checkpoint(self, db: Database) -> int:
+        """
+        Writes 'db' as the new snapshot and drops every journal segment it covers.
+        Call it after seeding reference data, while no service is changing 'db'.
+        Returns the sequence number the snapshot covers.
+        """
+        with self._compaction_lock, self._lock:
+            self._flush_locked()
+            covered = self._segments()
+            self._file.close()
+
+            write_snapshot(db, self.snapshot_path, self._seq)
+            for path in covered:
+                os.remove(path)
+            self._file = self._open_segment(self._seq + 1)
+            return self._seq
+
+    def compact(self) -> threading.Thread:
+        """
+        Seals the current segment and starts folding all sealed segments
+        into a new snapshot in the background. Returns the worker thread.
+        """
+        with self._lock:
+            self._flush_locked()
+            if self._file.tell() > 0:
+                self._file.close()
+                self._file = self._open_segment(self._seq + 1)
+            sealed = [path for path in self._segments() if path != self._file.name]
+
+        worker = threading.Thread(target=self._fold, args=(sealed,), daemon=True)
+        worker.start()
+        return worker
+
+    def _fold(self, sealed: List[str]):
+        with self._compaction_lock:
+            sealed = [path for path in sealed if os.path.exists(path)]  # a checkpoint may have folded them
+            values = ValueCache()
+            db, seq = read_snapshot(self.snapshot_path, values)
+            for record in self._read_segments(sealed):
+                if record["n"] > seq:
+                    apply_record(db, record, values)
+                    seq = record["n"]
+
+            write_snapshot(db, self.snapshot_path, seq)
+            for path in sealed:
+                os.remove(path)
+
+    # Segment files
+
+    def _segments(self) -> List[str]:
+        names = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX)
+        )
+        return [os.path.join(self.directory, name) for name in names]
+
+    def _open_segment(self, first_seq: int):
+        name = f"{_SEGMENT_PREFIX}{first_seq:012d}{_SEGMENT_SUFFIX}"
+        return open(os.path.join(self.directory, name), "a", encoding="utf-8")
+
+    @staticmethod
+    def _read_segments(paths: List[str]) -> Iterator[Dict[str, Any]]:
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn last line from a crash mid-write; nothing after it was acknowledged.
+                        break
+
+    def _last_sequence(self) -> int:
+        seq = snapshot_sequence(self.snapshot_path)
+        for record in self._read_segments(self._segments()):
+            seq = max(seq, record["n"])
+        return seq
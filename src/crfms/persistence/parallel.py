@@ -0,0 +1,161 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from ..domain.values import ValueCache
+from ..services.database import Database
+from .records import CODECS
+from .snapshot import TOKENS, read_snapshot, snapshot_sequence
+from .sectioned import MAGIC, SectionedSnapshot
+
+# Parallel loading: worker processes decode chunks of records into
+# entities whose references are still _Ref placeholders; the parent
+# then swaps the placeholders for the real objects (re-linking) while
+# it inserts the entities into a fresh Database in dependency order.
+
+# Reference attributes per collection, filled with _Ref by the workers.
+_REFERENCES = {
+    "agents": ["location"],
+    "vehicles": ["vehicle_class", "location"],
+    "reservations": ["customer", "vehicle_class", "pickup_location", "return_location", "add_ons", "insurance"],
+    "rental_agreements": ["reservation", "vehicle"],
+    "invoices": ["rental_agreement"],
+    "payments": ["invoice"],
+}
+
+Decoded = Dict[str, List[Any]]
+
+
+class _Ref:
+    """ Placeholder for a referenced entity, resolved in the parent process. """
+    __slots__ = ("collection", "hex_id")
+
+    def __init__(self, collection: str, hex_id: str):
+        self.collection = collection
+        self.hex_id = hex_id
+
+
+def _decode_records(items: List[Tuple[str, Dict[str, Any]]]) -> Decoded:
+    decoded: Decoded = {}
+    values = ValueCache()
+    for collection, record in items:
+        if collection == TOKENS:
+            decoded.setdefault(TOKENS, []).append((record["k"], record["id"]))
+        else:
+            decoded.setdefault(collection, []).append(CODECS[collection][1](record, _Ref, values))
+    return decoded
+
+def iter_line_range(
+    path: str,
+    start: int,
+    end: int,
+    collections: Optional[Iterable[str]] = None
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Yields (collection, record) for the snapshot lines that begin inside [start, end).
+    Like iter_snapshot, lines of collections not asked for are skipped unparsed.
+    """
+    prefixes = None
+    if collections is not None:
+        prefixes = tuple(f'{{"c":"{name}",'.encode() for name in collections)
+
+    with open(path, "rb") as f:
+        if start == 0:
+            f.readline()  # header
+        else:
+            f.seek(start - 1)
+            f.readline()  # finish the line that started before this range
+
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            if prefixes is not None and not line.startswith(prefixes):
+                continue
+            item = json.loads(line)
+            yield item["c"], item["r"]
+
+def line_ranges(path: str, parts: int) -> List[Tuple[int, int]]:
+    """ Splits a line snapshot into about 'parts' byte ranges for iter_line_range. """
+    size = os.path.getsize(path)
+    step = max(1, -(-size // max(1, parts)))
+    return [(start, min(start + step, size)) for start in range(0, size, step)]
+
+def _decode_line_range(path: str, start: int, end: int) -> Decoded:
+    """ Worker: decodes the snapshot lines that begin inside [start, end). """
+    return _decode_records(list(iter_line_range(path, start, end)))
+
+def _decode_section_range(path: str, section: str, start: int, end: int) -> Decoded:
+    """ Worker: decodes one chunk of a section from a sectioned container. """
+    with SectionedSnapshot(path) as snap:
+        return _decode_records([(section, record) for record in snap.records_between(start, end)])
+
+
+def _link(chunks: List[Decoded]) -> Database:
+    """ Inserts decoded entities in dependency order, replacing _Ref placeholders. """
+    db = Database()
+
+    def real(value: Any) -> Any:
+        if isinstance(value, _Ref):
+            return getattr(db, value.collection)[UUID(hex=value.hex_id)]
+        if isinstance(value, list):
+            return [real(v) for v in value]
+        return value
+
+    for collection in CODECS:
+        table = getattr(db, collection)
+        references = _REFERENCES.get(collection, [])
+        for chunk in chunks:
+            for entity in chunk.get(collection, []):
+                for attribute in references:
+                    setattr(entity, attribute, real(getattr(entity, attribute)))
+                table[entity.id] = entity
+
+    for chunk in chunks:
+        for token, hex_id in chunk.get(TOKENS, []):
+            db.agreements_by_token[token] = db.rental_agreements[UUID(hex=hex_id)]
+    for invoice in db.invoices.values():
+        db.invoices_by_agreement[invoice.rental_agreement.id] = invoice
+    return db
+
+
+def parallel_read_snapshot(path: str, workers: int) -> Tuple[Database, int]:
+    """ Like read_snapshot, but decodes byte ranges of the file in a process pool. """
+    ranges = line_ranges(path, workers * 4)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunks = list(pool.map(_decode_line_range, *zip(*[(path, s, e) for s, e in ranges])))
+
+    return _link(chunks), snapshot_sequence(path)
+
+def parallel_load_sectioned(path: str, workers: int) -> Database:
+    """ Like SectionedSnapshot.load(), but decodes every section in chunks in a process pool. """
+    with SectionedSnapshot(path) as snap:
+        jobs = [
+            (path, section, start, end)
+            for section in snap.sections()
+            for start, end in snap.chunks(section, workers * 4)
+        ]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunks = list(pool.map(_decode_section_range, *zip(*jobs))) if jobs else []
+
+    return _link(chunks)
+
+
+def load_snapshot(path: str, workers: int = 1) -> Database:
+    """ Loads a line snapshot or a sectioned container, in a process pool when 'workers' > 1. """
+    with open(path, "rb") as f:
+        is_sectioned = f.read(len(MAGIC)) == MAGIC
+
+    if is_sectioned:
+        if workers > 1:
+            return parallel_load_sectioned(path, workers)
+        with SectionedSnapshot(path) as snap:
+            return snap.load()
+
+    if workers > 1:
+        return parallel_read_snapshot(path, workers)[0]
+    return read_snapshot(path)[0]
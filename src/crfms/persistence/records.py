@@ -0,0 +1,265 @@
+# Flat record encoding for the domain entities.
+# Each entity becomes a dict of plain JSON types; other entities are
+# referenced by hex ID, and decoders look them up with a 'resolve' callback.
+# Decoders share repeated value objects through the ValueCache of the load.
+
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+from uuid import UUID
+
+from ..domain.users import Customer, BranchAgent
+from ..domain.fleet import (
+    Location, VehicleClass, AddOn, InsuranceTier, Vehicle, VehicleState, MaintenanceRecord
+)
+from ..domain.rental import (
+    Reservation, ReservationStatus, RentalAgreement, Invoice, InvoiceStatus,
+    BillingPayment, BillingPaymentStatus
+)
+from ..domain.values import Money, Kilometers, FuelLevel, ValueCache
+
+# resolve(collection_name, hex_id) -> entity
+Resolver = Callable[[str, str], Any]
+
+
+# Scalar helpers
+
+def _time(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat(timespec="microseconds") if value is not None else None
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value is not None else None
+
+def _km(value: Optional[Kilometers]) -> Optional[int]:
+    return value.value if value is not None else None
+
+def _parse_km(value: Optional[int], values: ValueCache) -> Optional[Kilometers]:
+    return values.kilometers(value) if value is not None else None
+
+def _fuel(value: Optional[FuelLevel]) -> Optional[float]:
+    return value.value if value is not None else None
+
+def _parse_fuel(value: Optional[float], values: ValueCache) -> Optional[FuelLevel]:
+    return values.fuel_level(value) if value is not None else None
+
+def _money(value: Money) -> float:
+    return value.value
+
+def _parse_money(value: float, values: ValueCache) -> Money:
+    return values.money(value)
+
+def _ref(entity: Any) -> Optional[str]:
+    return entity.id.hex if entity is not None else None
+
+
+# Users
+
+def encode_customer(c: Customer) -> Dict[str, Any]:
+    return {"id": c.id.hex, "first_name": c.first_name, "last_name": c.last_name, "email": c.email}
+
+def decode_customer(d: Dict[str, Any], resolve: Resolver, values: ValueCache) -> Customer:
+    return Customer(
+        first_name=d["first_name"], last_name=d["last_name"], email=d["email"], id=UUID(d["id"])
+    )
+
+def encode_agent(a: BranchAgent) -> Dict[str, Any]:
+    return {
+        "id": a.id.hex, "first_name": a.first_name, "last_name": a.last_name,
+        "location": _ref(a.location)
+    }
+
+def decode_agent(d: Dict[str, Any], resolve: Resolver, values: ValueCache) -> BranchAgent:
+    return BranchAgent(
+        first_name=d["first_name"], last_name=d["last_name"],
+        location=resolve("locations", d["location"]), id=UUID(d["id"])
+    )
+
+
+# Fleet
+
+def encode_location(loc: Location) -> Dict[str, Any]:
+    return {"id": loc.id.hex, "name": loc.name, "address": loc.address}
+
+def decode_location(d: Dict[str, Any], resolve: Resolver, values: ValueCache) -> Location:
+    return Location(name=d["name"], address=d["address"], id=UUID(d["id"]))
+
+def encode_vehicle_class(vc: VehicleClass) -> Dict[str, Any]:
+    return {"id": vc.id.hex, "name": vc.name, "base_rate": _money(vc.base_rate)}
+
+def decode_vehicle_class(d: Dict[str, Any], resolve: Resolver, values: ValueCache) -> VehicleClass:
+    return VehicleClass(name=d["name"], base_rate=_parse_money(d["base_rate"], values), id=UUID(d["id"]))
+
+def encode_add_on(a: AddOn) -> Dict[str, Any]:
+    return {"id": a.id.hex, "name": a.name, "daily_rate": _money(a.daily_rate)}
+
+def decode_add_on(d: Dict[str, Any], resolve: Resolver, values: ValueCache) -> AddOn:
+    return AddOn(name=d["name"], daily_rate=_parse_money(d["daily_rate"], values), id=UUID(d["id"]))
+
+def encode_insurance_tier(t: InsuranceTier) -> Dict[str, Any]:
+    return {"id": t.id.hex, "name": t.name, "daily_rate": _money(t.daily_rate)}
+
+def decode_insurance_tier(d: Dict[str, Any], resolve: Resolver, values: ValueCache) -> InsuranceTier:
+    return InsuranceTier(name=d["name"], daily_rate=_parse_money(d["daily_rate"], values), id=UUID(d["id"]))
+
+def encode_maintenance_record(r: MaintenanceRecord) -> Dict[str, Any]:
+    return {
+        "id": r.id.hex,
+        "service_type": r.service_type,
+        "odometer_threshold": _km(r.odometer_threshold),
+        "time_threshold": r.time_threshold.total_seconds() if r.time_threshold is not None else None,
+        "last_service_date": _time(r.last_service_date),
+        "last_service_odometer": _km(r.last_service_odometer),
+    }
+
+def decode_maintenance_record(d: Dict[str, Any], vehicle: Vehicle, values: ValueCache) -> MaintenanceRecord:
+    threshold = d["time_threshold"]
+    return MaintenanceRecord(
+        vehicle=vehicle,
+        service_type=d["service_type"],
+        id=UUID(d["id"]),
+        odometer_threshold=_parse_km(d["odometer_threshold"], values),
+        time_threshold=timedelta(seconds=threshold) if threshold is not None else None,
+        last_service_date=_parse_time(d["last_service_date"]),
+        last_service_odometer=_parse_km(d["last_service_odometer"], values),
+    )
+
+def encode_vehicle(v: Vehicle) -> Dict[str, Any]:
+    return {
+        "id": v.id.hex,
+        "license_plate": v.license_plate,
+        "odometer": _km(v.odometer),
+        "fuel_level": _fuel(v.fuel_level),
+        "vehicle_class": _ref(v.vehicle_class),
+        "location": _ref(v.location),
+        "state": v.state.name,
+        "maintenance_records": [encode_maintenance_record(r) for r in v.maintenance_records],
+    }
+
+def decode_vehicle(d: Dict[str, Any], resolve: Resolver, values: ValueCache) -> Vehicle:
+    vehicle = Vehicle(
+        license_plate=d["license_plate"],
+        odometer=_parse_km(d["odometer"], values),
+        fuel_level=_parse_fuel(d["fuel_level"], values),
+        vehicle_class=resolve("vehicle_classes", d["vehicle_class"]),
+        location=resolve("locations", d["location"]),
+        id=UUID(d["id"]),
+        state=VehicleState[d["state"]],
+    )
+    for record in d["maintenance_records"]:
+        vehicle.maintenance_records.append(decode_maintenance_record(record, vehicle, values))
+    return vehicle
+
+
+# Rental
+
+def encode_reservation(r: Reservation) -> Dict[str, Any]:
+    return {
+        "id": r.id.hex,
+        "customer": _ref(r.customer),
+        "vehicle_class": _ref(r.vehicle_class),
+        "pickup_location": _ref(r.pickup_location),
+        "return_location": _ref(r.return_location),
+        "pickup_time": _time(r.pickup_time),
+        "return_time": _time(r.return_time),
+        "deposit_amount": _money(r.deposit_amount),
+        "add_ons": [_ref(a) for a in r.add_ons],
+        "insurance": _ref(r.insurance),
+        "status": r.status.name,
+    }
+
+def decode_reservation(d: Dict[str, Any], resolve: Resolver, values: ValueCache) -> Reservation:
+    return Reservation(
+        customer=resolve("customers", d["customer"]),
+        vehicle_class=resolve("vehicle_classes", d["vehicle_class"]),
+        pickup_location=resolve("locations", d["pickup_location"]),
+        return_location=resolve("locations", d["return_location"]),
+        pickup_time=_parse_time(d["pickup_time"]),
+        return_time=_parse_time(d["return_time"]),
+        deposit_amount=_parse_money(d["deposit_amount"], values),
+        id=UUID(d["id"]),
+        add_ons=[resolve("add_ons", a) for a in d["add_ons"]],
+        insurance=resolve("insurance_tiers", d["insurance"]) if d["insurance"] else None,
+        status=ReservationStatus[d["status"]],
+    )
+
+def encode_agreement(a: RentalAgreement) -> Dict[str, Any]:
+    return {
+        "id": a.id.hex,
+        "reservation": _ref(a.reservation),
+        "vehicle": _ref(a.vehicle),
+        "pickup_time": _time(a.pickup_time),
+        "start_odometer": _km(a.start_odometer),
+        "start_fuel_level": _fuel(a.start_fuel_level),
+        "due_time": _time(a.due_time),
+        "return_time": _time(a.return_time),
+        "end_odometer": _km(a.end_odometer),
+        "end_fuel_level": _fuel(a.end_fuel_level),
+    }
+
+def decode_agreement(d: Dict[str, Any], resolve: Resolver, values: ValueCache) -> RentalAgreement:
+    return RentalAgreement(
+        reservation=resolve("reservations", d["reservation"]),
+        vehicle=resolve("vehicles", d["vehicle"]),
+        pickup_time=_parse_time(d["pickup_time"]),
+        start_odometer=_parse_km(d["start_odometer"], values),
+        start_fuel_level=_parse_fuel(d["start_fuel_level"], values),
+        due_time=_parse_time(d["due_time"]),
+        id=UUID(d["id"]),
+        return_time=_parse_time(d["return_time"]),
+        end_odometer=_parse_km(d["end_odometer"], values),
+        end_fuel_level=_parse_fuel(d["end_fuel_level"], values),
+    )
+
+
+# Billing
+
+def encode_invoice(i: Invoice) -> Dict[str, Any]:
+    return {
+        "id": i.id.hex,
+        "rental_agreement": _ref(i.rental_agreement),
+        "status": i.status.name,
+        "charge_items": [[c.description, _money(c.amount)] for c in i.charge_items],
+        "total_amount": _money(i.total_amount),
+    }
+
+def decode_invoice(d: Dict[str, Any], resolve: Resolver, values: ValueCache) -> Invoice:
+    return Invoice(
+        rental_agreement=resolve("rental_agreements", d["rental_agreement"]),
+        id=UUID(d["id"]),
+        status=InvoiceStatus[d["status"]],
+        charge_items=[values.charge_item(desc, _parse_money(amount, values)) for desc, amount in d["charge_items"]],
+        total_amount=_parse_money(d["total_amount"], values),
+    )
+
+def encode_payment(p: BillingPayment) -> Dict[str, Any]:
+    return {
+        "id": p.id.hex,
+        "invoice": _ref(p.invoice),
+        "amount_charged": _money(p.amount_charged),
+        "status": p.status.name,
+        "transaction_id": p.transaction_id,
+    }
+
+def decode_payment(d: Dict[str, Any], resolve: Resolver, values: ValueCache) -> BillingPayment:
+    return BillingPayment(
+        invoice=resolve("invoices", d["invoice"]),
+        amount_charged=_parse_money(d["amount_charged"], values),
+        status=BillingPaymentStatus[d["status"]],
+        id=UUID(d["id"]),
+        transaction_id=d["transaction_id"],
+    )
+
+
+# Collection name -> (encoder, decoder), in dependency order.
+CODECS = {
+    "customers": (encode_customer, decode_customer),
+    "locations": (encode_location, decode_location),
+    "agents": (encode_agent, decode_agent),
+    "vehicle_classes": (encode_vehicle_class, decode_vehicle_class),
+    "add_ons": (encode_add_on, decode_add_on),
+    "insurance_tiers": (encode_insurance_tier, decode_insurance_tier),
+    "vehicles": (encode_vehicle, decode_vehicle),
+    "reservations": (encode_reservation, decode_reservation),
+    "rental_agreements": (encode_agreement, decode_agreement),
+    "invoices": (encode_invoice, decode_invoice),
+    "payments": (encode_payment, decode_payment),
+}
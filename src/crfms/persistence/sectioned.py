@@ -0,0 +1,253 @@
+import json
+import mmap
+import struct
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from ..domain.values import ValueCache
+from ..services.database import Database
+from .records import CODECS
+from .snapshot import TOKENS
+
+# Sectioned container layout:
+#
+#   magic (8 bytes) | section count (u32)
+#   table: per section -> name length (u8), name, records offset (u64),
+#          records length (u64), record count (u64), index offset (u64)
+#   sections: length-delimited records (varint length + payload),
+#             then an index of (16-byte id, u64 offset) sorted by id
+#
+# Payloads are the flat records from records.py, so a section can be
+# decoded on its own and single records can be found by ID.
+
+MAGIC = b"CRFMSSEC"
+_HEADER = struct.Struct("<8sI")
+_TABLE_ENTRY = struct.Struct("<QQQQ")
+_INDEX_ENTRY = struct.Struct("<16sQ")
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def _read_varint(buf: Any, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+SECTIONS = list(CODECS) + [TOKENS]
+
+
+def write_sectioned_stream(path: str, items: Iterable[Tuple[str, bytes, bytes]]):
+    """
+    Streams (section, 16-byte id, payload) items into a sectioned container.
+    Items must arrive grouped by section in SECTIONS order; record bodies go
+    straight to disk and only the current section's ID index is kept in memory.
+    The header table is filled in at the end.
+    """
+    order = {name: i for i, name in enumerate(SECTIONS)}
+    entries: List[Tuple[int, int, int, int]] = []
+
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(SECTIONS)))
+        table_pos = f.tell()
+        for name in SECTIONS:
+            encoded = name.encode()
+            f.write(bytes([len(encoded)]) + encoded + bytes(_TABLE_ENTRY.size))
+
+        index: List[Tuple[bytes, int]] = []
+        start = f.tell()
+
+        def finish_section():
+            nonlocal index, start
+            index_offset = f.tell()
+            index.sort()
+            for raw_id, rel in index:
+                f.write(_INDEX_ENTRY.pack(raw_id, rel))
+            entries.append((start, index_offset - start, len(index), index_offset))
+            index = []
+            start = f.tell()
+
+        for section, raw_id, payload in items:
+            position = order[section]
+            if position < len(entries):
+                raise ValueError(f"Section '{section}' appears out of order.")
+            while len(entries) < position:
+                finish_section()
+
+            index.append((raw_id, f.tell() - start))
+            f.write(_varint(len(payload)))
+            f.write(payload)
+
+        while len(entries) < len(SECTIONS):
+            finish_section()
+
+        f.seek(table_pos)
+        for name, entry in zip(SECTIONS, entries):
+            f.seek(1 + len(name.encode()), 1)
+            f.write(_TABLE_ENTRY.pack(*entry))
+
+def _db_items(db: Database) -> Iterator[Tuple[str, bytes, bytes]]:
+    for name, (encode, _) in CODECS.items():
+        for entity in getattr(db, name).values():
+            yield name, entity.id.bytes, json.dumps(encode(entity), separators=(",", ":")).encode()
+    for token, agreement in db.agreements_by_token.items():
+        record = {"k": token, "id": agreement.id.hex}
+        yield TOKENS, agreement.id.bytes, json.dumps(record, separators=(",", ":")).encode()
+
+def write_sectioned(db: Database, path: str):
+    """ Writes the database as a sectioned container, one section per collection. """
+    write_sectioned_stream(path, _db_items(db))
+
+
+class SectionedSnapshot:
+    """
+    Read-only, memory-mapped view of a sectioned container.
+    Opening it only reads the header table; sections and single records
+    are decoded when asked for, so only the pages that are touched get
+    read from disk.
+    """
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a sectioned CRFMS snapshot.")
+
+        self._table: Dict[str, Tuple[int, int, int, int]] = {}
+        pos = _HEADER.size
+        for _ in range(count):
+            size = self._map[pos]
+            name = self._map[pos + 1:pos + 1 + size].decode()
+            pos += 1 + size
+            self._table[name] = _TABLE_ENTRY.unpack_from(self._map, pos)
+            pos += _TABLE_ENTRY.size
+
+    def __enter__(self) -> 'SectionedSnapshot':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def sections(self) -> List[str]:
+        return list(self._table)
+
+    def count(self, section: str) -> int:
+        """ Number of records in a section, read from the header table. """
+        return self._table[section][2]
+
+    def records(self, section: str) -> Iterator[Dict[str, Any]]:
+        """ Decodes the records of one section, one at a time. """
+        offset, length, _, _ = self._table[section]
+        return self.records_between(offset, offset + length)
+
+    def records_between(self, start: int, end: int) -> Iterator[Dict[str, Any]]:
+        """ Decodes the records stored between two absolute offsets (record boundaries). """
+        for payload in self.payloads_between(start, end):
+            yield json.loads(payload)
+
+    def payloads(self, section: str) -> Iterator[bytes]:
+        """ Raw, undecoded record payloads of one section. """
+        offset, length, _, _ = self._table[section]
+        return self.payloads_between(offset, offset + length)
+
+    def payloads_between(self, start: int, end: int) -> Iterator[bytes]:
+        pos = start
+        while pos < end:
+            size, pos = _read_varint(self._map, pos)
+            yield self._map[pos:pos + size]
+            pos += size
+
+    def chunks(self, section: str, parts: int) -> List[Tuple[int, int]]:
+        """ Splits a section into at most 'parts' (start, end) ranges on record boundaries. """
+        offset, length, count, index_offset = self._table[section]
+        if count == 0:
+            return []
+
+        starts = sorted(
+            _INDEX_ENTRY.unpack_from(self._map, index_offset + i * _INDEX_ENTRY.size)[1]
+            for i in range(count)
+        )
+        step = max(1, -(-count // parts))
+        bounds = [offset + rel for rel in starts[::step]] + [offset + length]
+        return list(zip(bounds, bounds[1:]))
+
+    def record(self, section: str, entity_id: UUID) -> Optional[Dict[str, Any]]:
+        """ Finds and decodes a single record by ID with a binary search over the section index. """
+        offset, _, count, index_offset = self._table[section]
+        key = entity_id.bytes
+
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            raw_id, _ = _INDEX_ENTRY.unpack_from(self._map, index_offset + mid * _INDEX_ENTRY.size)
+            if raw_id < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == count:
+            return None
+
+        raw_id, rel = _INDEX_ENTRY.unpack_from(self._map, index_offset + lo * _INDEX_ENTRY.size)
+        if raw_id != key:
+            return None
+        size, pos = _read_varint(self._map, offset + rel)
+        return json.loads(self._map[pos:pos + size])
+
+    def load(self, collections: Optional[Iterable[str]] = None, values: Optional[ValueCache] = None) -> Database:
+        """
+        Builds a Database holding the given collections (all when None).
+        Entities they reference from other sections are decoded one record
+        at a time, so unrelated records of those sections are never read.
+        """
+        wanted = list(CODECS) if collections is None else list(collections)
+        db = Database()
+        if values is None:
+            values = ValueCache()
+
+        def resolve(collection: str, hex_id: str) -> Any:
+            entity_id = UUID(hex=hex_id)
+            table = getattr(db, collection)
+            entity = table.get(entity_id)
+            if entity is None:
+                record = self.record(collection, entity_id)
+                if record is None:
+                    raise KeyError(f"{collection}/{hex_id} missing from snapshot")
+                entity = CODECS[collection][1](record, resolve, values)
+                table[entity_id] = entity
+            return entity
+
+        for name in CODECS:
+            if name not in wanted:
+                continue
+            decode = CODECS[name][1]
+            table = getattr(db, name)
+            for record in self.records(name):
+                entity_id = UUID(hex=record["id"])
+                if entity_id not in table:
+                    table[entity_id] = decode(record, resolve, values)
+
+        if "rental_agreements" in wanted:
+            for record in self.records(TOKENS):
+                db.agreements_by_token[record["k"]] = resolve("rental_agreements", record["id"])
+        for invoice in db.invoices.values():
+            db.invoices_by_agreement[invoice.rental_agreement.id] = invoice
+        return db
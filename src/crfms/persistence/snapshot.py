@@ -0,0 +1,96 @@
+import json
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+from uuid import UUID
+
+from ..domain.values import ValueCache
+from ..services.database import Database
+from .records import CODECS
+
+# Snapshot files are JSON lines: a header with the last folded journal
+# sequence number, then one line per entity, collection by collection in
+# dependency order, and finally the pickup token links.
+
+TOKENS = "pickup_tokens"
+_SEPARATORS = (",", ":")
+
+
+def write_snapshot(db: Database, path: str, seq: int = 0):
+    """ Writes the whole database to 'path' atomically, one record per line. """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"seq": seq}) + "\n")
+        for collection, (encode, _) in CODECS.items():
+            for entity in getattr(db, collection).values():
+                f.write(json.dumps({"c": collection, "r": encode(entity)}, separators=_SEPARATORS) + "\n")
+        for token, agreement in db.agreements_by_token.items():
+            record = {"k": token, "id": agreement.id.hex}
+            f.write(json.dumps({"c": TOKENS, "r": record}, separators=_SEPARATORS) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def snapshot_sequence(path: str) -> int:
+    """ Reads only the header of a snapshot. Missing snapshots count as sequence 0. """
+    if not os.path.exists(path):
+        return 0
+    with open(path, encoding="utf-8") as f:
+        return json.loads(f.readline())["seq"]
+
+def iter_snapshot(
+    path: str,
+    collections: Optional[Iterable[str]] = None
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Yields (collection, record) pairs one line at a time.
+    Records are the flat dicts from records.py, with references left as IDs,
+    so memory stays bounded by one record. When 'collections' is given,
+    lines of other collections are skipped without being parsed.
+    """
+    if not os.path.exists(path):
+        return
+
+    prefixes = None
+    if collections is not None:
+        prefixes = tuple(f'{{"c":"{name}",'.encode() for name in collections)
+
+    with open(path, "rb") as f:
+        f.readline()  # header
+        for line in f:
+            if prefixes is not None and not line.startswith(prefixes):
+                continue
+            item = json.loads(line)
+            yield item["c"], item["r"]
+
+def stream_snapshot(path: str, callbacks: Dict[str, Callable[[Dict[str, Any]], None]]):
+    """ Callback mode of iter_snapshot: calls callbacks[collection](record) for each wanted record. """
+    for collection, record in iter_snapshot(path, callbacks):
+        callbacks[collection](record)
+
+def read_snapshot(path: str, values: Optional[ValueCache] = None) -> Tuple[Database, int]:
+    """
+    Builds a Database from a snapshot entity by entity. Returns it with its sequence number.
+    Pass 'values' to read the flyweight stats of this load afterwards.
+    """
+    db = Database()
+    resolve = make_resolver(db)
+    if values is None:
+        values = ValueCache()
+
+    for collection, record in iter_snapshot(path):
+        if collection == TOKENS:
+            db.agreements_by_token[record["k"]] = db.rental_agreements[UUID(hex=record["id"])]
+            continue
+
+        entity = CODECS[collection][1](record, resolve, values)
+        getattr(db, collection)[entity.id] = entity
+
+    for invoice in db.invoices.values():
+        db.invoices_by_agreement[invoice.rental_agreement.id] = invoice
+    return db, snapshot_sequence(path)
+
+def make_resolver(db: Database) -> Callable[[str, str], Any]:
+    """ Returns a 'resolve' callback for the decoders that looks entities up in 'db'. """
+    def resolve(collection: str, hex_id: str) -> Any:
+        return getattr(db, collection)[UUID(hex=hex_id)]
+    return resolve
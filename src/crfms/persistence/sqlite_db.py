@@ -0,0 +1,398 @@
+import json
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from ..domain.fleet import Vehicle, VehicleState
+from ..domain.values import ValueCache
+from ..domain.rental import Reservation, ReservationStatus, RentalAgreement
+from .records import CODECS
+
+
+class ConnectionPool:
+    """
+    Hands out one SQLite connection per thread.
+    Connections are opened on first use in WAL mode, so readers in
+    other threads are not blocked by a writer.
+    """
+    def __init__(self, path: str, cached_statements: int = 256):
+        self.path = path
+        self._cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+
+    def connection(self) -> sqlite3.Connection:
+        """ Returns the calling thread's connection. """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=self._cached_statements,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """ Runs a block in one transaction. Nested blocks join the outer one. """
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close_all(self):
+        """ Closes every connection the pool has opened. """
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+class EntityTable(MutableMapping):
+    """
+    One entity collection stored in a SQLite table.
+    Rows hold the encoded record as JSON plus a few indexed columns.
+    Entities are decoded only when they are first read, and are then kept
+    in an identity map so every read returns the same object.
+    """
+    # Extra indexed columns: column name -> function(entity) -> SQL value
+    columns: Dict[str, Any] = {}
+
+    def __init__(self, db: 'SqliteDatabase', name: str):
+        self.db = db
+        self.name = name
+        self._encode, self._decode = CODECS[name]
+        self._loaded: Dict[UUID, Any] = {}
+        self._clean: Dict[UUID, str] = {}
+
+        # Fixed SQL text, so sqlite3 can reuse the prepared statements.
+        names = ["id", "data"] + list(self.columns)
+        self._sql_get = f"SELECT data FROM {name} WHERE id = ?"
+        self._sql_put = (
+            f"INSERT OR REPLACE INTO {name} ({', '.join(names)}) "
+            f"VALUES ({', '.join('?' for _ in names)})"
+        )
+        self._sql_delete = f"DELETE FROM {name} WHERE id = ?"
+        self._sql_ids = f"SELECT id FROM {name}"
+        self._sql_rows = f"SELECT id, data FROM {name}"
+        self._sql_count = f"SELECT COUNT(*) FROM {name}"
+        self._sql_exists = f"SELECT 1 FROM {name} WHERE id = ?"
+
+    def schema(self) -> List[str]:
+        """ SQL statements that create this table. """
+        extra = "".join(f", {column}" for column in self.columns)
+        return [f"CREATE TABLE IF NOT EXISTS {self.name} (id BLOB PRIMARY KEY, data TEXT NOT NULL{extra})"]
+
+    # Mapping interface
+
+    def __getitem__(self, key: UUID) -> Any:
+        entity = self._loaded.get(key)
+        if entity is not None:
+            return entity
+
+        row = self.db.pool.connection().execute(self._sql_get, (key.bytes,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return self._hydrate(key, row[0])
+
+    def __setitem__(self, key: UUID, entity: Any):
+        previous = self._loaded.get(key)
+        if previous is not None and previous is not entity:
+            self._forget(key)
+
+        self._loaded[key] = entity
+        self._write(key, entity)
+        self._track(entity)
+
+    def __delitem__(self, key: UUID):
+        cursor = self.db.pool.connection().execute(self._sql_delete, (key.bytes,))
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+        self._forget(key)
+
+    def __contains__(self, key: object) -> bool:
+        if key in self._loaded:
+            return True
+        if not isinstance(key, UUID):
+            return False
+        return self.db.pool.connection().execute(self._sql_exists, (key.bytes,)).fetchone() is not None
+
+    def __iter__(self) -> Iterator[UUID]:
+        rows = self.db.pool.connection().execute(self._sql_ids).fetchall()
+        return (UUID(bytes=row[0]) for row in rows)
+
+    def __len__(self) -> int:
+        return self.db.pool.connection().execute(self._sql_count).fetchone()[0]
+
+    def values(self) -> List[Any]:
+        return [entity for _, entity in self.items()]
+
+    def items(self) -> List[Tuple[UUID, Any]]:
+        """ Reads all rows in one query, decoding only entities not loaded yet. """
+        rows = self.db.pool.connection().execute(self._sql_rows).fetchall()
+        return [(key, self._entity_from_row(key, data)) for key, data in
+                ((UUID(bytes=raw_id), data) for raw_id, data in rows)]
+
+    # Loading and saving
+
+    def _entity_from_row(self, key: UUID, data: str) -> Any:
+        entity = self._loaded.get(key)
+        if entity is None:
+            entity = self._hydrate(key, data)
+        return entity
+
+    def _hydrate(self, key: UUID, data: str) -> Any:
+        with self.db._lock:
+            entity = self._loaded.get(key)
+            if entity is not None:
+                return entity
+
+            entity = self._decode(json.loads(data), self.db._resolve, self.db.values)
+            self._loaded[key] = entity
+            self._clean[key] = data
+            self._track(entity)
+            return entity
+
+    def _write(self, key: UUID, entity: Any):
+        data = json.dumps(self._encode(entity), separators=(",", ":"))
+        params = [key.bytes, data] + [column(entity) for column in self.columns.values()]
+        self.db.pool.connection().execute(self._sql_put, params)
+        self._clean[key] = data
+
+    def _track(self, entity: Any):
+        watch = getattr(entity, "watch", None)
+        if watch is not None:
+            watch(self._on_entity_changed)
+
+    def _forget(self, key: UUID):
+        entity = self._loaded.pop(key, None)
+        self._clean.pop(key, None)
+        unwatch = getattr(entity, "unwatch", None)
+        if unwatch is not None:
+            unwatch(self._on_entity_changed)
+
+    def _on_entity_changed(self, entity: Any, attribute: str, old_value: Any):
+        """ Writes watched attribute changes straight through, so queries and the file stay current. """
+        if self._loaded.get(entity.id) is entity:
+            self._write(entity.id, entity)
+
+    def flush(self) -> int:
+        """ Writes back every loaded entity whose encoded record has changed. """
+        written = 0
+        for key, entity in list(self._loaded.items()):
+            data = json.dumps(self._encode(entity), separators=(",", ":"))
+            if data != self._clean.get(key):
+                self._write(key, entity)
+                written += 1
+        return written
+
+    def _query(self, sql: str, params: Tuple) -> List[Any]:
+        rows = self.db.pool.connection().execute(sql, params).fetchall()
+        return [self._entity_from_row(UUID(bytes=raw_id), data) for raw_id, data in rows]
+
+
+def _ref_bytes(entity: Any) -> Optional[bytes]:
+    return entity.id.bytes if entity is not None else None
+
+def _sql_time(value: datetime) -> str:
+    return value.isoformat(timespec="microseconds")
+
+
+class VehicleEntityTable(EntityTable):
+    """ Vehicles, with the same index queries as VehicleTable. """
+    columns = {
+        "location_id": lambda v: _ref_bytes(v.location),
+        "class_id": lambda v: _ref_bytes(v.vehicle_class),
+        "state": lambda v: v.state.name,
+    }
+
+    def schema(self) -> List[str]:
+        return super().schema() + [
+            "CREATE INDEX IF NOT EXISTS vehicles_location ON vehicles (location_id, class_id)",
+            "CREATE INDEX IF NOT EXISTS vehicles_state ON vehicles (state)",
+        ]
+
+    def at_location(self, location_id: UUID) -> List[Vehicle]:
+        """ All vehicles currently at a location. """
+        return self._query("SELECT id, data FROM vehicles WHERE location_id = ?", (location_id.bytes,))
+
+    def of_class_at(self, location_id: UUID, class_id: UUID) -> List[Vehicle]:
+        """ Vehicles of one class at a location. """
+        return self._query(
+            "SELECT id, data FROM vehicles WHERE location_id = ? AND class_id = ?",
+            (location_id.bytes, class_id.bytes)
+        )
+
+    def classes_at(self, location_id: UUID) -> List[UUID]:
+        """ IDs of the vehicle classes that have vehicles at a location. """
+        rows = self.db.pool.connection().execute(
+            "SELECT DISTINCT class_id FROM vehicles WHERE location_id = ?", (location_id.bytes,)
+        ).fetchall()
+        return [UUID(bytes=row[0]) for row in rows]
+
+    def in_state(self, state: VehicleState) -> List[Vehicle]:
+        """ All vehicles in the given state. """
+        return self._query("SELECT id, data FROM vehicles WHERE state = ?", (state.name,))
+
+
+class ReservationEntityTable(EntityTable):
+    """ Reservations, with the same overlap query as ReservationTable. """
+    columns = {
+        "class_id": lambda r: _ref_bytes(r.vehicle_class),
+        "location_id": lambda r: _ref_bytes(r.pickup_location),
+        "status": lambda r: r.status.name,
+        "pickup_time": lambda r: _sql_time(r.pickup_time),
+        "return_time": lambda r: _sql_time(r.return_time),
+    }
+
+    def schema(self) -> List[str]:
+        return super().schema() + [
+            "CREATE INDEX IF NOT EXISTS reservations_window "
+            "ON reservations (class_id, location_id, pickup_time)",
+        ]
+
+    def overlapping(
+        self,
+        class_id: UUID,
+        location_id: UUID,
+        start: datetime,
+        end: datetime
+    ) -> List[Reservation]:
+        """ Active reservations of a class at a pickup location that overlap [start, end). """
+        active = [s.name for s in (ReservationStatus.PENDING, ReservationStatus.CONFIRMED)]
+        return self._query(
+            "SELECT id, data FROM reservations "
+            "WHERE class_id = ? AND location_id = ? AND pickup_time < ? AND return_time > ? "
+            "AND status IN (?, ?)",
+            (class_id.bytes, location_id.bytes, _sql_time(end), _sql_time(start), *active)
+        )
+
+
+class AgreementEntityTable(EntityTable):
+    """ Rental agreements, with the same reservation lookup as AgreementTable. """
+    columns = {
+        "reservation_id": lambda a: _ref_bytes(a.reservation),
+    }
+
+    def schema(self) -> List[str]:
+        return super().schema() + [
+            "CREATE INDEX IF NOT EXISTS rental_agreements_reservation ON rental_agreements (reservation_id)",
+        ]
+
+    def for_reservation(self, reservation_id: UUID) -> Optional[RentalAgreement]:
+        """ The agreement a reservation was picked up under, if any. """
+        found = self._query(
+            "SELECT id, data FROM rental_agreements WHERE reservation_id = ? LIMIT 1", (reservation_id.bytes,)
+        )
+        return found[0] if found else None
+
+
+class LinkTable(MutableMapping):
+    """ A stored key -> entity lookup, e.g. pickup token -> rental agreement. """
+    def __init__(self, db: 'SqliteDatabase', name: str, target: str):
+        self.db = db
+        self.name = name
+        self.target = target
+        self._sql_get = f"SELECT target FROM {name} WHERE key = ?"
+        self._sql_put = f"INSERT OR REPLACE INTO {name} (key, target) VALUES (?, ?)"
+        self._sql_delete = f"DELETE FROM {name} WHERE key = ?"
+        self._sql_keys = f"SELECT key FROM {name}"
+        self._sql_count = f"SELECT COUNT(*) FROM {name}"
+
+    def schema(self) -> List[str]:
+        return [f"CREATE TABLE IF NOT EXISTS {self.name} (key PRIMARY KEY, target BLOB NOT NULL)"]
+
+    @staticmethod
+    def _key(key: Any) -> Any:
+        return key.bytes if isinstance(key, UUID) else key
+
+    def __getitem__(self, key: Any) -> Any:
+        row = self.db.pool.connection().execute(self._sql_get, (self._key(key),)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return getattr(self.db, self.target)[UUID(bytes=row[0])]
+
+    def __setitem__(self, key: Any, entity: Any):
+        self.db.pool.connection().execute(self._sql_put, (self._key(key), entity.id.bytes))
+
+    def __delitem__(self, key: Any):
+        cursor = self.db.pool.connection().execute(self._sql_delete, (self._key(key),))
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[Any]:
+        rows = self.db.pool.connection().execute(self._sql_keys).fetchall()
+        return (UUID(bytes=row[0]) if isinstance(row[0], bytes) else row[0] for row in rows)
+
+    def __len__(self) -> int:
+        return self.db.pool.connection().execute(self._sql_count).fetchone()[0]
+
+
+class SqliteDatabase:
+    """
+    Drop-in replacement for the in-memory Database, stored in a SQLite file.
+    It has the same collections and index queries, so the services run on
+    it unchanged. Every change the services make is a watched attribute
+    (or notified, like maintenance plans) and is written immediately;
+    commit() writes back in-place changes made by other code.
+    """
+    def __init__(self, path: str):
+        self.pool = ConnectionPool(path)
+        self._lock = threading.RLock()
+        self.values = ValueCache()  # flyweights of the hydrated entities, used under _lock
+
+        self.customers = EntityTable(self, "customers")
+        self.agents = EntityTable(self, "agents")
+        self.locations = EntityTable(self, "locations")
+        self.vehicle_classes = EntityTable(self, "vehicle_classes")
+        self.vehicles = VehicleEntityTable(self, "vehicles")
+        self.add_ons = EntityTable(self, "add_ons")
+        self.insurance_tiers = EntityTable(self, "insurance_tiers")
+        self.reservations = ReservationEntityTable(self, "reservations")
+        self.rental_agreements = AgreementEntityTable(self, "rental_agreements")
+        self.invoices = EntityTable(self, "invoices")
+        self.payments = EntityTable(self, "payments")
+
+        self.agreements_by_token = LinkTable(self, "pickup_tokens", "rental_agreements")
+        self.invoices_by_agreement = LinkTable(self, "agreement_invoices", "invoices")
+
+        with self.pool.transaction() as conn:
+            for table in self._tables() + [self.agreements_by_token, self.invoices_by_agreement]:
+                for statement in table.schema():
+                    conn.execute(statement)
+
+    def _tables(self) -> List[EntityTable]:
+        return [getattr(self, name) for name in CODECS]
+
+    def _resolve(self, collection: str, hex_id: str) -> Any:
+        return getattr(self, collection)[UUID(hex=hex_id)]
+
+    def commit(self) -> int:
+        """ Writes back all loaded entities that changed in memory. Returns the number of rows written. """
+        with self.pool.transaction():
+            return sum(table.flush() for table in self._tables())
+
+    def close(self):
+        """ Commits pending changes and closes all pooled connections. """
+        self.commit()
+        self.pool.close_all()
@@ -0,0 +1,220 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from ..domain.rental import LATE_FEE, MILEAGE_FEE, FUEL_CHARGE
+from ..domain.values import Money
+from ..services.batch_pricing import BatchPricingEngine
+from .parallel import iter_line_range, line_ranges
+from .sectioned import MAGIC, SectionedSnapshot
+
+# What-if re-pricing: how much revenue past invoices would have brought in
+# with other penalty settings (the late fee, mileage allowance, overage fee
+# and fuel refill charge given to RentalService).
+#
+# Worker processes read chunks of a snapshot as flat records, without
+# building entities. They re-price the returned agreements they see with a
+# BatchPricingEngine and read the stored penalty lines off the invoices,
+# returning NumPy columns keyed by hex ID. The parent joins invoice ->
+# agreement -> reservation with sorted-key lookups and sums the revenue per
+# (vehicle class, pickup branch). Only the penalty lines are re-priced; the
+# other stored lines are kept, so the delta shows the effect of the new
+# settings alone.
+
+_COLLECTIONS = ("locations", "vehicle_classes", "reservations", "rental_agreements", "invoices")
+_PENALTIES = (LATE_FEE, MILEAGE_FEE, FUEL_CHARGE)
+
+Columns = Dict[str, Any]
+
+
+@dataclass(slots=True)
+class RevenueDelta:
+    """ Stored and what-if revenue of the invoices of one vehicle class at one pickup branch. """
+    vehicle_class: str
+    location: str
+    invoices: int
+    stored: Money
+    what_if: Money
+
+    @property
+    def delta(self) -> Money:
+        return self.what_if - self.stored
+
+
+@dataclass(slots=True)
+class WhatIfReport:
+    """ Revenue deltas per (vehicle class, pickup branch), plus invoices that could not be re-priced. """
+    rows: List[RevenueDelta] = field(default_factory=list)
+    skipped: int = 0
+
+    @property
+    def stored(self) -> Money:
+        return Money.sum(row.stored for row in self.rows)
+
+    @property
+    def what_if(self) -> Money:
+        return Money.sum(row.what_if for row in self.rows)
+
+    @property
+    def delta(self) -> Money:
+        return self.what_if - self.stored
+
+
+# Workers
+
+def _reprice_records(items: Iterable[Tuple[str, Dict[str, Any]]], engine: BatchPricingEngine) -> Columns:
+    """ Turns flat records into the columns the parent joins, re-pricing returned agreements. """
+    names: List[Tuple[str, str, str]] = []
+    reservations: Tuple[List, List, List] = ([], [], [])
+    agreements: Tuple[List, ...] = ([], [], [], [], [], [], [], [])
+    invoices: Tuple[List, List, List] = ([], [], [])
+
+    for collection, record in items:
+        if collection == "reservations":
+            for column, value in zip(reservations, (record["id"], record["vehicle_class"], record["pickup_location"])):
+                column.append(value)
+        elif collection == "rental_agreements":
+            if record["return_time"] is None or record["end_odometer"] is None or record["end_fuel_level"] is None:
+                continue
+            values = (
+                record["id"], record["reservation"], record["pickup_time"], record["return_time"],
+                record["due_time"], record["end_odometer"] - record["start_odometer"],
+                record["start_fuel_level"], record["end_fuel_level"]
+            )
+            for column, value in zip(agreements, values):
+                column.append(value)
+        elif collection == "invoices":
+            stored = [0, 0, 0]
+            total = 0
+            for description, amount in record["charge_items"]:
+                cents = round(amount * 100)
+                total += cents
+                if description in _PENALTIES:
+                    stored[_PENALTIES.index(description)] += cents
+            invoices[0].append(record["rental_agreement"])
+            invoices[1].append(total)
+            invoices[2].append(stored)
+        else:
+            names.append((collection, record["id"], record["name"]))
+
+    agreement_ids, reservation_ids, pickup, returned, due, driven_km, start_fuel, end_fuel = agreements
+    new_penalties = engine.penalties(
+        np.array(pickup, dtype="datetime64[us]"),
+        np.array(returned, dtype="datetime64[us]"),
+        np.array(due, dtype="datetime64[us]"),
+        np.array(driven_km, dtype=np.int64),
+        np.array(start_fuel, dtype=np.float64),
+        np.array(end_fuel, dtype=np.float64),
+    )
+
+    return {
+        "names": names,
+        "reservation_id": _keys(reservations[0]),
+        "reservation_class": _keys(reservations[1]),
+        "reservation_location": _keys(reservations[2]),
+        "agreement_id": _keys(agreement_ids),
+        "agreement_reservation": _keys(reservation_ids),
+        "new_penalties": np.stack(new_penalties, axis=1) if agreement_ids else np.zeros((0, 3), dtype=np.int64),
+        "invoice_agreement": _keys(invoices[0]),
+        "invoice_total": np.array(invoices[1], dtype=np.int64),
+        "invoice_penalties": np.array(invoices[2], dtype=np.int64).reshape(-1, 3),
+    }
+
+def _keys(hex_ids: List[str]) -> np.ndarray:
+    return np.array(hex_ids, dtype="S32")
+
+def _reprice_line_range(path: str, start: int, end: int, engine: BatchPricingEngine) -> Columns:
+    """ Worker: re-prices the snapshot lines that begin inside [start, end). """
+    return _reprice_records(iter_line_range(path, start, end, _COLLECTIONS), engine)
+
+def _reprice_section_range(path: str, section: str, start: int, end: int, engine: BatchPricingEngine) -> Columns:
+    """ Worker: re-prices one chunk of a section from a sectioned container. """
+    with SectionedSnapshot(path) as snap:
+        return _reprice_records(((section, record) for record in snap.records_between(start, end)), engine)
+
+
+# Parent
+
+def what_if_revenue(path: str, engine: BatchPricingEngine, workers: int) -> WhatIfReport:
+    """
+    Re-prices every invoiced, returned agreement in a snapshot (line or
+    sectioned) with the penalty settings of 'engine', in a process pool of
+    'workers', and compares the revenue with the stored charge lines.
+    """
+    with open(path, "rb") as f:
+        is_sectioned = f.read(len(MAGIC)) == MAGIC
+
+    if is_sectioned:
+        with SectionedSnapshot(path) as snap:
+            jobs = [
+                (path, section, start, end, engine)
+                for section in _COLLECTIONS if section in snap.sections()
+                for start, end in snap.chunks(section, workers * 4)
+            ]
+        worker = _reprice_section_range
+    else:
+        jobs = [(path, start, end, engine) for start, end in line_ranges(path, workers * 4)]
+        worker = _reprice_line_range
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunks = list(pool.map(worker, *zip(*jobs))) if jobs else []
+
+    return _join(chunks)
+
+def _join(chunks: List[Columns]) -> WhatIfReport:
+    """ Links invoices to their agreements and reservations and sums the revenue per group. """
+    def column(name: str) -> np.ndarray:
+        if not chunks:
+            return np.zeros((0, 3) if name.endswith("penalties") else 0, dtype=np.int64)
+        return np.concatenate([chunk[name] for chunk in chunks])
+
+    names = {(collection, hex_id): name for chunk in chunks for collection, hex_id, name in chunk["names"]}
+
+    # Invoice -> returned agreement -> reservation
+    invoice_agreement = column("invoice_agreement")
+    agreement_rows, priced = _lookup(column("agreement_id"), invoice_agreement)
+    reservation_rows, booked = _lookup(column("reservation_id"), column("agreement_reservation")[agreement_rows])
+    found = priced & booked
+    agreement_rows, reservation_rows = agreement_rows[found], reservation_rows[found]
+
+    stored = column("invoice_total")[found]
+    what_if = (
+        stored - column("invoice_penalties")[found].sum(axis=1)
+        + column("new_penalties")[agreement_rows].sum(axis=1)
+    )
+
+    class_ids = column("reservation_class")[reservation_rows]
+    location_ids = column("reservation_location")[reservation_rows]
+    pairs = np.char.add(class_ids, location_ids)
+    groups, group_of = np.unique(pairs, return_inverse=True)
+
+    counts = np.bincount(group_of, minlength=len(groups))
+    stored_sums = np.zeros(len(groups), dtype=np.int64)
+    what_if_sums = np.zeros(len(groups), dtype=np.int64)
+    np.add.at(stored_sums, group_of, stored)
+    np.add.at(what_if_sums, group_of, what_if)
+
+    report = WhatIfReport(skipped=int(len(invoice_agreement) - found.sum()))
+    for index, pair in enumerate(groups.tolist()):
+        class_id, location_id = pair[:32].decode(), pair[32:].decode()
+        report.rows.append(RevenueDelta(
+            vehicle_class=names.get(("vehicle_classes", class_id), class_id),
+            location=names.get(("locations", location_id), location_id),
+            invoices=int(counts[index]),
+            stored=Money.of_cents(int(stored_sums[index])),
+            what_if=Money.of_cents(int(what_if_sums[index])),
+        ))
+    report.rows.sort(key=lambda row: (row.vehicle_class, row.location))
+    return report
+
+def _lookup(keys: np.ndarray, wanted: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ Row of each wanted key in 'keys' (by binary search over a sorted copy), and whether it was found. """
+    if len(keys) == 0:
+        return np.zeros(len(wanted), dtype=np.intp), np.zeros(len(wanted), dtype=bool)
+
+    order = np.argsort(keys, kind="stable")
+    positions = np.minimum(np.searchsorted(keys[order], wanted), len(keys) - 1)
+    rows = order[positions]
+    return rows, keys[rows] == wanted
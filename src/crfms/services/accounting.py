@@ -1,15 +1,26 @@
+import asyncio
+import uuid
+from contextlib import nullcontext
+from typing import Iterable, List, Optional
 from .database import Database
-from ..domain.ports import Payment, Notification
+from ..domain.ports import Payment, AsyncPayment, Notification, MutationLog
 from ..domain.rental import Invoice, BillingPayment, BillingPaymentStatus, InvoiceStatus
 from ..domain.users import Customer
 from ..domain.values import Money
 
 class AccountingService:
     """ Service for capturing depositsand finalizing payments."""
-    def __init__(self, db: Database, payment_port: Payment, notifier: Notification):
+    def __init__(
+        self,
+        db: Database,
+        payment_port: Payment,
+        notifier: Notification,
+        journal: Optional[MutationLog] = None
+    ):
         self.db = db
         self.payment_port = payment_port
         self.notifier = notifier
+        self.journal = journal
 
     def capture_deposit(self, customer: Customer, amount: Money):
         """ Attempts to pre-authorize a deposit. """
@@ -22,26 +33,127 @@ class AccountingService:
     def finalize_payment(self, invoice: Invoice):
         """ Attempts to finalize payment for an invoice. """
         customer = invoice.rental_agreement.reservation.customer
-        amount = invoice.total_amount
-        
+
+        try:
+            tx_id = self.payment_port.finalize_payment(customer, invoice.total_amount)
+            succeeded = True
+        except Exception as e:
+            tx_id = None
+            succeeded = False
+
+        _record_payment(self.db, self.notifier, self.journal, invoice, tx_id, succeeded)
+
+
+class AsyncAccountingService:
+    """
+    AccountingService for an AsyncPayment port, so many payments can be
+    in flight at once. Every call gets 'timeout' seconds; failed or
+    timed-out calls are retried up to 'retries' times with exponential
+    backoff from 'retry_delay' seconds. Final payments carry the invoice ID
+    and deposits one key per capture as idempotency key, so a retry never
+    charges or authorizes twice.
+    """
+    def __init__(
+        self,
+        db: Database,
+        payment_port: AsyncPayment,
+        notifier: Notification,
+        journal: Optional[MutationLog] = None,
+        max_concurrency: int = 20,
+        timeout: float = 5.0,
+        retries: int = 2,
+        retry_delay: float = 0.2
+    ):
+        self.db = db
+        self.payment_port = payment_port
+        self.notifier = notifier
+        self.journal = journal
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+    async def capture_deposit(self, customer: Customer, amount: Money, idempotency_key: Optional[str] = None) -> str:
+        """
+        Attempts to pre-authorize a deposit. Raises the last error if every attempt fails.
+        Every attempt sends 'idempotency_key' (a new one if None, e.g. the reservation ID's hex).
+        """
+        key = idempotency_key if idempotency_key is not None else uuid.uuid4().hex
         try:
-            tx_id = self.payment_port.finalize_payment(customer, amount)
-            invoice.status = InvoiceStatus.PAID
-            status = BillingPaymentStatus.SUCCESS
-            msg = f"Your payment for invoice {invoice.id} was successful."
-            
+            return await self._call(lambda: self.payment_port.authorize_deposit(customer, amount, key))
         except Exception as e:
-            invoice.status = InvoiceStatus.FAILED
-            status = BillingPaymentStatus.FAILURE
+            print(f"Deposit authorization failed for {customer.email}: {e}")
+            raise
+
+    async def finalize_payment(self, invoice: Invoice) -> BillingPayment:
+        """ Attempts to finalize payment for an invoice. """
+        return await self._finalize(invoice)
+
+    async def settle(self, invoices: Iterable[Invoice]) -> List[BillingPayment]:
+        """
+        Finalizes the payment of every invoice, at most 'max_concurrency' calls
+        at a time. Each payment is recorded and its customer notified as soon
+        as it completes. Returns the payments in the order of 'invoices'.
+        """
+        slots = asyncio.Semaphore(self.max_concurrency)
+        return await asyncio.gather(*(self._finalize(invoice, slots) for invoice in invoices))
+
+    async def _finalize(self, invoice: Invoice, slots: Optional[asyncio.Semaphore] = None) -> BillingPayment:
+        customer = invoice.rental_agreement.reservation.customer
+        amount = invoice.total_amount
+
+        try:
+            tx_id = await self._call(
+                lambda: self.payment_port.finalize_payment(customer, amount, invoice.id.hex), slots
+            )
+            succeeded = True
+        except Exception:
             tx_id = None
-            msg = f"Payment failed for invoice {invoice.id}. Please update your billing."
-            
-        payment = BillingPayment(
-            invoice=invoice,
-            amount_charged=amount,
-            status=status,
-            transaction_id=tx_id
-        )
-        self.db.payments[payment.id] = payment
-        
-        self.notifier.send(customer, msg)
\ No newline at end of file
+            succeeded = False
+
+        return _record_payment(self.db, self.notifier, self.journal, invoice, tx_id, succeeded)
+
+    async def _call(self, request, slots: Optional[asyncio.Semaphore] = None):
+        """ Awaits request() with the timeout and retries; a slot is only held while a call is in flight. """
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                async with slots if slots is not None else nullcontext():
+                    return await asyncio.wait_for(request(), self.timeout)
+            except Exception:
+                if attempt == self.retries:
+                    raise
+
+
+def _record_payment(
+    db: Database,
+    notifier: Notification,
+    journal: Optional[MutationLog],
+    invoice: Invoice,
+    tx_id: Optional[str],
+    succeeded: bool
+) -> BillingPayment:
+    """ Marks the invoice paid or failed, stores the BillingPayment and notifies the customer. """
+    customer = invoice.rental_agreement.reservation.customer
+    if succeeded:
+        invoice.status = InvoiceStatus.PAID
+        status = BillingPaymentStatus.SUCCESS
+        msg = f"Your payment for invoice {invoice.id} was successful."
+    else:
+        invoice.status = InvoiceStatus.FAILED
+        status = BillingPaymentStatus.FAILURE
+        msg = f"Payment failed for invoice {invoice.id}. Please update your billing."
+
+    payment = BillingPayment(
+        invoice=invoice,
+        amount_charged=invoice.total_amount,
+        status=status,
+        transaction_id=tx_id
+    )
+    db.payments[payment.id] = payment
+    if journal is not None:
+        journal.record("payment_recorded", payment)
+
+    notifier.send(customer, msg)
+    return payment
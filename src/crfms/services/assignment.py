@@ -0,0 +1,168 @@
+import bisect
+import math
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from ..domain.fleet import Vehicle
+from ..domain.rental import Reservation
+
+# (km headroom, -fuel level, due time, tie breaker)
+Rank = Tuple[float, float, datetime, int]
+# (rank, position by due time, vehicle); ranks are unique thanks to the tie breaker
+Entry = Tuple[Rank, int, Optional[Vehicle]]
+
+_EMPTY: Entry = ((math.inf, math.inf, datetime.max, math.inf), -1, None)
+
+
+@dataclass(slots=True)
+class WavePlan:
+    """ Result of a batch assignment: reservation ID -> vehicle, plus what could not be served. """
+    assignments: Dict[UUID, Vehicle] = field(default_factory=dict)
+    unassigned: List[Reservation] = field(default_factory=list)
+
+
+def expected_km(reservation: Reservation, daily_allowance_km: int) -> int:
+    """ Distance a reservation is expected to drive: its allowance over the booked days. """
+    days = math.ceil((reservation.return_time - reservation.pickup_time) / timedelta(days=1))
+    return max(days, 1) * daily_allowance_km
+
+
+def plan_assignments(
+    reservations: Iterable[Reservation],
+    vehicles: Iterable[Vehicle],
+    daily_allowance_km: int
+) -> WavePlan:
+    """
+    Assigns vehicles to reservations in one pass, per vehicle class.
+
+    Reservations are served longest trip first. Each one gets the car with
+    the smallest km headroom (distance left until its next service) that
+    still covers the trip, so cars with a lot of headroom are kept for long
+    trips. Ties go to the fuller tank. A car whose next service falls due
+    before the reservation ends is never given to it. Reservations that no
+    car covers get the car with the most headroom left among those, if any.
+    All vehicles passed in must already be eligible (see can_be_assigned).
+    Runs in O((r + v) log v) for r reservations and v vehicles.
+    """
+    by_class: Dict[UUID, List[Vehicle]] = {}
+    for vehicle in vehicles:
+        by_class.setdefault(vehicle.vehicle_class.id, []).append(vehicle)
+
+    waves: Dict[UUID, List[Reservation]] = {}
+    for reservation in reservations:
+        waves.setdefault(reservation.vehicle_class.id, []).append(reservation)
+
+    plan = WavePlan()
+    for class_id, wave in waves.items():
+        _assign_class(wave, by_class.get(class_id, []), daily_allowance_km, plan)
+    return plan
+
+
+def _assign_class(
+    reservations: List[Reservation],
+    vehicles: List[Vehicle],
+    daily_allowance_km: int,
+    plan: WavePlan
+):
+    cars = sorted(
+        ((_rank(vehicle, tie), vehicle) for tie, vehicle in enumerate(vehicles)),
+        key=lambda car: car[0][2]
+    )
+    due_times = [rank[2] for rank, _ in cars]
+    ranked = sorted(range(len(cars)), key=lambda position: cars[position][0])
+    # Longest trip first; among equal trips the earlier pickup goes first
+    reservations = sorted(reservations, key=lambda r: r.pickup_time)
+    reservations.sort(
+        key=lambda r: (expected_km(r, daily_allowance_km), r.return_time),
+        reverse=True
+    )
+
+    # Cars are released into 'fitting' from the most headroom down, as the trips get shorter
+    fitting = _ByDueTime(due_times)
+    next_car = len(ranked) - 1
+    left_over: List[Reservation] = []
+
+    for reservation in reservations:
+        need = expected_km(reservation, daily_allowance_km)
+        while next_car >= 0 and cars[ranked[next_car]][0][0] >= need:
+            position = ranked[next_car]
+            fitting.put((cars[position][0], position, cars[position][1]))
+            next_car -= 1
+
+        vehicle = fitting.pop_serviceable(reservation.return_time)
+        if vehicle is None:
+            left_over.append(reservation)
+        else:
+            plan.assignments[reservation.id] = vehicle
+
+    # Trips no car fully covers: hand out what is left, most headroom first
+    assigned = {id(vehicle) for vehicle in plan.assignments.values()}
+    spare = _ByDueTime(due_times)
+    for position, (rank, vehicle) in enumerate(cars):
+        if id(vehicle) not in assigned:
+            spare.put(((-rank[0],) + rank[1:], position, vehicle))
+
+    for reservation in left_over:
+        vehicle = spare.pop_serviceable(reservation.return_time)
+        if vehicle is None:
+            plan.unassigned.append(reservation)
+        else:
+            plan.assignments[reservation.id] = vehicle
+
+
+class _ByDueTime:
+    """
+    Min segment tree over the cars of a class sorted by due time, so the best
+    car that will not fall due before a given time is found in O(log v).
+    """
+    def __init__(self, due_times: List[datetime]):
+        self._due_times = due_times
+        self._size = len(due_times)
+        self._tree: List[Entry] = [_EMPTY] * (2 * self._size)
+
+    def put(self, entry: Entry):
+        self._set(entry[1], entry)
+
+    def pop_serviceable(self, until: datetime) -> Optional[Vehicle]:
+        """ Removes and returns the best car whose due time is after 'until'. """
+        low = bisect.bisect_right(self._due_times, until) + self._size
+        high = 2 * self._size
+        best = _EMPTY
+        while low < high:
+            if low & 1:
+                best = min(best, self._tree[low])
+                low += 1
+            if high & 1:
+                high -= 1
+                best = min(best, self._tree[high])
+            low //= 2
+            high //= 2
+
+        if best is _EMPTY:
+            return None
+        self._set(best[1], _EMPTY)
+        return best[2]
+
+    def _set(self, position: int, entry: Entry):
+        node = position + self._size
+        self._tree[node] = entry
+        node //= 2
+        while node:
+            self._tree[node] = min(self._tree[2 * node], self._tree[2 * node + 1])
+            node //= 2
+
+
+def _rank(vehicle: Vehicle, tie: int) -> Rank:
+    headroom = math.inf
+    due_time = datetime.max
+    odometer = vehicle.odometer.value
+    for record in vehicle.maintenance_records:
+        due_odometer = record.due_odometer
+        if due_odometer is not None:
+            headroom = min(headroom, due_odometer - odometer)
+        record_due = record.due_time
+        if record_due is not None:
+            due_time = min(due_time, record_due)
+    return (headroom, -vehicle.fuel_level.value, due_time, tie)
@@ -0,0 +1,163 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ..domain.values import Money, Kilometers
+from ..domain.rental import RentalAgreement
+
+_US_PER_SECOND = 1e6
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+@dataclass(slots=True)
+class PricingBatch:
+    """
+    Returned agreements as columns, one row per agreement.
+    Times are datetime64[us], rates are int64 cents per day (0 when there
+    is no add-on or insurance), driven km is int64.
+    """
+    pickup_time: np.ndarray
+    return_time: np.ndarray
+    due_time: np.ndarray
+    base_rate: np.ndarray
+    add_on_rate: np.ndarray
+    insurance_rate: np.ndarray
+    driven_km: np.ndarray
+    start_fuel: np.ndarray
+    end_fuel: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.pickup_time)
+
+    @classmethod
+    def from_agreements(cls, agreements: Iterable[RentalAgreement]) -> 'PricingBatch':
+        """ Reads the columns off returned agreements. Raises ValueError for one still out. """
+        agreements = list(agreements)
+        for agreement in agreements:
+            if agreement.return_time is None or agreement.end_odometer is None or agreement.end_fuel_level is None:
+                raise ValueError("Cannot calculate charges before vehicle is returned.")
+
+        def times(values: List[datetime]) -> np.ndarray:
+            # Much faster than letting NumPy convert datetime objects
+            micros = [(value - _EPOCH) // _MICROSECOND for value in values]
+            return np.array(micros, dtype=np.int64).view("datetime64[us]")
+
+        def cents(values: List) -> np.ndarray:
+            return np.array(values, dtype=np.int64)
+
+        return cls(
+            pickup_time=times([a.pickup_time for a in agreements]),
+            return_time=times([a.return_time for a in agreements]),
+            due_time=times([a.due_time for a in agreements]),
+            base_rate=cents([a.vehicle.vehicle_class.base_rate.cents for a in agreements]),
+            add_on_rate=cents([
+                sum(add_on.daily_rate.cents for add_on in a.reservation.add_ons) for a in agreements
+            ]),
+            insurance_rate=cents([
+                a.reservation.insurance.daily_rate.cents if a.reservation.insurance is not None else 0
+                for a in agreements
+            ]),
+            driven_km=cents([a.end_odometer.value - a.start_odometer.value for a in agreements]),
+            start_fuel=np.array([a.start_fuel_level.value for a in agreements], dtype=np.float64),
+            end_fuel=np.array([a.end_fuel_level.value for a in agreements], dtype=np.float64),
+        )
+
+
+@dataclass(slots=True)
+class BatchCharges:
+    """ Charges per agreement in int64 cents, one array per charge kind. """
+    base: np.ndarray
+    add_ons: np.ndarray
+    insurance: np.ndarray
+    late_fee: np.ndarray
+    mileage_fee: np.ndarray
+    fuel_charge: np.ndarray
+
+    @property
+    def total(self) -> np.ndarray:
+        return self.base + self.add_ons + self.insurance + self.late_fee + self.mileage_fee + self.fuel_charge
+
+    def totals(self) -> List[Money]:
+        """ The total of every agreement as Money. """
+        return [Money.of_cents(cents) for cents in self.total.tolist()]
+
+
+class BatchPricingEngine:
+    """
+    Prices many returned agreements in one vectorized NumPy pass.
+
+    It computes the same charges as RentalAgreement.calculate_final_charges
+    with the standard rules (BaseDailyRateRule, PerDayAddOnRule,
+    InsuranceRule), cent for cent: durations use the same float rounding
+    as timedelta.total_seconds() and all amounts are integer cents.
+    """
+    def __init__(
+        self,
+        daily_mileage_allowance: Kilometers,
+        mileage_overage_fee_per_km: Money,
+        fuel_refill_charge: Money,
+        late_fee_per_hour: Money
+    ):
+        self.daily_mileage_allowance = daily_mileage_allowance
+        self.mileage_overage_fee_per_km = mileage_overage_fee_per_km
+        self.fuel_refill_charge = fuel_refill_charge
+        self.late_fee_per_hour = late_fee_per_hour
+
+    def price(self, batch: PricingBatch, base_rate: Optional[np.ndarray] = None) -> BatchCharges:
+        """
+        Charges for every row of the batch. 'base_rate' (cents per day)
+        replaces the batch's class rates, e.g. to try out a rate change.
+        """
+        base_rate = batch.base_rate if base_rate is None else base_rate
+        # Rules bill at least one day
+        days = np.maximum(_mileage_days(batch.pickup_time, batch.return_time), 1)
+        late_fee, mileage_fee, fuel_charge = self.penalties(
+            batch.pickup_time, batch.return_time, batch.due_time,
+            batch.driven_km, batch.start_fuel, batch.end_fuel
+        )
+
+        return BatchCharges(
+            base=base_rate * days,
+            add_ons=batch.add_on_rate * days,
+            insurance=batch.insurance_rate * days,
+            late_fee=late_fee,
+            mileage_fee=mileage_fee,
+            fuel_charge=fuel_charge,
+        )
+
+    def penalties(
+        self,
+        pickup_time: np.ndarray,
+        return_time: np.ndarray,
+        due_time: np.ndarray,
+        driven_km: np.ndarray,
+        start_fuel: np.ndarray,
+        end_fuel: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The late fee, mileage overage fee and fuel refill charge (int64 cents)
+        of every row: the charges that depend on this engine's settings.
+        """
+        mileage_days = _mileage_days(pickup_time, return_time)
+
+        # Started hours late, with the first hour free
+        seconds_late = (return_time - due_time).astype(np.int64) / _US_PER_SECOND
+        hours_late = np.where(seconds_late > 3600, np.ceil(seconds_late / 3600), 0).astype(np.int64)
+
+        overage_km = driven_km - self.daily_mileage_allowance.value * mileage_days
+        overage_km = np.maximum(overage_km, 0)
+
+        return (
+            self.late_fee_per_hour.cents * hours_late,
+            self.mileage_overage_fee_per_km.cents * overage_km,
+            np.where(end_fuel < start_fuel, self.fuel_refill_charge.cents, 0).astype(np.int64),
+        )
+
+
+def _mileage_days(pickup_time: np.ndarray, return_time: np.ndarray) -> np.ndarray:
+    """ Started days, like ceil(total_seconds() / 86400). """
+    seconds = (return_time - pickup_time).astype(np.int64) / _US_PER_SECOND
+    return np.ceil(seconds / 86400).astype(np.int64)
@@ -0,0 +1,310 @@
+import random
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+from uuid import UUID
+
+from ..domain.fleet import Vehicle, VehicleState, MaintenanceRecord
+from ..domain.rental import Reservation, RentalAgreement
+
+if TYPE_CHECKING:
+    from .database import Database
+
+Partition = Tuple[UUID, UUID]  # (location ID, vehicle class ID)
+Event = Tuple[Partition, datetime, int]
+
+
+class _Node:
+    """ Treap node: the net change in free vehicles at one instant. """
+    __slots__ = ("time", "delta", "count", "priority", "total", "min_prefix", "left", "right")
+
+    def __init__(self, time: datetime, delta: int):
+        self.time = time
+        self.delta = delta
+        self.count = 1
+        self.priority = random.random()
+        self.total = delta
+        self.min_prefix = delta
+        self.left: Optional['_Node'] = None
+        self.right: Optional['_Node'] = None
+
+    def update(self):
+        """ Recomputes the subtree sum and the lowest running sum inside it. """
+        total = self.delta
+        lowest = self.delta
+        if self.left is not None:
+            total = self.left.total + self.delta
+            lowest = min(self.left.min_prefix, total)
+        if self.right is not None:
+            lowest = min(lowest, total + self.right.min_prefix)
+            total += self.right.total
+        self.total = total
+        self.min_prefix = lowest
+
+
+class CapacityTimeline:
+    """
+    Changes in the number of free vehicles of one class at one location
+    over time: -1 when a booked car leaves, +1 when one is due back.
+    It is a treap ordered by time where every node also keeps the sum
+    of its subtree and the lowest running sum within it, so the fewest
+    free vehicles over any window is found in O(log n).
+    """
+    def __init__(self):
+        self._root: Optional[_Node] = None
+
+    def __bool__(self) -> bool:
+        return self._root is not None
+
+    def add(self, time: datetime, delta: int):
+        left, rest = self._split(self._root, time, inclusive=False)
+        node, right = self._split(rest, time, inclusive=True)
+        if node is None:
+            node = _Node(time, delta)
+        else:
+            node.delta += delta
+            node.count += 1
+            node.update()
+        self._root = self._merge(self._merge(left, node), right)
+
+    def remove(self, time: datetime, delta: int):
+        left, rest = self._split(self._root, time, inclusive=False)
+        node, right = self._split(rest, time, inclusive=True)
+        if node is not None:
+            node.delta -= delta
+            node.count -= 1
+            if node.count == 0:
+                node = None
+            else:
+                node.update()
+        self._root = self._merge(self._merge(left, node), right)
+
+    def lowest(self, start: datetime, end: Optional[datetime] = None) -> int:
+        """
+        The lowest running sum over [start, end) (open-ended when end is None),
+        counting every change made up to and including 'start'.
+        """
+        before, rest = self._split(self._root, start, inclusive=True)
+        if end is None:
+            window, after = rest, None
+        else:
+            window, after = self._split(rest, end, inclusive=False)
+
+        at_start = before.total if before is not None else 0
+        lowest = at_start
+        if window is not None:
+            lowest = min(lowest, at_start + window.min_prefix)
+
+        self._root = self._merge(self._merge(before, window), after)
+        return lowest
+
+    def _split(self, node: Optional[_Node], time: datetime, inclusive: bool) -> Tuple[Optional[_Node], Optional[_Node]]:
+        """ Splits into (times before 'time', or up to it when inclusive) and the rest. """
+        if node is None:
+            return None, None
+
+        goes_left = node.time <= time if inclusive else node.time < time
+        if goes_left:
+            node.right, right = self._split(node.right, time, inclusive)
+            node.update()
+            return node, right
+
+        left, node.left = self._split(node.left, time, inclusive)
+        node.update()
+        return left, node
+
+    def _merge(self, left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+        if left is None:
+            return right
+        if right is None:
+            return left
+
+        if left.priority > right.priority:
+            left.right = self._merge(left.right, right)
+            left.update()
+            return left
+
+        right.left = self._merge(left, right.left)
+        right.update()
+        return right
+
+
+class _View:
+    """ Adapts three callbacks to the view interface of an IndexedTable. """
+    __slots__ = ("add", "remove", "update")
+
+    def __init__(self, add: Callable, remove: Callable, update: Callable):
+        self.add = add
+        self.remove = remove
+        self.update = update
+
+
+class CapacityIndex:
+    """
+    Forward-looking count of free vehicles per (location, vehicle class).
+
+    The base is the number of cars of the class on the lot that can be
+    booked: in a BOOKABLE_STATE and not due for service by distance.
+    On top of that, one CapacityTimeline per partition holds:
+      - bookable cars with a plan due by date: -1 at the due time;
+      - active reservations not picked up yet: -1 at the pickup branch at
+        pickup time, +1 at the return branch at return time;
+      - open rental agreements: +1 at the return branch at the due time.
+    Views on the vehicle, reservation and agreement tables keep all of it
+    current, including changes made by journal replay or snapshot loads.
+    """
+    # Cleaning is turned around before any later pickup; a reserved car
+    # is held by a reservation that is already on the timeline.
+    BOOKABLE_STATES = (VehicleState.AVAILABLE, VehicleState.RESERVED, VehicleState.CLEANING)
+
+    def __init__(self, db: 'Database'):
+        self._db = db
+        self._on_lot: Dict[Partition, int] = {}
+        self._stocked: Dict[Partition, int] = {}
+        self._timelines: Dict[Partition, CapacityTimeline] = {}
+        self._vehicles: Dict[UUID, Vehicle] = {}
+        self._vehicle_slots: Dict[UUID, Tuple[Partition, bool]] = {}
+        self._events: Dict[Tuple[str, UUID], List[Event]] = {}
+        self._agreement_reservations: Dict[UUID, Reservation] = {}
+
+        for key, vehicle in db.vehicles.items():
+            self._vehicle_added(key, vehicle)
+        for key, reservation in db.reservations.items():
+            self._reservation_added(key, reservation)
+        for key, agreement in db.rental_agreements.items():
+            self._agreement_added(key, agreement)
+
+        db.vehicles.attach(_View(self._vehicle_added, self._vehicle_removed, self._vehicle_changed))
+        db.reservations.attach(_View(self._reservation_added, self._reservation_removed, self._reservation_changed))
+        db.rental_agreements.attach(_View(self._agreement_added, self._agreement_removed, self._agreement_changed))
+
+    def free(
+        self,
+        location_id: UUID,
+        class_id: UUID,
+        start: datetime,
+        end: Optional[datetime] = None
+    ) -> int:
+        """ The fewest free vehicles of a class at a location at any time in [start, end). """
+        partition = (location_id, class_id)
+        on_lot = self._on_lot.get(partition, 0)
+        timeline = self._timelines.get(partition)
+        if not timeline:
+            return on_lot
+        return on_lot + timeline.lowest(start, end)
+
+    def stocks(self, location_id: UUID, class_id: UUID) -> bool:
+        """ Whether any car of the class, in whatever state, belongs to the location. """
+        return (location_id, class_id) in self._stocked
+
+    # Vehicles: the count on the lot
+
+    def _vehicle_added(self, key: UUID, vehicle: Vehicle):
+        partition = (vehicle.location.id, vehicle.vehicle_class.id)
+        bookable = vehicle.state in self.BOOKABLE_STATES and not _due_by_km(vehicle)
+        self._vehicles[key] = vehicle
+        self._vehicle_slots[key] = (partition, bookable)
+        self._stocked[partition] = self._stocked.get(partition, 0) + 1
+
+        events: List[Event] = []
+        if bookable:
+            self._on_lot[partition] = self._on_lot.get(partition, 0) + 1
+            due_times = [record.due_time for record in vehicle.maintenance_records if record.due_time is not None]
+            if due_times:
+                events = [(partition, min(due_times), -1)]
+        self._set_events(("vehicle", key), events)
+
+        for record in vehicle.maintenance_records:
+            record.watch(self._on_plan_changed)
+
+    def _vehicle_removed(self, key: UUID):
+        vehicle = self._vehicles.pop(key)
+        for record in vehicle.maintenance_records:
+            record.unwatch(self._on_plan_changed)
+
+        partition, bookable = self._vehicle_slots.pop(key)
+        if bookable:
+            self._on_lot[partition] -= 1
+        self._stocked[partition] -= 1
+        if not self._stocked[partition]:
+            del self._stocked[partition]
+        self._set_events(("vehicle", key), [])
+
+    def _vehicle_changed(self, vehicle: Vehicle, attribute: str, old_value: Any):
+        if attribute != "fuel_level":
+            self._vehicle_removed(vehicle.id)
+            self._vehicle_added(vehicle.id, vehicle)
+
+    def _on_plan_changed(self, record: MaintenanceRecord, attribute: str, old_value: Any):
+        vehicle = record.vehicle
+        if self._vehicles.get(vehicle.id) is vehicle:
+            self._vehicle_changed(vehicle, "maintenance_records", None)
+
+    # Reservations and agreements: the timelines
+
+    def _reservation_added(self, key: UUID, reservation: Reservation):
+        events: List[Event] = []
+        if (
+            reservation.status in self._db.reservations.ACTIVE_STATUSES
+            and self._db.rental_agreements.for_reservation(reservation.id) is None
+        ):
+            class_id = reservation.vehicle_class.id
+            events = [
+                ((reservation.pickup_location.id, class_id), reservation.pickup_time, -1),
+                ((reservation.return_location.id, class_id), reservation.return_time, 1),
+            ]
+        self._set_events(("reservation", key), events)
+
+    def _reservation_removed(self, key: UUID):
+        self._set_events(("reservation", key), [])
+
+    def _reservation_changed(self, reservation: Reservation, attribute: str, old_value: Any):
+        self._reservation_added(reservation.id, reservation)
+
+    def _agreement_added(self, key: UUID, agreement: RentalAgreement):
+        events: List[Event] = []
+        if agreement.return_time is None:
+            partition = (agreement.reservation.return_location.id, agreement.vehicle.vehicle_class.id)
+            events = [(partition, agreement.due_time, 1)]
+        self._set_events(("agreement", key), events)
+
+        previous = self._agreement_reservations.get(key)
+        self._agreement_reservations[key] = agreement.reservation
+        self._refresh_reservation(agreement.reservation)
+        if previous is not None and previous is not agreement.reservation:
+            self._refresh_reservation(previous)
+
+    def _agreement_removed(self, key: UUID):
+        self._set_events(("agreement", key), [])
+        reservation = self._agreement_reservations.pop(key, None)
+        if reservation is not None:
+            self._refresh_reservation(reservation)
+
+    def _agreement_changed(self, agreement: RentalAgreement, attribute: str, old_value: Any):
+        if attribute in ("reservation", "due_time", "return_time"):
+            self._agreement_added(agreement.id, agreement)
+
+    def _refresh_reservation(self, reservation: Reservation):
+        if self._db.reservations.get(reservation.id) is reservation:
+            self._reservation_added(reservation.id, reservation)
+
+    def _set_events(self, source: Tuple[str, UUID], events: List[Event]):
+        for partition, time, delta in self._events.pop(source, []):
+            timeline = self._timelines[partition]
+            timeline.remove(time, delta)
+            if not timeline:
+                del self._timelines[partition]
+
+        for partition, time, delta in events:
+            timeline = self._timelines.get(partition)
+            if timeline is None:
+                timeline = self._timelines[partition] = CapacityTimeline()
+            timeline.add(time, delta)
+        if events:
+            self._events[source] = events
+
+
+def _due_by_km(vehicle: Vehicle) -> bool:
+    return any(
+        record.due_odometer is not None and vehicle.odometer.value >= record.due_odometer
+        for record in vehicle.maintenance_records
+    )
@@ -1,9 +1,275 @@
 from dataclasses import dataclass, field
-from typing import Dict
+from datetime import datetime
+from typing import Dict, FrozenSet, List, Optional, Tuple, Any, TYPE_CHECKING
 from uuid import UUID
 from ..domain.users import Customer, BranchAgent
-from ..domain.fleet import Location, Vehicle, VehicleClass, AddOn, InsuranceTier
-from ..domain.rental import Reservation, RentalAgreement, Invoice, BillingPayment
+from ..domain.fleet import Location, Vehicle, VehicleClass, VehicleState, AddOn, InsuranceTier
+from ..domain.rental import Reservation, ReservationStatus, RentalAgreement, Invoice, BillingPayment
+from .intervals import IntervalTree
+
+if TYPE_CHECKING:
+    from .fleet_columns import FleetColumns
+    from .due_schedule import DueSchedule
+    from .capacity import CapacityIndex
+    from .inventory import AvailabilityCache
+
+
+class IndexedTable(dict):
+    """
+    Base for entity dicts that keep secondary indexes.
+    Subclasses fill in _add and _remove; this class calls them
+    on every write and again whenever a stored entity reports
+    a change to one of the INDEXED attributes (None: all watched ones).
+    Attached views are told about every insert, delete and change.
+    """
+    INDEXED: Optional[FrozenSet[str]] = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self._views: List[Any] = []
+        self.update(*args, **kwargs)
+
+    def attach(self, view: Any):
+        """
+        Registers a derived view. It has add(key, entity), remove(key) and
+        update(entity, attribute, old_value) methods and already holds the
+        entities that are in the table now.
+        """
+        self._views.append(view)
+
+    def detach(self, view: Any):
+        self._views.remove(view)
+
+    def __setitem__(self, key: UUID, entity: Any):
+        if key in self:
+            del self[key]
+        super().__setitem__(key, entity)
+        self._add(key, entity)
+        entity.watch(self._on_entity_changed)
+        for view in self._views:
+            view.add(key, entity)
+
+    def __delitem__(self, key: UUID):
+        self._remove(key)
+        dict.__getitem__(self, key).unwatch(self._on_entity_changed)
+        super().__delitem__(key)
+        for view in self._views:
+            view.remove(key)
+
+    def pop(self, key: UUID, *default):
+        if key not in self:
+            return super().pop(key, *default)
+        entity = self[key]
+        del self[key]
+        return entity
+
+    def popitem(self):
+        key = next(reversed(self))
+        return key, self.pop(key)
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+    def update(self, *args, **kwargs):
+        for key, entity in dict(*args, **kwargs).items():
+            self[key] = entity
+
+    def setdefault(self, key: UUID, default: Any = None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def _add(self, key: UUID, entity: Any):
+        raise NotImplementedError
+
+    def _remove(self, key: UUID):
+        raise NotImplementedError
+
+    def _on_entity_changed(self, entity: Any, attribute: str, old_value: Any):
+        """ Re-indexes an entity after one of its watched attributes changed. """
+        if self.INDEXED is None or attribute in self.INDEXED:
+            if dict.get(self, entity.id) is entity:
+                keys = [entity.id]
+            else:
+                keys = [k for k, v in self.items() if v is entity]
+
+            for key in keys:
+                self._remove(key)
+                self._add(key, entity)
+
+        for view in self._views:
+            view.update(entity, attribute, old_value)
+
+    @staticmethod
+    def _discard(index: Dict[Any, Dict[UUID, Any]], bucket_key: Any, key: UUID):
+        bucket = index.get(bucket_key)
+        if bucket is None:
+            return
+        bucket.pop(key, None)
+        if not bucket:
+            del index[bucket_key]
+
+
+class VehicleTable(IndexedTable):
+    """
+    Vehicle storage with secondary indexes.
+    Keeps vehicles grouped by location, by (location, class) and by state.
+    The indexes follow the vehicles when they move or change state.
+    """
+    INDEXED = frozenset({"state", "location", "vehicle_class"})
+
+    def __init__(self, *args, **kwargs):
+        self._columns: Optional['FleetColumns'] = None
+        self._due_schedule: Optional['DueSchedule'] = None
+        self._availability: Optional['AvailabilityCache'] = None
+        self._by_location: Dict[UUID, Dict[UUID, Vehicle]] = {}
+        self._by_location_class: Dict[UUID, Dict[UUID, Dict[UUID, Vehicle]]] = {}
+        self._by_state: Dict[VehicleState, Dict[UUID, Vehicle]] = {}
+        self._keys: Dict[UUID, Tuple[UUID, UUID, VehicleState]] = {}
+        super().__init__(*args, **kwargs)
+
+    # Index queries
+
+    def at_location(self, location_id: UUID) -> List[Vehicle]:
+        """ All vehicles currently at a location. """
+        return list(self._by_location.get(location_id, {}).values())
+
+    def of_class_at(self, location_id: UUID, class_id: UUID) -> List[Vehicle]:
+        """ Vehicles of one class at a location. """
+        classes = self._by_location_class.get(location_id, {})
+        return list(classes.get(class_id, {}).values())
+
+    def classes_at(self, location_id: UUID) -> List[UUID]:
+        """ IDs of the vehicle classes that have vehicles at a location. """
+        return list(self._by_location_class.get(location_id, {}))
+
+    def in_state(self, state: VehicleState) -> List[Vehicle]:
+        """ All vehicles in the given state. """
+        return list(self._by_state.get(state, {}).values())
+
+    def columnar(self) -> 'FleetColumns':
+        """
+        Columnar NumPy copy of the fleet for vectorized queries.
+        Built on first use, then kept in sync with every write. Needs numpy.
+        """
+        if self._columns is None:
+            from .fleet_columns import FleetColumns
+            self._columns = FleetColumns(self.items())
+            self.attach(self._columns)
+        return self._columns
+
+    def due_schedule(self) -> 'DueSchedule':
+        """ Priority queues of the fleet's maintenance plans. Built on first use, then kept in sync. """
+        if self._due_schedule is None:
+            from .due_schedule import DueSchedule
+            self._due_schedule = DueSchedule(self.items())
+            self.attach(self._due_schedule)
+        return self._due_schedule
+
+    def availability_cache(self) -> 'AvailabilityCache':
+        """ Availability counts shared by every InventoryService on this table. Built on first use, then kept in sync. """
+        if self._availability is None:
+            from .inventory import AvailabilityCache
+            self._availability = AvailabilityCache(self)
+            self.attach(self._availability)
+        return self._availability
+
+    # Index maintenance
+
+    def _add(self, key: UUID, vehicle: Vehicle):
+        location_id = vehicle.location.id
+        class_id = vehicle.vehicle_class.id
+        self._keys[key] = (location_id, class_id, vehicle.state)
+
+        self._by_location.setdefault(location_id, {})[key] = vehicle
+        classes = self._by_location_class.setdefault(location_id, {})
+        classes.setdefault(class_id, {})[key] = vehicle
+        self._by_state.setdefault(vehicle.state, {})[key] = vehicle
+
+    def _remove(self, key: UUID):
+        location_id, class_id, state = self._keys.pop(key)
+
+        self._discard(self._by_location, location_id, key)
+        classes = self._by_location_class.get(location_id, {})
+        self._discard(classes, class_id, key)
+        if not classes:
+            self._by_location_class.pop(location_id, None)
+        self._discard(self._by_state, state, key)
+
+
+class ReservationTable(IndexedTable):
+    """
+    Reservation storage with an interval index.
+    Active reservations (pending or confirmed) are kept in one
+    interval tree per (vehicle class, pickup location), so overlap
+    checks only look at bookings that can actually compete.
+    """
+    ACTIVE_STATUSES = (ReservationStatus.PENDING, ReservationStatus.CONFIRMED)
+
+    def __init__(self, *args, **kwargs):
+        self._trees: Dict[Tuple[UUID, UUID], IntervalTree] = {}
+        self._keys: Dict[UUID, Tuple[Tuple[UUID, UUID], datetime]] = {}
+        super().__init__(*args, **kwargs)
+
+    def overlapping(
+        self,
+        class_id: UUID,
+        location_id: UUID,
+        start: datetime,
+        end: datetime
+    ) -> List[Reservation]:
+        """ Active reservations of a class at a pickup location that overlap [start, end). """
+        tree = self._trees.get((class_id, location_id))
+        if tree is None:
+            return []
+        return tree.overlapping(start, end)
+
+    def _add(self, key: UUID, reservation: Reservation):
+        if reservation.status not in self.ACTIVE_STATUSES:
+            return
+
+        partition = (reservation.vehicle_class.id, reservation.pickup_location.id)
+        tree = self._trees.get(partition)
+        if tree is None:
+            tree = self._trees[partition] = IntervalTree()
+
+        tree.add(reservation.pickup_time, reservation.return_time, key, reservation)
+        self._keys[key] = (partition, reservation.pickup_time)
+
+    def _remove(self, key: UUID):
+        if key not in self._keys:
+            return
+
+        partition, start = self._keys.pop(key)
+        tree = self._trees[partition]
+        tree.remove(start, key)
+        if not tree:
+            del self._trees[partition]
+
+
+class AgreementTable(IndexedTable):
+    """ Rental agreement storage, indexed by the reservation each agreement fulfils. """
+    INDEXED = frozenset({"reservation"})
+
+    def __init__(self, *args, **kwargs):
+        self._by_reservation: Dict[UUID, Dict[UUID, RentalAgreement]] = {}
+        self._keys: Dict[UUID, UUID] = {}
+        super().__init__(*args, **kwargs)
+
+    def for_reservation(self, reservation_id: UUID) -> Optional[RentalAgreement]:
+        """ The agreement a reservation was picked up under, if any. """
+        agreements = self._by_reservation.get(reservation_id)
+        return next(iter(agreements.values())) if agreements else None
+
+    def _add(self, key: UUID, agreement: RentalAgreement):
+        reservation_id = agreement.reservation.id
+        self._keys[key] = reservation_id
+        self._by_reservation.setdefault(reservation_id, {})[key] = agreement
+
+    def _remove(self, key: UUID):
+        self._discard(self._by_reservation, self._keys.pop(key), key)
+
 
 @dataclass
 class Database:
@@ -12,11 +278,30 @@ class Database:
     agents: Dict[UUID, BranchAgent] = field(default_factory=dict)
     locations: Dict[UUID, Location] = field(default_factory=dict)
     vehicle_classes: Dict[UUID, VehicleClass] = field(default_factory=dict)
-    vehicles: Dict[UUID, Vehicle] = field(default_factory=dict)
+    vehicles: VehicleTable = field(default_factory=VehicleTable)
     add_ons: Dict[UUID, AddOn] = field(default_factory=dict)
     insurance_tiers: Dict[UUID, InsuranceTier] = field(default_factory=dict)
-    reservations: Dict[UUID, Reservation] = field(default_factory=dict)
-    rental_agreements: Dict[UUID, RentalAgreement] = field(default_factory=dict)
+    reservations: ReservationTable = field(default_factory=ReservationTable)
+    rental_agreements: AgreementTable = field(default_factory=AgreementTable)
     invoices: Dict[UUID, Invoice] = field(default_factory=dict)
     payments: Dict[UUID, BillingPayment] = field(default_factory=dict)
-    
\ No newline at end of file
+
+    # Lookup indexes, kept current by the services
+    agreements_by_token: Dict[str, RentalAgreement] = field(default_factory=dict)
+    invoices_by_agreement: Dict[UUID, Invoice] = field(default_factory=dict)
+
+    def __post_init__(self):
+        if not isinstance(self.vehicles, VehicleTable):
+            self.vehicles = VehicleTable(self.vehicles)
+        if not isinstance(self.reservations, ReservationTable):
+            self.reservations = ReservationTable(self.reservations)
+        if not isinstance(self.rental_agreements, AgreementTable):
+            self.rental_agreements = AgreementTable(self.rental_agreements)
+        self._capacity: Optional['CapacityIndex'] = None
+
+    def capacity(self) -> 'CapacityIndex':
+        """ Forward-looking free-vehicle counts per (location, class). Built on first use. """
+        if self._capacity is None:
+            from .capacity import CapacityIndex
+            self._capacity = CapacityIndex(self)
+        return self._capacity
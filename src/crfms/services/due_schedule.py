@@ -0,0 +1,165 @@
+import heapq
+from datetime import datetime
+from itertools import count
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from ..domain.fleet import Vehicle, MaintenanceRecord
+
+Entry = Tuple[Any, int, MaintenanceRecord]
+
+
+class DueSchedule:
+    """
+    Maintenance plans of a VehicleTable in two priority queues per location:
+    one ordered by due time, one by km headroom (due odometer minus
+    the vehicle's current odometer).
+    A plan is re-armed, i.e. pushed again with a new sequence number,
+    whenever its thresholds, last service or the vehicle's odometer or
+    location change. Older entries for it are skipped when met and
+    dropped when the heaps are rebuilt.
+    """
+    def __init__(self, vehicles: Iterable[Tuple[UUID, Vehicle]] = ()):
+        self._by_time: Dict[UUID, List[Entry]] = {}  # location ID -> heap
+        self._by_km: Dict[UUID, List[Entry]] = {}
+        self._entries = 0
+        self._current: Dict[UUID, int] = {}
+        self._vehicles: Dict[UUID, Vehicle] = {}
+        self._sequence = count()
+
+        for key, vehicle in vehicles:
+            self.add(key, vehicle)
+
+    def __len__(self) -> int:
+        """ Number of plans being tracked. """
+        return len(self._current)
+
+    # Queries
+
+    def due(self, now: datetime, location_id: Optional[UUID] = None) -> List[MaintenanceRecord]:
+        """
+        Plans that are due at 'now', fleet-wide or at one location.
+        Found in O(k log k) for k due plans (plus one heap top per location fleet-wide).
+        """
+        found: Dict[UUID, MaintenanceRecord] = {}
+        for heap in self._heaps(self._by_time, location_id):
+            for record, _ in self._walk(heap, now):
+                found[record.id] = record
+        for heap in self._heaps(self._by_km, location_id):
+            for record, _ in self._walk(heap, 0):
+                found.setdefault(record.id, record)
+        return list(found.values())
+
+    def due_vehicles(self, now: datetime, location_id: Optional[UUID] = None) -> List[Vehicle]:
+        """ Vehicles with at least one due plan, fleet-wide or at one location. """
+        vehicles: Dict[int, Vehicle] = {}
+        for record in self.due(now, location_id):
+            vehicles.setdefault(id(record.vehicle), record.vehicle)
+        return list(vehicles.values())
+
+    def next_by_time(self, limit: int) -> List[Tuple[Vehicle, datetime]]:
+        """ The next 'limit' vehicles to come due by time, with their earliest due time. """
+        return self._first_vehicles(self._by_time, limit)
+
+    def next_by_km(self, limit: int) -> List[Tuple[Vehicle, int]]:
+        """ The next 'limit' vehicles to come due by distance, with their km headroom. """
+        return self._first_vehicles(self._by_km, limit)
+
+    def _first_vehicles(self, heaps: Dict[UUID, List[Entry]], limit: int) -> List[Tuple[Vehicle, Any]]:
+        first: Dict[int, Tuple[Vehicle, Any]] = {}
+        walks = [self._walk(heap) for heap in heaps.values()]
+        for record, key in heapq.merge(*walks, key=lambda pair: pair[1]):
+            if len(first) >= limit:
+                break
+            first.setdefault(id(record.vehicle), (record.vehicle, key))
+        return list(first.values())
+
+    @staticmethod
+    def _heaps(heaps: Dict[UUID, List[Entry]], location_id: Optional[UUID]) -> List[List[Entry]]:
+        if location_id is None:
+            return list(heaps.values())
+        return [heaps[location_id]] if location_id in heaps else []
+
+    def _walk(self, heap: List[Entry], limit: Any = None) -> Iterator[Tuple[MaintenanceRecord, Any]]:
+        """
+        Yields the current entries of a heap in priority order, stopping past 'limit'.
+        Walks the heap array best-first, so only the entries yielded (plus
+        their direct children) are looked at, not the whole heap.
+        """
+        if not heap:
+            return
+
+        frontier = [(heap[0], 0)]
+        while frontier:
+            entry, index = heapq.heappop(frontier)
+            key, sequence, record = entry
+            if limit is not None and key > limit:
+                return
+
+            if self._current.get(record.id) == sequence:
+                yield record, key
+
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+
+    # Plan tracking, called by VehicleTable
+
+    def add(self, key: UUID, vehicle: Vehicle):
+        self._vehicles[key] = vehicle
+        for record in vehicle.maintenance_records:
+            self._track(record)
+
+    def remove(self, key: UUID):
+        vehicle = self._vehicles.pop(key)
+        for record in vehicle.maintenance_records:
+            record.unwatch(self._on_plan_changed)
+            self._current.pop(record.id, None)
+
+    def update(self, vehicle: Vehicle, attribute: str, old_value: Any):
+        if attribute in ("odometer", "location"):
+            for record in vehicle.maintenance_records:
+                if record.id in self._current:
+                    self._arm(record)
+        elif attribute == "maintenance_records":
+            for record in vehicle.maintenance_records:
+                if record.id not in self._current:
+                    self._track(record)
+
+    def _track(self, record: MaintenanceRecord):
+        record.watch(self._on_plan_changed)
+        self._arm(record)
+
+    def _on_plan_changed(self, record: MaintenanceRecord, attribute: str, old_value: Any):
+        if record.id in self._current:
+            self._arm(record)
+
+    def _arm(self, record: MaintenanceRecord):
+        sequence = next(self._sequence)
+        self._current[record.id] = sequence
+
+        location_id = record.vehicle.location.id
+        due_time = record.due_time
+        if due_time is not None:
+            heapq.heappush(self._by_time.setdefault(location_id, []), (due_time, sequence, record))
+            self._entries += 1
+        due_odometer = record.due_odometer
+        if due_odometer is not None:
+            headroom = due_odometer - record.vehicle.odometer.value
+            heapq.heappush(self._by_km.setdefault(location_id, []), (headroom, sequence, record))
+            self._entries += 1
+
+        # Rebuild once outdated entries outnumber the live ones
+        if self._entries > 4 * len(self._current) + 64:
+            self._compact()
+
+    def _compact(self):
+        self._entries = 0
+        for heaps in (self._by_time, self._by_km):
+            for location_id, heap in list(heaps.items()):
+                heap[:] = [entry for entry in heap if self._current.get(entry[2].id) == entry[1]]
+                if heap:
+                    heapq.heapify(heap)
+                    self._entries += len(heap)
+                else:
+                    del heaps[location_id]
@@ -0,0 +1,269 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+
+from ..domain.fleet import Vehicle, VehicleClass, VehicleState, MaintenanceRecord
+
+_NEVER_KM = np.iinfo(np.int64).max
+_NEVER = np.datetime64("NaT", "us")
+_AVAILABLE = VehicleState.AVAILABLE.value
+
+
+class FleetColumns:
+    """
+    Columnar copy of a VehicleTable, one NumPy array per attribute.
+    Each vehicle is one row holding its odometer, fuel level, state code,
+    location and class index, and the odometer/time at which its next
+    maintenance falls due. The table and the watchers on vehicles and their
+    maintenance records keep the rows current, so fleet-wide questions are
+    answered with vectorized operations instead of Python loops.
+    """
+    def __init__(self, vehicles: Iterable[Tuple[UUID, Vehicle]] = (), capacity: int = 1024):
+        self._size = 0
+        self._rows: Dict[UUID, int] = {}
+        self._keys: List[UUID] = []
+        self._vehicles: List[Vehicle] = []
+
+        self._location_index: Dict[UUID, int] = {}
+        self._location_ids: List[UUID] = []
+        self._class_index: Dict[UUID, int] = {}
+        self._classes: List[VehicleClass] = []
+
+        self._odometer = np.zeros(capacity, dtype=np.int64)
+        self._fuel = np.zeros(capacity, dtype=np.float64)
+        self._state = np.zeros(capacity, dtype=np.int8)
+        self._location = np.zeros(capacity, dtype=np.int32)
+        self._class = np.zeros(capacity, dtype=np.int32)
+        self._due_odometer = np.full(capacity, _NEVER_KM, dtype=np.int64)
+        self._due_time = np.full(capacity, _NEVER, dtype="datetime64[us]")
+
+        for key, vehicle in vehicles:
+            self.add(key, vehicle)
+
+    def __len__(self) -> int:
+        return self._size
+
+    # Column views (length = number of vehicles)
+
+    @property
+    def odometer(self) -> np.ndarray:
+        return self._odometer[:self._size]
+
+    @property
+    def fuel(self) -> np.ndarray:
+        return self._fuel[:self._size]
+
+    @property
+    def state(self) -> np.ndarray:
+        """ VehicleState values. """
+        return self._state[:self._size]
+
+    @property
+    def location(self) -> np.ndarray:
+        """ Location indexes; location_id(i) maps them back. """
+        return self._location[:self._size]
+
+    @property
+    def vehicle_class(self) -> np.ndarray:
+        """ Class indexes; vehicle_class_at(i) maps them back. """
+        return self._class[:self._size]
+
+    @property
+    def due_odometer(self) -> np.ndarray:
+        """ Odometer reading at which the next service falls due. """
+        return self._due_odometer[:self._size]
+
+    @property
+    def due_time(self) -> np.ndarray:
+        """ Time at which the next service falls due (NaT when there is none). """
+        return self._due_time[:self._size]
+
+    def location_id(self, index: int) -> UUID:
+        return self._location_ids[index]
+
+    def vehicle_class_at(self, index: int) -> VehicleClass:
+        return self._classes[index]
+
+    def vehicle_class_by_id(self, class_id: UUID) -> VehicleClass:
+        return self._classes[self._class_index[class_id]]
+
+    def vehicle(self, row: int) -> Vehicle:
+        return self._vehicles[row]
+
+    # Row maintenance, called by VehicleTable
+
+    def add(self, key: UUID, vehicle: Vehicle):
+        if key in self._rows:
+            self.remove(key)
+        if self._size == len(self._odometer):
+            self._grow()
+
+        row = self._size
+        self._size += 1
+        self._rows[key] = row
+        self._keys.append(key)
+        self._vehicles.append(vehicle)
+        self._fill(row, vehicle)
+
+    def remove(self, key: UUID):
+        """ Removes a row by moving the last row into its place. """
+        row = self._rows.pop(key)
+        last = self._size - 1
+        for record in self._vehicles[row].maintenance_records:
+            record.unwatch(self._on_record_changed)
+
+        if row != last:
+            for column in self._columns():
+                column[row] = column[last]
+            self._keys[row] = self._keys[last]
+            self._vehicles[row] = self._vehicles[last]
+            self._rows[self._keys[row]] = row
+
+        self._keys.pop()
+        self._vehicles.pop()
+        self._size = last
+
+    def update(self, vehicle: Vehicle, attribute: str, old_value: Any):
+        """ Refreshes the row of a vehicle after one of its attributes changed. """
+        row = self._row_of(vehicle)
+        if row is not None:
+            self._fill(row, vehicle)
+
+    def _row_of(self, vehicle: Vehicle) -> Optional[int]:
+        row = self._rows.get(vehicle.id)
+        if row is not None and self._vehicles[row] is vehicle:
+            return row
+        for row, stored in enumerate(self._vehicles):
+            if stored is vehicle:
+                return row
+        return None
+
+    def _fill(self, row: int, vehicle: Vehicle):
+        self._odometer[row] = vehicle.odometer.value
+        self._fuel[row] = vehicle.fuel_level.value
+        self._state[row] = vehicle.state.value
+        self._location[row] = self._index_location(vehicle.location.id)
+        self._class[row] = self._index_class(vehicle.vehicle_class)
+
+        due_km = _NEVER_KM
+        due_time = None
+        for record in vehicle.maintenance_records:
+            if record._watchers is None or self._on_record_changed not in record._watchers:
+                record.watch(self._on_record_changed)
+
+            km = record.due_odometer
+            if km is not None:
+                due_km = min(due_km, km)
+            at = record.due_time
+            if at is not None:
+                due_time = at if due_time is None else min(due_time, at)
+
+        self._due_odometer[row] = due_km
+        self._due_time[row] = _NEVER if due_time is None else np.datetime64(due_time, "us")
+
+    def _on_record_changed(self, record: MaintenanceRecord, attribute: str, old_value: Any):
+        row = self._row_of(record.vehicle)
+        if row is not None:
+            self._fill(row, record.vehicle)
+
+    def _index_location(self, location_id: UUID) -> int:
+        index = self._location_index.get(location_id)
+        if index is None:
+            index = self._location_index[location_id] = len(self._location_ids)
+            self._location_ids.append(location_id)
+        return index
+
+    def _index_class(self, vehicle_class: VehicleClass) -> int:
+        index = self._class_index.get(vehicle_class.id)
+        if index is None:
+            index = self._class_index[vehicle_class.id] = len(self._classes)
+            self._classes.append(vehicle_class)
+        return index
+
+    def _columns(self) -> List[np.ndarray]:
+        return [
+            self._odometer, self._fuel, self._state, self._location,
+            self._class, self._due_odometer, self._due_time
+        ]
+
+    def _grow(self):
+        capacity = len(self._odometer) * 2
+        self._odometer, self._fuel, self._state, self._location, \
+            self._class, self._due_odometer, self._due_time = [
+                np.resize(column, capacity) for column in self._columns()
+            ]
+
+    # Vectorized queries
+
+    def due_mask(self, now: datetime) -> np.ndarray:
+        """ True for every vehicle whose maintenance is due at 'now'. """
+        return (self.odometer >= self.due_odometer) | (self.due_time <= np.datetime64(now, "us"))
+
+    def due_vehicles(self, now: datetime, location_id: Optional[UUID] = None) -> List[Vehicle]:
+        """ Vehicles due for maintenance, optionally only those at one location. """
+        mask = self.due_mask(now)
+        if location_id is not None:
+            mask &= self._location_mask(location_id)
+        return [self._vehicles[row] for row in np.flatnonzero(mask)]
+
+    def availability_counts(self, now: datetime) -> Dict[Tuple[UUID, UUID], Tuple[int, int]]:
+        """
+        (available, maintenance_hold) per (location ID, class ID) pair that has vehicles.
+        Like InventoryService, a vehicle that is due counts as held whatever its state.
+        """
+        classes = max(len(self._classes), 1)
+        pairs = self.location.astype(np.int64) * classes + self.vehicle_class
+        due = self.due_mask(now)
+        available = ~due & (self.state == _AVAILABLE)
+
+        size = len(self._location_ids) * classes
+        present = np.bincount(pairs, minlength=size)
+        available_counts = np.bincount(pairs[available], minlength=size)
+        hold_counts = np.bincount(pairs[due], minlength=size)
+
+        return {
+            (self._location_ids[pair // classes], self._classes[pair % classes].id):
+                (int(available_counts[pair]), int(hold_counts[pair]))
+            for pair in np.flatnonzero(present)
+        }
+
+    def availability(self, location_id: UUID, now: datetime) -> Dict[UUID, Tuple[int, int]]:
+        """ (available, maintenance_hold) per class ID at one location. """
+        at_location = self._location_mask(location_id)
+        classes = self.vehicle_class[at_location]
+        due = self.due_mask(now)[at_location]
+        available = ~due & (self.state[at_location] == _AVAILABLE)
+
+        size = len(self._classes)
+        present = np.bincount(classes, minlength=size)
+        available_counts = np.bincount(classes[available], minlength=size)
+        hold_counts = np.bincount(classes[due], minlength=size)
+
+        return {
+            self._classes[index].id: (int(available_counts[index]), int(hold_counts[index]))
+            for index in np.flatnonzero(present)
+        }
+
+    def next_due_time(self, location_id: UUID, after: datetime) -> Optional[datetime]:
+        """ Earliest maintenance due time at a location that is still after 'after'. """
+        due_times = self.due_time[self._location_mask(location_id)]
+        upcoming = due_times[due_times > np.datetime64(after, "us")]
+        return upcoming.min().item() if len(upcoming) else None
+
+    def class_counts(self) -> Dict[UUID, int]:
+        """ Number of vehicles per class ID. """
+        counts = np.bincount(self.vehicle_class, minlength=len(self._classes))
+        return {self._classes[index].id: int(counts[index]) for index in np.flatnonzero(counts)}
+
+    def average_fuel(self, location_id: Optional[UUID] = None) -> float:
+        """ Mean fuel level of the fleet (or of one location). 0.0 when there are no vehicles. """
+        fuel = self.fuel if location_id is None else self.fuel[self._location_mask(location_id)]
+        return float(fuel.mean()) if len(fuel) else 0.0
+
+    def _location_mask(self, location_id: UUID) -> np.ndarray:
+        index = self._location_index.get(location_id)
+        if index is None:
+            return np.zeros(self._size, dtype=bool)
+        return self.location == index
@@ -0,0 +1,140 @@
+import random
+from datetime import datetime
+from typing import Any, Hashable, List, Optional
+
+
+class _Node:
+    """ Treap node holding one [start, end) interval. """
+    __slots__ = ("start", "end", "key", "value", "priority", "max_end", "left", "right")
+
+    def __init__(self, start: datetime, end: datetime, key: Hashable, value: Any):
+        self.start = start
+        self.end = end
+        self.key = key
+        self.value = value
+        self.priority = random.random()
+        self.max_end = end
+        self.left: Optional['_Node'] = None
+        self.right: Optional['_Node'] = None
+
+    def update(self):
+        """ Recomputes the largest end time of this subtree. """
+        max_end = self.end
+        if self.left is not None and self.left.max_end > max_end:
+            max_end = self.left.max_end
+        if self.right is not None and self.right.max_end > max_end:
+            max_end = self.right.max_end
+        self.max_end = max_end
+
+
+class IntervalTree:
+    """
+    Interval tree for half-open [start, end) time ranges.
+    It is a treap ordered by (start, key) where every node also
+    remembers the largest end time below it, so overlap queries
+    can skip whole subtrees. Add, remove and query run in
+    O(log n) expected time, plus O(k) for k results.
+    """
+    def __init__(self):
+        self._root: Optional[_Node] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, start: datetime, end: datetime, key: Hashable, value: Any):
+        """ Inserts an interval. 'key' must be unique among intervals with the same start. """
+        self._root = self._insert(self._root, _Node(start, end, key, value))
+        self._size += 1
+
+    def remove(self, start: datetime, key: Hashable) -> bool:
+        """ Removes the interval added with this start and key. """
+        size = self._size
+        self._root = self._delete(self._root, start, key)
+        return self._size < size
+
+    def overlapping(self, start: datetime, end: datetime) -> List[Any]:
+        """ Returns the values of all intervals that overlap [start, end). """
+        found: List[Any] = []
+        stack = [self._root]
+
+        while stack:
+            node = stack.pop()
+            if node is None or node.max_end <= start:
+                continue
+
+            stack.append(node.left)
+
+            if node.start < end:
+                if node.end > start:
+                    found.append(node.value)
+                stack.append(node.right)
+
+        return found
+
+    # Treap internals
+
+    def _insert(self, node: Optional[_Node], new: _Node) -> _Node:
+        if node is None:
+            return new
+
+        if (new.start, new.key) < (node.start, node.key):
+            node.left = self._insert(node.left, new)
+            if node.left.priority > node.priority:
+                node = self._rotate_right(node)
+        else:
+            node.right = self._insert(node.right, new)
+            if node.right.priority > node.priority:
+                node = self._rotate_left(node)
+
+        node.update()
+        return node
+
+    def _delete(self, node: Optional[_Node], start: datetime, key: Hashable) -> Optional[_Node]:
+        if node is None:
+            return None
+
+        if start == node.start and key == node.key:
+            self._size -= 1
+            return self._merge(node.left, node.right)
+
+        if (start, key) < (node.start, node.key):
+            node.left = self._delete(node.left, start, key)
+        else:
+            node.right = self._delete(node.right, start, key)
+
+        node.update()
+        return node
+
+    def _merge(self, left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+        if left is None:
+            return right
+        if right is None:
+            return left
+
+        if left.priority > right.priority:
+            left.right = self._merge(left.right, right)
+            left.update()
+            return left
+
+        right.left = self._merge(left, right.left)
+        right.update()
+        return right
+
+    @staticmethod
+    def _rotate_right(node: _Node) -> _Node:
+        pivot = node.left
+        node.left = pivot.right
+        pivot.right = node
+        node.update()
+        pivot.update()
+        return pivot
+
+    @staticmethod
+    def _rotate_left(node: _Node) -> _Node:
+        pivot = node.right
+        node.right = pivot.left
+        pivot.left = node
+        node.update()
+        pivot.update()
+        return pivot
@@ -1,34 +1,170 @@
-from typing import Dict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple, TYPE_CHECKING
+from uuid import UUID
 from .database import Database
-from ..domain.values import Clock
-from ..domain.fleet import Location, VehicleClass
+from ..domain.values import Clock, CacheStats
+from ..domain.fleet import Location, Vehicle, VehicleClass, VehicleState, MaintenanceRecord
+
+if TYPE_CHECKING:
+    from .fleet_columns import FleetColumns
+
+Report = Dict[str, Dict]
+
+# Counts per class ID, with the class, so names are looked up when a report is read
+ClassCounts = Dict[UUID, Tuple[VehicleClass, Dict[str, int]]]
+
+
+class AvailabilityCache(CacheStats):
+    """ Per-location class counts for InventoryService, dropped when a vehicle there or its plans change. """
+    COUNTERS = ("invalidations",)
+
+    # Vehicle attributes that cannot change an availability report
+    IGNORED = frozenset({"fuel_level"})
+
+    def __init__(self, vehicles: Dict[UUID, Vehicle]):
+        self.reset_stats()
+        self._reports: Dict[UUID, Tuple[ClassCounts, datetime, Optional[datetime]]] = {}
+        self._vehicles: Dict[UUID, Vehicle] = {}
+
+        for key, vehicle in vehicles.items():
+            self.add(key, vehicle)
+
+    def __len__(self) -> int:
+        return len(self._reports)
+
+    def get(self, location_id: UUID, now: datetime) -> Optional[ClassCounts]:
+        """ The cached counts, or None when there are none or they have expired (a due time passed). """
+        entry = self._reports.get(location_id)
+        if entry is not None:
+            counts, computed_at, expires = entry
+            if computed_at <= now and (expires is None or now < expires):
+                self.hits += 1
+                return counts
+            del self._reports[location_id]
+
+        self.misses += 1
+        return None
+
+    def put(self, location_id: UUID, counts: ClassCounts, now: datetime, expires: Optional[datetime]):
+        """ Caches counts taken at 'now' that stay valid until 'expires' (None: no expiry). """
+        self._reports[location_id] = (counts, now, expires)
+
+    def invalidate(self, location_id: UUID):
+        if self._reports.pop(location_id, None) is not None:
+            self.invalidations += 1
+
+    # View of the vehicle table
+
+    def add(self, key: UUID, vehicle: Vehicle):
+        self._vehicles[key] = vehicle
+        for record in vehicle.maintenance_records:
+            record.watch(self._on_plan_changed)
+        self.invalidate(vehicle.location.id)
+
+    def remove(self, key: UUID):
+        vehicle = self._vehicles.pop(key)
+        for record in vehicle.maintenance_records:
+            record.unwatch(self._on_plan_changed)
+        self.invalidate(vehicle.location.id)
+
+    def update(self, vehicle: Vehicle, attribute: str, old_value: Any):
+        if attribute in self.IGNORED:
+            return
+        if attribute == "location":
+            self.invalidate(old_value.id)
+        elif attribute == "maintenance_records":
+            for record in vehicle.maintenance_records:
+                if not record._watchers or self._on_plan_changed not in record._watchers:
+                    record.watch(self._on_plan_changed)
+        self.invalidate(vehicle.location.id)
+
+    def _on_plan_changed(self, record: MaintenanceRecord, attribute: str, old_value: Any):
+        self.invalidate(record.vehicle.location.id)
+
+
+def _by_name(counts: ClassCounts) -> Report:
+    """ The report keyed by the classes' current names; classes sharing a name are added up. """
+    report: Report = {}
+    for vehicle_class, class_counts in counts.values():
+        entry = report.setdefault(vehicle_class.name, {"available": 0, "maintenance_hold": 0})
+        entry["available"] += class_counts["available"]
+        entry["maintenance_hold"] += class_counts["maintenance_hold"]
+    return report
+
 
 class InventoryService:
     """ Answers queries about vehicle availability. """
-    def __init__(self, db: Database, clock: Clock):
+    def __init__(self, db: Database, clock: Clock, use_cache: bool = True):
         self.db = db
         self.clock = clock
 
+        # Only tables that keep views current can cache; services share the table's cache
+        self.cache: Optional[AvailabilityCache] = None
+        if use_cache and hasattr(db.vehicles, "availability_cache"):
+            self.cache = db.vehicles.availability_cache()
+
     def get_availability(self, location: Location) -> Dict[str, Dict]:
         """ Reports which classes are available at a location, """
-        report: Dict[str, Dict] = {}
+        now = self.clock.now()
+        if self.cache is not None:
+            counts = self.cache.get(location.id, now)
+            if counts is not None:
+                return _by_name(counts)
 
-        for vehicle in self.db.vehicles.values():
+        counts, expires = self._availability_from_scan(location, now)
 
-            if vehicle.location.id != location.id:
-                continue
+        if self.cache is not None:
+            self.cache.put(location.id, counts, now, expires)
+        return _by_name(counts)
 
-            class_name = vehicle.vehicle_class.name
+    def get_fleet_availability(self) -> Dict[UUID, Report]:
+        """ The availability report of every location that has vehicles, keyed by location ID. """
+        columns = self._columns()
+        if columns is None:
+            locations = {vehicle.location.id: vehicle.location for vehicle in self.db.vehicles.values()}
+            return {location_id: self.get_availability(location) for location_id, location in locations.items()}
 
-            if class_name not in report:
-                report[class_name] = {"available": 0, "maintenance_hold": 0}
+        reports: Dict[UUID, Report] = {}
+        for (location_id, class_id), (available, held) in columns.availability_counts(self.clock.now()).items():
+            class_name = columns.vehicle_class_by_id(class_id).name
+            entry = reports.setdefault(location_id, {}).setdefault(class_name, {"available": 0, "maintenance_hold": 0})
+            entry["available"] += available
+            entry["maintenance_hold"] += held
+        return reports
 
-            is_due = vehicle.is_maintenance_due(self.clock)
-            
-            if is_due:
-                report[class_name]["maintenance_hold"] += 1
+    def _availability_from_scan(self, location: Location, now: datetime) -> Tuple[ClassCounts, Optional[datetime]]:
+        counts: ClassCounts = {}
+        expires: Optional[datetime] = None
 
-            elif vehicle.state == vehicle.state.AVAILABLE:
-                report[class_name]["available"] += 1
+        for class_id in self.db.vehicles.classes_at(location.id):
+
+            vehicles = self.db.vehicles.of_class_at(location.id, class_id)
+            class_counts = {"available": 0, "maintenance_hold": 0}
+            counts[class_id] = (vehicles[0].vehicle_class, class_counts)
+
+            for vehicle in vehicles:
+
+                is_due = vehicle.is_maintenance_due(self.clock)
+
+                if is_due:
+                    class_counts["maintenance_hold"] += 1
+
+                elif vehicle.state == VehicleState.AVAILABLE:
+                    class_counts["available"] += 1
+
+                for record in vehicle.maintenance_records:
+                    due_time = record.due_time
+                    if due_time is not None and due_time > now and (expires is None or due_time < expires):
+                        expires = due_time
                 
-        return report
\ No newline at end of file
+        return counts, expires
+
+    def _columns(self) -> Optional['FleetColumns']:
+        """ The fleet's NumPy columns, or None when the table has none or numpy is missing. """
+        columnar = getattr(self.db.vehicles, "columnar", None)
+        if columnar is None:
+            return None
+        try:
+            return columnar()
+        except ImportError:
+            return None
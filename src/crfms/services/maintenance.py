@@ -1,14 +1,21 @@
-from typing import List
+import heapq
+from typing import Any, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
 from datetime import datetime, timedelta
+from uuid import UUID
 from .database import Database
 from ..domain.values import Clock, Kilometers
 from ..domain.fleet import Vehicle, Location, MaintenanceRecord
+from ..domain.ports import MutationLog
+
+if TYPE_CHECKING:
+    from .due_schedule import DueSchedule
 
 class MaintenanceService:
     """ Fleet maintenance service. """
-    def __init__(self, db: Database, clock: Clock):
+    def __init__(self, db: Database, clock: Clock, journal: Optional[MutationLog] = None):
         self.db = db
         self.clock = clock
+        self.journal = journal
         
     def register_service_plan(
         self,
@@ -27,17 +34,66 @@ class MaintenanceService:
             last_service_odometer=vehicle.odometer
         )
         vehicle.maintenance_records.append(record)
+        vehicle.notify("maintenance_records")
+        if self.journal is not None:
+            self.journal.record("maintenance_registered", record)
         
+    def record_completed_service(
+        self,
+        record: MaintenanceRecord,
+        odometer: Optional[Kilometers] = None
+    ):
+        """ Records that a planned service was done now, which re-arms the plan from here. """
+        record.last_service_date = self.clock.now()
+        record.last_service_odometer = odometer or record.vehicle.odometer
+        record.vehicle.notify("maintenance_records")
+        if self.journal is not None:
+            self.journal.record("service_completed", record)
+
     def list_due_vehicles(self, location: Location) -> List[Vehicle]:
         """ Lists all vehicles at a location that are due for maintenance. """
+        schedule = self._schedule()
+        if schedule is not None:
+            return schedule.due_vehicles(self.clock.now(), location.id)
+
         due_vehicles: List[Vehicle] = []
         
-        for vehicle in self.db.vehicles.values():
+        for vehicle in self.db.vehicles.at_location(location.id):
 
-            if vehicle.location.id != location.id:
-                continue
-                
             if vehicle.is_maintenance_due(self.clock):
                 due_vehicles.append(vehicle)
                 
-        return due_vehicles
\ No newline at end of file
+        return due_vehicles
+
+    def next_due_by_time(self, count: int) -> List[Tuple[Vehicle, datetime]]:
+        """ The 'count' vehicles whose next service falls due soonest by date. """
+        schedule = self._schedule()
+        if schedule is not None:
+            return schedule.next_by_time(count)
+        return self._first_due(count, lambda record: record.due_time)
+
+    def next_due_by_km(self, count: int) -> List[Tuple[Vehicle, int]]:
+        """ The 'count' vehicles with the least km left before their next service. """
+        schedule = self._schedule()
+        if schedule is not None:
+            return schedule.next_by_km(count)
+        return self._first_due(
+            count,
+            lambda record: None if record.due_odometer is None
+            else record.due_odometer - record.vehicle.odometer.value
+        )
+
+    def _schedule(self) -> Optional['DueSchedule']:
+        """ The fleet's due schedule, or None when the vehicle table has none (e.g. SQLite). """
+        due_schedule = getattr(self.db.vehicles, "due_schedule", None)
+        return due_schedule() if due_schedule is not None else None
+
+    def _first_due(self, count: int, key: Callable[[MaintenanceRecord], Any]) -> List[Tuple[Vehicle, Any]]:
+        """ Scan fallback for the next_due_* queries. """
+        earliest: Dict[UUID, Tuple[Vehicle, Any]] = {}
+        for vehicle in self.db.vehicles.values():
+            keys = [key(record) for record in vehicle.maintenance_records]
+            keys = [k for k in keys if k is not None]
+            if keys:
+                earliest[vehicle.id] = (vehicle, min(keys))
+        return heapq.nsmallest(count, earliest.values(), key=lambda pair: pair[1])
@@ -0,0 +1,96 @@
+from collections import OrderedDict
+from datetime import datetime
+from math import ceil
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from ..domain.values import Money, ChargeItem, CacheStats
+from ..domain.fleet import VehicleClass, AddOn, InsuranceTier, Location
+from ..domain.rental import Reservation
+from ..domain.pricing import PricingPolicy, PricingContext, ChargeKey
+
+
+class QuoteService(CacheStats):
+    """ Price estimates for bookings not made yet, in an LRU cache dropped when a rate or name they use changes. """
+    COUNTERS = ("invalidations", "evictions")
+
+    def __init__(self, pricing_policy: PricingPolicy, max_size: int = 10_000):
+        self.pricing_policy = pricing_policy
+        self.max_size = max_size
+        self.reset_stats()
+        self._quotes: 'OrderedDict[ChargeKey, List[ChargeItem]]' = OrderedDict()
+        self._dependents: Dict[int, Set[ChargeKey]] = {}
+        self._sources: Dict[int, Any] = {}
+
+    def quote(self, reservation: Reservation) -> List[ChargeItem]:
+        """ Estimated rule charges for a reservation, as if returned on time. """
+        return self.quote_for(
+            reservation.vehicle_class, reservation.pickup_time, reservation.return_time,
+            reservation.add_ons, reservation.insurance, reservation.pickup_location
+        )
+
+    def quote_for(
+        self,
+        vehicle_class: VehicleClass,
+        pickup_time: datetime,
+        return_time: datetime,
+        add_ons: Sequence[AddOn] = (),
+        insurance: Optional[InsuranceTier] = None,
+        location: Optional[Location] = None
+    ) -> List[ChargeItem]:
+        """ Estimated rule charges for a booking that has not been made yet. """
+        days = max(ceil((return_time - pickup_time).total_seconds() / 86400), 1)
+        context = PricingContext.for_quote(vehicle_class, days, add_ons, insurance, pickup_time, location)
+        key = self.pricing_policy.charge_key(context)
+
+        charges = self._quotes.get(key)
+        if charges is not None:
+            self.hits += 1
+            self._quotes.move_to_end(key)
+            return list(charges)
+
+        self.misses += 1
+        charges = self.pricing_policy.charges_for(context)
+        self._store(key, charges, [vehicle_class, *add_ons] + ([insurance] if insurance is not None else []))
+        return list(charges)
+
+    def quote_total(self, reservation: Reservation) -> Money:
+        return Money.sum(charge.amount for charge in self.quote(reservation))
+
+    def __len__(self) -> int:
+        return len(self._quotes)
+
+    def clear(self):
+        for key in list(self._quotes):
+            self._drop(key)
+
+    # Cache maintenance
+
+    def _store(self, key: ChargeKey, charges: List[ChargeItem], sources: List[Any]):
+        self._quotes[key] = charges
+        for source in sources:
+            if source.id.int not in self._sources:
+                self._sources[source.id.int] = source
+                source.watch(self._on_rate_changed)
+            self._dependents.setdefault(source.id.int, set()).add(key)
+
+        while len(self._quotes) > self.max_size:
+            self._drop(next(iter(self._quotes)))
+            self.evictions += 1
+
+    def _drop(self, key: ChargeKey):
+        """ Removes one quote and stops watching sources no other quote needs. """
+        del self._quotes[key]
+        class_id, _, add_on_ids, insurance_id, _ = key
+        for source_id in (class_id, *add_on_ids, insurance_id):
+            dependents = self._dependents.get(source_id)
+            if dependents is None:
+                continue
+            dependents.discard(key)
+            if not dependents:
+                del self._dependents[source_id]
+                self._sources.pop(source_id).unwatch(self._on_rate_changed)
+
+    def _on_rate_changed(self, source: Any, attribute: str, old_value: Any):
+        for key in list(self._dependents.get(source.id.int, ())):
+            self._drop(key)
+            self.invalidations += 1
@@ -1,12 +1,22 @@
 from datetime import datetime
 from uuid import UUID
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 import uuid
 from .database import Database
 from ..domain.values import Clock, Kilometers, FuelLevel, Money
-from ..domain.fleet import Vehicle, VehicleState
-from ..domain.rental import Reservation, RentalAgreement, Invoice, InvoiceStatus
+from ..domain.fleet import Location, Vehicle, VehicleState
+from ..domain.rental import Reservation, RentalAgreement, Invoice, InvoiceStatus, FinalCharges
 from ..domain.pricing import PricingPolicy
+from ..domain.ports import MutationLog
+from .assignment import WavePlan, plan_assignments
+
+@dataclass(slots=True)
+class BatchResult:
+    """ Outcome of a batch call: the result of every item that went through, and why the others failed. """
+    succeeded: Dict[Any, Any] = field(default_factory=dict)
+    failed: Dict[Any, str] = field(default_factory=dict)
+
 
 class RentalService:
     """ Rental service for picking up and returning vehicles,extending rentals, and computing charges. """
@@ -19,7 +29,8 @@ class RentalService:
         daily_mileage_allowance: Kilometers,
         mileage_overage_fee_per_km: Money,
         fuel_refill_charge: Money,
-        late_fee_per_hour: Money
+        late_fee_per_hour: Money,
+        journal: Optional[MutationLog] = None
     ):
         self.db = db
         self.clock = clock
@@ -29,6 +40,7 @@ class RentalService:
         self.mileage_overage_fee_per_km = mileage_overage_fee_per_km
         self.fuel_refill_charge = fuel_refill_charge
         self.late_fee_per_hour = late_fee_per_hour
+        self.journal = journal
 
     def pickup_vehicle(
         self,
@@ -37,44 +49,101 @@ class RentalService:
         pickup_token: str
     ) -> RentalAgreement:
         """ Picking up the car, creating a rental agreement. """
-        for agreement in self.db.rental_agreements.values():
+        existing = self.db.agreements_by_token.get(pickup_token)
+        if existing is not None:
+            return existing
 
-            if agreement.id.hex == pickup_token:
-                return agreement
-            
-        reservation = self.db.reservations[reservation_id]
-        vehicle = self.db.vehicles[vehicle_id]
-        
+        reservation, vehicle = self._resolve_pickup(reservation_id, vehicle_id)
+        agreement = self._pickup(reservation, vehicle, pickup_token, self.clock.now())
+        if self.journal is not None:
+            self.journal.record("vehicle_picked_up", agreement, token=pickup_token)
+
+        return agreement
+
+    def pickup_many(self, items: Iterable[Tuple[UUID, UUID, str]]) -> BatchResult:
+        """
+        Picks up a batch of (reservation ID, vehicle ID, pickup token) at once.
+        Each item is checked like in pickup_vehicle; results and errors are keyed by token.
+        Every pickup made is journaled, even if an unexpected error ends the batch early.
+        """
+        result = BatchResult()
+        now = self.clock.now()
+        picked_up: List[Tuple[str, RentalAgreement, Dict[str, Any]]] = []
+
+        try:
+            for reservation_id, vehicle_id, pickup_token in items:
+                existing = self.db.agreements_by_token.get(pickup_token)
+                if existing is not None:
+                    result.succeeded[pickup_token] = existing
+                    continue
+                try:
+                    reservation, vehicle = self._resolve_pickup(reservation_id, vehicle_id)
+                    agreement = self._pickup(reservation, vehicle, pickup_token, now)
+                except ValueError as error:
+                    result.failed[pickup_token] = str(error)
+                    continue
+                result.succeeded[pickup_token] = agreement
+                picked_up.append(("vehicle_picked_up", agreement, {"token": pickup_token}))
+        finally:
+            if self.journal is not None and picked_up:
+                self.journal.record_many(picked_up)
+        return result
+
+    def _resolve_pickup(self, reservation_id: UUID, vehicle_id: UUID) -> Tuple[Reservation, Vehicle]:
+        reservation = self.db.reservations.get(reservation_id)
         if not reservation:
             raise ValueError("Reservation not found.")
-        
+
+        vehicle = self.db.vehicles.get(vehicle_id)
         if not vehicle:
             raise ValueError("Vehicle not found.")
 
-
         if vehicle.vehicle_class.id != reservation.vehicle_class.id:
             raise ValueError("Vehicle is not of the reserved class.")
-            
+        return reservation, vehicle
 
+    def _pickup(self, reservation: Reservation, vehicle: Vehicle, pickup_token: str, now: datetime) -> RentalAgreement:
         if not vehicle.can_be_assigned(self.clock):
             raise ValueError("Vehicle cannot be assigned (maintenance due or rented).")
 
-        agreement_id = uuid.UUID(hex=pickup_token)
         agreement = RentalAgreement(
-            id=agreement_id,
+            id=uuid.UUID(hex=pickup_token),
             reservation=reservation,
             vehicle=vehicle,
-            pickup_time=self.clock.now(),
+            pickup_time=now,
             start_odometer=vehicle.odometer,
             start_fuel_level=vehicle.fuel_level,
             due_time=reservation.return_time
         )
-        
+
         vehicle.state = VehicleState.RENTED
         self.db.rental_agreements[agreement.id] = agreement
-
+        self.db.agreements_by_token[pickup_token] = agreement
         return agreement
 
+    def assign_pickup_wave(self, location: Location, start: datetime, end: datetime) -> WavePlan:
+        """
+        Picks a vehicle for every reservation picking up at a location in [start, end).
+        Nothing is picked up yet; pass the plan's vehicles to pickup_vehicle.
+        """
+        class_ids = set(self.db.vehicles.classes_at(location.id)) | set(self.db.vehicle_classes)
+        wave: List[Reservation] = []
+        for class_id in class_ids:
+            for reservation in self.db.reservations.overlapping(class_id, location.id, start, end):
+                if reservation.pickup_time >= start and not self._is_picked_up(reservation):
+                    wave.append(reservation)
+
+        vehicles = [
+            vehicle
+            for class_id in {reservation.vehicle_class.id for reservation in wave}
+            for vehicle in self.db.vehicles.of_class_at(location.id, class_id)
+            if vehicle.can_be_assigned(self.clock)
+        ]
+        return plan_assignments(wave, vehicles, self.daily_mileage_allowance.value)
+
+    def _is_picked_up(self, reservation: Reservation) -> bool:
+        return self.db.rental_agreements.for_reservation(reservation.id) is not None
+
     def return_vehicle(
         self,
         agreement_id: UUID,
@@ -82,54 +151,126 @@ class RentalService:
         end_fuel_level: FuelLevel
     ) -> Invoice:
         """ Returning car, computing charges and creating an invoice. """
-        for inv in self.db.invoices.values():
+        existing = self.db.invoices_by_agreement.get(agreement_id)
+        if existing is not None:
+            return existing
 
-            if inv.rental_agreement.id == agreement_id:
-                return inv
-        
-        agreement = self.db.rental_agreements[agreement_id]
+        agreement = self._resolve_return(agreement_id, end_odometer, end_fuel_level)
+        invoice = self._return(agreement, end_odometer, end_fuel_level, self.clock.now(), self._final_charges())
+        if self.journal is not None:
+            self.journal.record("vehicle_returned", invoice)
 
-        if not agreement:
-            raise ValueError("Rental agreement not found.")
-            
-        agreement.return_time = self.clock.now()
-        agreement.end_odometer = end_odometer
-        agreement.end_fuel_level = end_fuel_level
-        
-        charges = agreement.calculate_final_charges(
+        return invoice
+
+    def return_many(self, items: Iterable[Tuple[UUID, Kilometers, FuelLevel]]) -> BatchResult:
+        """
+        Returns a batch of (agreement ID, end odometer, end fuel level) at once.
+        Each item is priced like in return_vehicle; results and errors are keyed by agreement ID.
+        All items are looked up and checked first, then priced with one FinalCharges, so
+        agreements booked alike share their rule charges. Every return made is journaled,
+        even if an unexpected error ends the batch early.
+        """
+        result = BatchResult()
+        now = self.clock.now()
+
+        pending: Dict[UUID, Tuple[RentalAgreement, Kilometers, FuelLevel]] = {}
+        for agreement_id, end_odometer, end_fuel_level in items:
+            existing = self.db.invoices_by_agreement.get(agreement_id)
+            if existing is not None:
+                result.succeeded[agreement_id] = existing
+                continue
+            if agreement_id in pending:
+                continue
+            try:
+                agreement = self._resolve_return(agreement_id, end_odometer, end_fuel_level)
+            except ValueError as error:
+                result.failed[agreement_id] = str(error)
+                continue
+            pending[agreement_id] = (agreement, end_odometer, end_fuel_level)
+
+        final_charges = self._final_charges()
+        returned: List[Tuple[str, Invoice, Dict[str, Any]]] = []
+        try:
+            for agreement_id, (agreement, end_odometer, end_fuel_level) in pending.items():
+                try:
+                    invoice = self._return(agreement, end_odometer, end_fuel_level, now, final_charges)
+                except ValueError as error:
+                    result.failed[agreement_id] = str(error)
+                    continue
+                result.succeeded[agreement_id] = invoice
+                returned.append(("vehicle_returned", invoice, {}))
+        finally:
+            if self.journal is not None and returned:
+                self.journal.record_many(returned)
+        return result
+
+    def _final_charges(self) -> FinalCharges:
+        return FinalCharges(
             pricing_policy=self.pricing_policy,
             daily_mileage_allowance=self.daily_mileage_allowance,
             mileage_overage_fee_per_km=self.mileage_overage_fee_per_km,
             fuel_refill_charge=self.fuel_refill_charge,
             late_fee_per_hour=self.late_fee_per_hour
         )
-        
+
+    def _resolve_return(self, agreement_id: UUID, end_odometer: Kilometers, end_fuel_level: FuelLevel) -> RentalAgreement:
+        agreement = self.db.rental_agreements.get(agreement_id)
+        if not agreement:
+            raise ValueError("Rental agreement not found.")
+
+        if end_odometer is None or end_fuel_level is None:
+            raise ValueError("End odometer and fuel level are required.")
+        return agreement
+
+    def _return(
+        self,
+        agreement: RentalAgreement,
+        end_odometer: Kilometers,
+        end_fuel_level: FuelLevel,
+        now: datetime,
+        final_charges: FinalCharges
+    ) -> Invoice:
+        previous = (agreement.return_time, agreement.end_odometer, agreement.end_fuel_level)
+        agreement.return_time = now
+        agreement.end_odometer = end_odometer
+        agreement.end_fuel_level = end_fuel_level
+
+        try:
+            charges, total = final_charges.price(agreement)
+        except Exception:
+            # Nothing is returned unless it is invoiced
+            agreement.return_time, agreement.end_odometer, agreement.end_fuel_level = previous
+            raise
+
         invoice = Invoice(
             rental_agreement=agreement,
             status=InvoiceStatus.PENDING,
-            charge_items=charges
+            charge_items=charges,
+            total_amount=total
         )
-        invoice.calculate_total()
         agreement.vehicle.state = VehicleState.CLEANING
         self.db.invoices[invoice.id] = invoice
-
+        self.db.invoices_by_agreement[agreement.id] = invoice
         return invoice
 
     def extend_rental(self, agreement_id: UUID, new_due_time: datetime) -> bool:
         """ Extends the rent, checking for conflicts."""
         agreement = self.db.rental_agreements[agreement_id]
+        reservation = agreement.reservation
+
+        # Only active bookings of the same class at the branch the car goes back to compete for it.
+        competing = self.db.reservations.overlapping(
+            reservation.vehicle_class.id,
+            reservation.return_location.id,
+            agreement.due_time,
+            new_due_time
+        )
+        has_conflict = any(res.id != reservation.id for res in competing)
 
-        has_conflict = False
-        for res in self.db.reservations.values():
-            
-            if res.pickup_time < new_due_time and \
-               res.return_time > agreement.due_time:
-                
-                has_conflict = True
-                break
-                
         if has_conflict:
             return False
 
         agreement.extend_due_time(new_due_time, Money(value=0.0))
+        if self.journal is not None:
+            self.journal.record("rental_extended", agreement)
         return True
\ No newline at end of file
@@ -1,18 +1,20 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import List, Optional
 from uuid import UUID
 from .database import Database
 from ..domain.users import Customer
 from ..domain.fleet import VehicleClass, Location, AddOn, InsuranceTier
-from ..domain.rental import Reservation, ReservationStatus
+from ..domain.rental import Reservation, ReservationStatus, NO_SHOW_GRACE
 from ..domain.values import Money, Clock
-from ..domain.ports import Notification
+from ..domain.ports import Notification, MutationLog
 
 class ReservationService:
     """ Service for creating, modifying and canceling reservations. """
-    def __init__(self, db: Database, clock: Clock, notifier: Notification):
+    def __init__(self, db: Database, clock: Clock, notifier: Notification, journal: Optional[MutationLog] = None):
         self.db = db
         self.clock = clock
         self.notifier = notifier
+        self.journal = journal
 
     def create_reservation(
         self,
@@ -28,6 +30,14 @@ class ReservationService:
     ) -> Reservation:
         
         """ Creates a new reservation for a customer."""
+        capacity = getattr(self.db, "capacity", None)
+        # A branch that stocks none of the class is not limited here; a car is moved in
+        if capacity is not None and capacity().stocks(pickup_loc.id, vehicle_class.id):
+            # A one-way rental takes the car away from the pickup branch for good
+            end = return_time if return_loc.id == pickup_loc.id else None
+            if capacity().free(pickup_loc.id, vehicle_class.id, pickup_time, end) < 1:
+                raise ValueError("No vehicle of this class is free for the requested period.")
+
         reservation = Reservation(
             customer=customer,
             vehicle_class=vehicle_class,
@@ -42,6 +52,8 @@ class ReservationService:
         )
         
         self.db.reservations[reservation.id] = reservation
+        if self.journal is not None:
+            self.journal.record("reservation_created", reservation)
         
         self.notifier.send(
             customer,
@@ -57,8 +69,33 @@ class ReservationService:
             raise ValueError("Reservation not found.")
             
         reservation.status = ReservationStatus.CANCELLED
+        if self.journal is not None:
+            self.journal.record("reservation_cancelled", reservation)
         
         self.notifier.send(
             reservation.customer,
             f"Your reservation {reservation.id} has been canceled.")
-        return reservation
\ No newline at end of file
+        return reservation
+
+
+    def expire_no_shows(self, grace: timedelta = NO_SHOW_GRACE) -> List[Reservation]:
+        """
+        Marks active reservations that were not picked up within 'grace' of their
+        pickup time as no-shows, which releases the cars they held. Run periodically.
+        """
+        cutoff = self.clock.now() - grace
+        expired = [
+            reservation for reservation in self.db.reservations.values()
+            if reservation.status in (ReservationStatus.PENDING, ReservationStatus.CONFIRMED)
+            and reservation.pickup_time <= cutoff
+            and self.db.rental_agreements.for_reservation(reservation.id) is None
+        ]
+
+        for reservation in expired:
+            reservation.status = ReservationStatus.NO_SHOW
+            if self.journal is not None:
+                self.journal.record("reservation_expired", reservation)
+            self.notifier.send(
+                reservation.customer,
+                f"Your reservation {reservation.id} has expired because the vehicle was not picked up.")
+        return expired
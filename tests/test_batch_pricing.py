@@ -0,0 +1,79 @@
+import pytest
+import random
+from datetime import datetime, timedelta
+
+np = pytest.importorskip("numpy")
+
+from crfms.domain.values import Money, Kilometers, FuelLevel
+from crfms.domain.fleet import VehicleClass, Vehicle, AddOn, InsuranceTier
+from crfms.domain.rental import Reservation, RentalAgreement
+from crfms.domain.pricing import PricingPolicy, BaseDailyRateRule, PerDayAddOnRule, InsuranceRule
+from crfms.services.batch_pricing import PricingBatch, BatchPricingEngine
+
+FEES = (Kilometers(100), Money(0.35), Money(75.0), Money(12.5))
+
+
+def _agreements(customer, location, count, seed=5):
+    rng = random.Random(seed)
+    classes = [VehicleClass(name=f"C{i}", base_rate=Money(rng.randint(1500, 20000) / 100)) for i in range(4)]
+    add_ons = [AddOn(name="GPS", daily_rate=Money(9.99)), AddOn(name="Seat", daily_rate=Money(4.5))]
+    tiers = [None, InsuranceTier(name="Basic", daily_rate=Money(11.11)), InsuranceTier(name="Full", daily_rate=Money(29.0))]
+    start = datetime(2025, 3, 1, 8, 0)
+
+    agreements = []
+    for _ in range(count):
+        vehicle_class = rng.choice(classes)
+        pickup = start + timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+        due = pickup + timedelta(days=rng.randint(1, 14))
+        # Early, on time, inside the free hour, exactly on the hour edges and late, with odd microseconds
+        returned = due + rng.choice([
+            timedelta(0), timedelta(hours=1), timedelta(hours=1, microseconds=1),
+            timedelta(hours=-rng.randint(0, 20)), timedelta(seconds=rng.randint(0, 86400 * 3), microseconds=rng.randint(0, 999999))
+        ])
+        start_km = rng.randint(0, 90000)
+        reservation = Reservation(
+            customer=customer, vehicle_class=vehicle_class, pickup_location=location, return_location=location,
+            pickup_time=pickup, return_time=due, deposit_amount=Money(0),
+            add_ons=rng.sample(add_ons, rng.randint(0, 2)), insurance=rng.choice(tiers)
+        )
+        agreements.append(RentalAgreement(
+            reservation=reservation,
+            vehicle=Vehicle("B-1", Kilometers(start_km), FuelLevel(1.0), vehicle_class, location),
+            pickup_time=pickup, due_time=due, return_time=max(returned, pickup),
+            start_odometer=Kilometers(start_km), end_odometer=Kilometers(start_km + rng.randint(0, 3000)),
+            start_fuel_level=FuelLevel(rng.choice([1.0, 0.5])), end_fuel_level=FuelLevel(rng.choice([1.0, 0.75, 0.5]))
+        ))
+    return agreements
+
+def test_vectorized_charges_match_calculate_final_charges(customer, location):
+    """ Verifies every charge kind and the total against the object path, cent for cent. """
+    agreements = _agreements(customer, location, 2000)
+    policy = PricingPolicy([BaseDailyRateRule(), PerDayAddOnRule(), InsuranceRule()])
+    charges = BatchPricingEngine(*FEES).price(PricingBatch.from_agreements(agreements))
+
+    kinds = {
+        "Base": charges.base, "Add-on": charges.add_ons, "Insurance": charges.insurance,
+        "Late": charges.late_fee, "Mileage": charges.mileage_fee, "Fuel": charges.fuel_charge
+    }
+    for row, agreement in enumerate(agreements):
+        items = agreement.calculate_final_charges(policy, *FEES)
+        for prefix, column in kinds.items():
+            expected = sum(item.amount.cents for item in items if item.description.startswith(prefix))
+            assert column[row] == expected, (prefix, row)
+
+    assert charges.totals() == [Money.sum(i.amount for i in a.calculate_final_charges(policy, *FEES)) for a in agreements]
+
+def test_rate_override_and_open_agreements(customer, location):
+    """ Verifies that overridden class rates reprice the base charge only, and open rentals are refused. """
+    agreements = _agreements(customer, location, 50, seed=9)
+    batch = PricingBatch.from_agreements(agreements)
+    engine = BatchPricingEngine(*FEES)
+
+    current = engine.price(batch)
+    raised = engine.price(batch, base_rate=batch.base_rate + 100)
+    assert (raised.base - current.base == 100 * (current.base // batch.base_rate)).all()
+    assert (raised.total - raised.base == current.total - current.base).all()
+
+    agreements[0].return_time = None
+    with pytest.raises(ValueError):
+        PricingBatch.from_agreements(agreements)
@@ -1,7 +1,11 @@
 import pytest
+import asyncio
+import time
 from crfms.domain.values import Money
-from crfms.domain.rental import Invoice, RentalAgreement, Reservation, InvoiceStatus
+from crfms.domain.rental import Invoice, RentalAgreement, Reservation, InvoiceStatus, BillingPaymentStatus
 from crfms.domain.users import Customer
+from crfms.adapters.payments import FakeAsyncPaymentAdapter
+from crfms.services.accounting import AsyncAccountingService
 
 
 @pytest.fixture
@@ -83,4 +87,97 @@ def test_deposit_authorization_failure(accounting_service, customer, monkeypatch
     )
 
     with pytest.raises(ValueError, match="Insufficient Funds"):
-        accounting_service.capture_deposit(customer, Money(50))
\ No newline at end of file
+        accounting_service.capture_deposit(customer, Money(50))
+
+def _invoices(db, invoice, count):
+    """ 'count' pending invoices on the same agreement as 'invoice'. """
+    invoices = []
+    for i in range(count):
+        other = Invoice(rental_agreement=invoice.rental_agreement, total_amount=Money(10 + i))
+        db.invoices[other.id] = other
+        invoices.append(other)
+    return invoices
+
+def test_async_settlement_is_concurrent_and_bounded(db, pending_invoice, notifier):
+    " Settles invoices concurrently, never exceeding the limit, recording a payment and a notification for each."
+    adapter = FakeAsyncPaymentAdapter(latency=0.05)
+    in_flight = peak = 0
+    charge = adapter.finalize_payment
+
+    async def counting_charge(customer, amount, idempotency_key=None):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            return await charge(customer, amount, idempotency_key)
+        finally:
+            in_flight -= 1
+
+    adapter.finalize_payment = counting_charge
+    service = AsyncAccountingService(db, adapter, notifier, max_concurrency=8)
+    invoices = _invoices(db, pending_invoice, 40)
+
+    started = time.perf_counter()
+    payments = asyncio.run(service.settle(invoices))
+    elapsed = time.perf_counter() - started
+
+    assert peak == 8
+    assert elapsed < 40 * 0.05 / 2  # five rounds of 8 instead of 40 calls in a row
+    assert [payment.invoice for payment in payments] == invoices
+    assert all(invoice.status == InvoiceStatus.PAID for invoice in invoices)
+    assert len(db.payments) == 40 and len(notifier.sent_messages) == 40
+    assert all("successful" in message for _, message in notifier.sent_messages)
+
+def test_async_settlement_retries_and_times_out(db, pending_invoice, notifier, monkeypatch):
+    " Retries transient failures without charging twice, and fails invoices whose calls keep timing out."
+    adapter = FakeAsyncPaymentAdapter()
+    service = AsyncAccountingService(db, adapter, notifier, timeout=0.05, retries=2, retry_delay=0.01)
+    flaky, slow = _invoices(db, pending_invoice, 2)
+    attempts = {}
+    charge = adapter.finalize_payment
+
+    async def unreliable_charge(customer, amount, idempotency_key=None):
+        attempts[idempotency_key] = attempts.get(idempotency_key, 0) + 1
+        if idempotency_key == slow.id.hex:
+            await asyncio.sleep(1)
+        tx_id = await charge(customer, amount, idempotency_key)
+        if attempts[idempotency_key] == 1:
+            raise ConnectionError("Processor dropped the response")
+        return tx_id
+
+    monkeypatch.setattr(adapter, "finalize_payment", unreliable_charge)
+    flaky_payment, slow_payment = asyncio.run(service.settle([flaky, slow]))
+
+    assert attempts == {flaky.id.hex: 2, slow.id.hex: 3}
+    assert flaky.status == InvoiceStatus.PAID and flaky_payment.transaction_id == adapter.charges[flaky.id.hex]
+    assert len(adapter.charges) == 1
+    assert slow.status == InvoiceStatus.FAILED and slow_payment.status == BillingPaymentStatus.FAILURE
+    assert sorted("failed" in message for _, message in notifier.sent_messages) == [False, True]
+
+def test_async_deposit_failure_is_raised(db, customer, notifier):
+    adapter = FakeAsyncPaymentAdapter()
+    adapter.should_succeed = False
+    service = AsyncAccountingService(db, adapter, notifier, retries=1, retry_delay=0)
+
+    with pytest.raises(Exception, match="authorization failure"):
+        asyncio.run(service.capture_deposit(customer, Money(50)))
+
+def test_async_deposit_retry_authorizes_once(db, customer, notifier, monkeypatch):
+    " A deposit retried after a timeout reuses its idempotency key, so the card is held once."
+    adapter = FakeAsyncPaymentAdapter()
+    service = AsyncAccountingService(db, adapter, notifier, timeout=0.05, retries=2, retry_delay=0.01)
+    keys = []
+    authorize = adapter.authorize_deposit
+
+    async def slow_first_response(customer, amount, idempotency_key=None):
+        keys.append(idempotency_key)
+        tx_id = await authorize(customer, amount, idempotency_key)
+        if len(keys) == 1:
+            await asyncio.sleep(1)
+        return tx_id
+
+    monkeypatch.setattr(adapter, "authorize_deposit", slow_first_response)
+    tx_id = asyncio.run(service.capture_deposit(customer, Money(50)))
+
+    assert len(keys) == 2 and keys[0] is not None and keys[0] == keys[1]
+    assert adapter.authorizations == {keys[0]: tx_id}
@@ -0,0 +1,53 @@
+import pytest
+from datetime import timedelta
+
+from crfms.domain.values import Money
+from crfms.domain.rental import Reservation, RentalAgreement, Invoice
+from crfms.persistence.snapshot import write_snapshot, read_snapshot
+from crfms.persistence.sectioned import SectionedSnapshot
+from crfms.persistence.convert import convert
+
+
+@pytest.fixture
+def line_snapshot(tmp_path, db, customer, vehicle, clock):
+    """ A line snapshot with one finished rental. """
+    reservation = Reservation(
+        customer=customer, vehicle_class=vehicle.vehicle_class,
+        pickup_location=vehicle.location, return_location=vehicle.location,
+        pickup_time=clock.now(), return_time=clock.now() + timedelta(days=2),
+        deposit_amount=Money(0)
+    )
+    agreement = RentalAgreement(
+        reservation=reservation, vehicle=vehicle, pickup_time=clock.now(),
+        start_odometer=vehicle.odometer, start_fuel_level=vehicle.fuel_level,
+        due_time=reservation.return_time
+    )
+    invoice = Invoice(rental_agreement=agreement, total_amount=Money(100.0))
+    db.reservations[reservation.id] = reservation
+    db.rental_agreements[agreement.id] = agreement
+    db.invoices[invoice.id] = invoice
+    db.agreements_by_token[agreement.id.hex] = agreement
+
+    path = str(tmp_path / "snapshot.jsonl")
+    write_snapshot(db, path)
+    return path, invoice
+
+
+def test_streaming_round_trip_is_lossless(tmp_path, line_snapshot):
+    """ Verifies lines -> sectioned -> lines gives back the same bytes. """
+    src, invoice = line_snapshot
+    sectioned = str(tmp_path / "snapshot.sec")
+    back = str(tmp_path / "back.jsonl")
+
+    convert(src, sectioned)
+    convert(sectioned, back)
+
+    with open(src, "rb") as a, open(back, "rb") as b:
+        assert a.read() == b.read()
+
+    with SectionedSnapshot(sectioned) as snap:
+        assert snap.count("invoices") == 1
+        assert snap.record("invoices", invoice.id)["total_amount"] == 100.0
+
+    loaded, _ = read_snapshot(back)
+    assert loaded.invoices[invoice.id].rental_agreement.id == invoice.rental_agreement.id
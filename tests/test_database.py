@@ -0,0 +1,278 @@
+import pytest
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from crfms.domain.values import Money, Kilometers, FuelLevel
+from crfms.domain.fleet import Location, VehicleClass, Vehicle, VehicleState
+from crfms.domain.rental import ReservationStatus
+from crfms.services.intervals import IntervalTree
+from crfms.services.capacity import CapacityTimeline
+from crfms.services.inventory import InventoryService
+
+
+def test_vehicle_indexes_follow_state_and_location(db, vehicle, location, vehicle_class):
+    """ Verifies that the vehicle indexes stay correct when a vehicle changes state or moves. """
+    assert db.vehicles.at_location(location.id) == [vehicle]
+    assert db.vehicles.of_class_at(location.id, vehicle_class.id) == [vehicle]
+    assert db.vehicles.in_state(VehicleState.AVAILABLE) == [vehicle]
+
+    # State change
+    vehicle.state = VehicleState.RENTED
+    assert db.vehicles.in_state(VehicleState.AVAILABLE) == []
+    assert db.vehicles.in_state(VehicleState.RENTED) == [vehicle]
+
+    # Move to another branch
+    other = Location(name="Airport", address="1 Runway Rd")
+    db.locations[other.id] = other
+    vehicle.location = other
+
+    assert db.vehicles.at_location(location.id) == []
+    assert db.vehicles.classes_at(location.id) == []
+    assert db.vehicles.at_location(other.id) == [vehicle]
+    assert db.vehicles.of_class_at(other.id, vehicle_class.id) == [vehicle]
+
+def test_removed_vehicle_leaves_indexes(db, vehicle, location):
+    """ Verifies that deleted vehicles are dropped from every index and no longer tracked. """
+    del db.vehicles[vehicle.id]
+
+    assert db.vehicles.at_location(location.id) == []
+    assert db.vehicles.in_state(VehicleState.AVAILABLE) == []
+
+    # Changes after removal must not put it back
+    vehicle.state = VehicleState.CLEANING
+    assert db.vehicles.in_state(VehicleState.CLEANING) == []
+
+def test_availability_by_class(db, inventory_service, vehicle, location):
+    """ Verifies the availability report is built per class from the location index. """
+    suv = VehicleClass(name="SUV", base_rate=Money(value=90.0))
+    db.vehicle_classes[suv.id] = suv
+
+    for plate, state in [("SUV-1", VehicleState.AVAILABLE), ("SUV-2", VehicleState.RENTED)]:
+        v = Vehicle(
+            license_plate=plate,
+            odometer=Kilometers(500),
+            fuel_level=FuelLevel(1.0),
+            vehicle_class=suv,
+            location=location,
+            state=state
+        )
+        db.vehicles[v.id] = v
+
+    report = inventory_service.get_availability(location)
+
+    assert report["Economy"] == {"available": 1, "maintenance_hold": 0}
+    assert report["SUV"] == {"available": 1, "maintenance_hold": 0}
+
+def test_availability_cache_invalidation(db, inventory_service, maintenance_service, vehicle, location, clock):
+    """ Verifies that polling hits the cache and that only relevant changes drop a location's report. """
+    airport = Location(name="Airport", address="Terminal 1")
+    other = Vehicle("AIR-1", Kilometers(500), FuelLevel(1.0), vehicle.vehicle_class, airport)
+    db.vehicles[other.id] = other
+    cache = inventory_service.cache
+
+    for _ in range(3):
+        inventory_service.get_availability(location)
+    assert (cache.misses, cache.hits) == (1, 2)
+
+    # Changes elsewhere, or to fuel, leave the report alone
+    other.state = VehicleState.RENTED
+    vehicle.fuel_level = FuelLevel(0.5)
+    inventory_service.get_availability(location)
+    assert cache.hits == 3
+
+    # A state change at the location is seen on the next poll
+    vehicle.state = VehicleState.RENTED
+    assert inventory_service.get_availability(location)["Economy"]["available"] == 0
+    assert cache.misses == 2
+
+    # Moving a car in refreshes the destination
+    inventory_service.get_availability(airport)
+    other.state = VehicleState.AVAILABLE
+    other.location = location
+    assert inventory_service.get_availability(location)["Economy"]["available"] == 1
+    assert inventory_service.get_availability(airport) == {}
+
+def test_availability_cache_follows_class_rename(inventory_service, vehicle, location):
+    """ Verifies that a cached report shows a renamed class under its new name. """
+    inventory_service.get_availability(location)
+    vehicle.vehicle_class.name = "Compact"
+
+    assert inventory_service.get_availability(location) == {"Compact": {"available": 1, "maintenance_hold": 0}}
+    assert inventory_service.cache.hits == 1
+
+def test_availability_cache_expires_when_service_falls_due(db, inventory_service, maintenance_service, vehicle, location, clock):
+    """ Verifies that a cached report is dropped on plan registration and when a due time passes. """
+    assert inventory_service.get_availability(location)["Economy"]["available"] == 1
+
+    maintenance_service.register_service_plan(vehicle, "Inspection", None, timedelta(days=30))
+    assert inventory_service.get_availability(location)["Economy"]["available"] == 1
+    misses = inventory_service.cache.misses
+    assert misses == 2
+
+    clock._frozen_time = clock.now() + timedelta(days=29)
+    assert inventory_service.get_availability(location)["Economy"]["available"] == 1
+    assert inventory_service.cache.misses == misses
+
+    clock._frozen_time = clock.now() + timedelta(days=1)
+    assert inventory_service.get_availability(location)["Economy"] == {"available": 0, "maintenance_hold": 1}
+    assert inventory_service.cache.stats()["hit_rate"] == pytest.approx(1 / 4)
+
+def test_interval_tree_matches_brute_force():
+    """ Verifies the interval tree finds exactly the overlapping intervals, also after removals. """
+    rng = random.Random(7)
+    base = datetime(2025, 1, 1)
+    tree = IntervalTree()
+    intervals = {}
+
+    for key in range(300):
+        start = base + timedelta(hours=rng.randint(0, 2000))
+        end = start + timedelta(hours=rng.randint(1, 200))
+        intervals[key] = (start, end)
+        tree.add(start, end, key, key)
+
+    for key in range(0, 300, 3):
+        start, _ = intervals.pop(key)
+        assert tree.remove(start, key) is True
+
+    assert len(tree) == len(intervals)
+
+    for _ in range(100):
+        q_start = base + timedelta(hours=rng.randint(0, 2200))
+        q_end = q_start + timedelta(hours=rng.randint(1, 300))
+        expected = {k for k, (s, e) in intervals.items() if s < q_end and e > q_start}
+        assert set(tree.overlapping(q_start, q_end)) == expected
+
+def test_capacity_timeline_matches_brute_force():
+    """ Verifies the lowest running sum over a window, also after removals. """
+    rng = random.Random(11)
+    base = datetime(2025, 1, 1)
+    timeline = CapacityTimeline()
+    events = []
+
+    for _ in range(400):
+        event = (base + timedelta(hours=rng.randint(0, 500)), rng.choice((-1, 1)))
+        events.append(event)
+        timeline.add(*event)
+    for event in events[::4]:
+        timeline.remove(*event)
+    events = [event for i, event in enumerate(events) if i % 4]
+
+    def brute(start, end):
+        running = sum(d for t, d in events if t <= start)
+        lowest = running
+        # Changes at the same instant count as one
+        times = sorted({t for t, _ in events if start < t and (end is None or t < end)})
+        for time in times:
+            running += sum(d for t, d in events if t == time)
+            lowest = min(lowest, running)
+        return lowest
+
+    for _ in range(100):
+        start = base + timedelta(hours=rng.randint(-10, 520))
+        end = rng.choice((None, start + timedelta(hours=rng.randint(1, 100))))
+        assert timeline.lowest(start, end) == brute(start, end)
+
+def test_reservations_cannot_overbook(db, reservation_service, rental_service, customer, vehicle, location, clock):
+    """ Verifies that bookings are refused once every car of the class is spoken for in the window. """
+    start = clock.now() + timedelta(days=1)
+    end = start + timedelta(days=2)
+    book = lambda s, e, to=location: reservation_service.create_reservation(
+        customer, vehicle.vehicle_class, location, to, s, e, Money(0), [], None
+    )
+
+    first = book(start, end)
+    assert db.capacity().free(location.id, vehicle.vehicle_class.id, start, end) == 0
+    with pytest.raises(ValueError):
+        book(start + timedelta(hours=12), end + timedelta(days=1))
+
+    # Back-to-back is fine, but a one-way trip never brings the car back
+    book(end, end + timedelta(days=1))
+    airport = Location(name="Airport", address="1 Runway Rd")
+    book(end + timedelta(days=3), end + timedelta(days=4), to=airport)
+    with pytest.raises(ValueError):
+        book(end + timedelta(days=5), end + timedelta(days=6))
+    assert db.capacity().free(airport.id, vehicle.vehicle_class.id, end) == 0
+    assert db.capacity().free(airport.id, vehicle.vehicle_class.id, end + timedelta(days=4)) == 1
+
+    # Cancelling frees the slot again; picking up keeps it taken until the due time
+    reservation_service.cancel_reservation(first.id)
+    second = book(start, end)
+    clock._frozen_time = start
+    rental_service.pickup_vehicle(second.id, vehicle.id, uuid.uuid4().hex)
+    assert db.capacity().free(location.id, vehicle.vehicle_class.id, start, end) == 0
+    assert db.capacity().free(location.id, vehicle.vehicle_class.id, end, end + timedelta(hours=1)) == 0
+
+
+def test_capacity_counts_bookable_cars(db, maintenance_service, vehicle, location, clock):
+    """ Verifies that cleaning cars count as free and cars due for service do not. """
+    free = lambda start=clock.now(): db.capacity().free(
+        location.id, vehicle.vehicle_class.id, start, start + timedelta(days=1)
+    )
+
+    vehicle.state = VehicleState.CLEANING
+    assert free() == 1
+
+    # Due by distance: off the count at once, back after the service
+    maintenance_service.register_service_plan(vehicle, "Oil Change", Kilometers(1000), None)
+    vehicle.odometer = Kilometers(10600)
+    assert free() == 0
+    maintenance_service.record_completed_service(vehicle.maintenance_records[0])
+    assert free() == 1
+
+    # Due by date: free until the due time only
+    maintenance_service.register_service_plan(vehicle, "Inspection", None, timedelta(days=30))
+    assert free() == 1
+    assert free(clock.now() + timedelta(days=29, hours=12)) == 0
+
+def test_no_shows_release_their_car(db, reservation_service, customer, vehicle, location, clock):
+    """ Verifies that a reservation not picked up within the grace period stops holding a car. """
+    start = clock.now() + timedelta(hours=1)
+    end = start + timedelta(days=2)
+    book = lambda s, e: reservation_service.create_reservation(
+        customer, vehicle.vehicle_class, location, location, s, e, Money(0), [], None
+    )
+    missed = book(start, end)
+
+    clock._frozen_time = start + timedelta(hours=1)
+    assert reservation_service.expire_no_shows() == []
+    with pytest.raises(ValueError):
+        book(clock.now(), end)
+
+    clock._frozen_time = start + timedelta(hours=3)
+    assert reservation_service.expire_no_shows() == [missed]
+    assert missed.status == ReservationStatus.NO_SHOW
+    book(clock.now(), end)
+
+def test_branch_without_the_class_takes_bookings(db, reservation_service, customer, vehicle, location, clock):
+    """ Verifies that only branches stocking a class limit its bookings. """
+    airport = Location(name="Airport", address="1 Runway Rd")
+    start = clock.now() + timedelta(days=1)
+    end = start + timedelta(days=1)
+    book = lambda at: reservation_service.create_reservation(
+        customer, vehicle.vehicle_class, at, at, start, end, Money(0), [], None
+    )
+
+    book(airport)
+    book(airport)
+    book(location)
+    with pytest.raises(ValueError):
+        book(location)
+
+    # Once the airport has a car of the class, its bookings count against it
+    vehicle.location = airport
+    with pytest.raises(ValueError):
+        book(airport)
+
+def test_inventory_services_share_one_availability_cache(db, clock, vehicle, location):
+    """ Services built per request reuse the table's cache instead of attaching a view each. """
+    services = [InventoryService(db, clock) for _ in range(3)]
+    views = len(db.vehicles._views)
+
+    assert all(service.cache is services[0].cache for service in services)
+    assert InventoryService(db, clock).cache is services[0].cache
+    assert len(db.vehicles._views) == views
+
+    services[0].get_availability(location)
+    assert services[1].get_availability(location)["Economy"]["available"] == 1
+    assert services[0].cache.hits == 1
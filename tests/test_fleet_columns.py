@@ -0,0 +1,79 @@
+import pytest
+from datetime import timedelta
+
+np = pytest.importorskip("numpy")
+
+from crfms.domain.values import Money, Kilometers, FuelLevel
+from crfms.domain.fleet import Vehicle, VehicleClass, Location, VehicleState, MaintenanceRecord
+
+
+def _add_vehicle(db, plate, vehicle_class, location, odometer=10000, fuel=1.0):
+    vehicle = Vehicle(plate, Kilometers(odometer), FuelLevel(fuel), vehicle_class, location)
+    db.vehicles[vehicle.id] = vehicle
+    return vehicle
+
+def test_columns_follow_vehicle_changes(db, vehicle, location, clock, maintenance_service):
+    """ Verifies that the columns track odometer, fuel, state, moves and maintenance edits. """
+    columns = db.vehicles.columnar()
+    other = _add_vehicle(db, "XYZ-9", vehicle.vehicle_class, location, fuel=0.5)
+    assert len(columns) == 2
+    assert columns.average_fuel() == pytest.approx(0.75)
+
+    maintenance_service.register_service_plan(vehicle, "Oil Change", Kilometers(5000), None)
+    assert not columns.due_mask(clock.now()).any()
+
+    vehicle.odometer = Kilometers(14600)
+    assert columns.due_vehicles(clock.now()) == [vehicle]
+
+    # Editing the record itself moves the threshold
+    vehicle.maintenance_records[0].last_service_odometer = Kilometers(14000)
+    assert columns.due_vehicles(clock.now()) == []
+
+    downtown = Location(name="Downtown", address="2 Side St")
+    other.location = downtown
+    other.state = VehicleState.RENTED
+    assert columns.average_fuel(downtown.id) == 0.5
+    assert columns.availability_counts(clock.now()) == {
+        (location.id, vehicle.vehicle_class.id): (1, 0),
+        (downtown.id, vehicle.vehicle_class.id): (0, 0),
+    }
+
+    del db.vehicles[vehicle.id]
+    assert len(columns) == 1
+    assert columns.vehicle(0) is other
+
+def test_time_based_due_mask(db, vehicle, clock, maintenance_service):
+    """ Verifies that time thresholds are compared against the clock in the mask. """
+    maintenance_service.register_service_plan(vehicle, "Inspection", None, timedelta(days=365))
+    columns = db.vehicles.columnar()
+
+    assert not columns.due_mask(clock.now()).any()
+    assert columns.due_mask(clock.now() + timedelta(days=365)).all()
+
+def test_columnar_availability_matches_object_scan(db, clock, location, vehicle_class, inventory_service):
+    """ Verifies that the vectorized fleet-wide report equals the per-location index scans. """
+    db.vehicles.columnar()
+    suv = VehicleClass(name="SUV", base_rate=Money(90.0))
+    for i in range(20):
+        v = _add_vehicle(db, f"P-{i}", suv if i % 3 else vehicle_class, location, odometer=1000 * i)
+        if i % 4 == 0:
+            v.state = VehicleState.RENTED
+        if i % 5 == 0:
+            v.maintenance_records.append(MaintenanceRecord(
+                vehicle=v, service_type="Tires",
+                odometer_threshold=Kilometers(1000), last_service_odometer=Kilometers(0)
+            ))
+            v.notify("maintenance_records")
+
+    airport = Location(name="Airport", address="1 Runway Rd")
+    _add_vehicle(db, "AIR-1", vehicle_class, airport)
+
+    columnar = inventory_service.get_fleet_availability()
+    assert columnar == {
+        location.id: inventory_service.get_availability(location),
+        airport.id: inventory_service.get_availability(airport),
+    }
+    assert columnar[location.id]["SUV"]["maintenance_hold"] > 0
+
+    inventory_service._columns = lambda: None
+    assert inventory_service.get_fleet_availability() == columnar
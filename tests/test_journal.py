@@ -0,0 +1,189 @@
+import pytest
+from datetime import timedelta
+import os
+import uuid
+
+from crfms.domain.values import Money, Kilometers, FuelLevel
+from crfms.domain.fleet import Vehicle, VehicleState
+from crfms.domain.pricing import PricingPolicy, BaseDailyRateRule
+from crfms.domain.rental import InvoiceStatus, ReservationStatus
+from crfms.services.rental import RentalService
+from crfms.services.reservation import ReservationService
+from crfms.services.accounting import AccountingService
+from crfms.services.maintenance import MaintenanceService
+from crfms.persistence.journal import Journal
+
+
+@pytest.fixture
+def journal(tmp_path, db):
+    """ A journal in an empty directory. """
+    j = Journal(str(tmp_path / "journal"), batch_size=4)
+    yield j
+    j.close()
+
+@pytest.fixture
+def journaled(db, clock, notifier, payment_adapter, pricing_policy, journal, customer, vehicle):
+    """ Services that record into the journal, on top of a checkpoint of the seeded db. """
+    journal.checkpoint(db)
+
+    reservations = ReservationService(db, clock, notifier, journal)
+    rentals = RentalService(
+        db=db,
+        clock=clock,
+        pricing_policy=pricing_policy,
+        daily_mileage_allowance=Kilometers(100),
+        mileage_overage_fee_per_km=Money(value=0.5),
+        fuel_refill_charge=Money(value=75.0),
+        late_fee_per_hour=Money(value=25.0),
+        journal=journal
+    )
+    accounting = AccountingService(db, payment_adapter, notifier, journal)
+    return reservations, rentals, accounting
+
+def _rent_and_pay(reservations, rentals, accounting, customer, vehicle, clock):
+    res = reservations.create_reservation(
+        customer, vehicle.vehicle_class, vehicle.location, vehicle.location,
+        clock.now(), clock.now() + timedelta(days=1), Money(0), [], None
+    )
+    token = uuid.uuid4().hex
+    agreement = rentals.pickup_vehicle(res.id, vehicle.id, token)
+    clock._frozen_time = clock.now() + timedelta(days=1)
+    invoice = rentals.return_vehicle(agreement.id, Kilometers(10080), FuelLevel(0.5))
+    accounting.finalize_payment(invoice)
+    return token, agreement, invoice
+
+
+def test_recover_replays_journal_on_snapshot(db, journal, journaled, customer, vehicle, clock):
+    """ Verifies recovery rebuilds reservations, agreements, invoices and payments from the journal. """
+    token, agreement, invoice = _rent_and_pay(*journaled, customer, vehicle, clock)
+    journal.flush()
+
+    recovered = journal.recover()
+
+    assert recovered.agreements_by_token[token].id == agreement.id
+    restored = recovered.invoices_by_agreement[agreement.id]
+    assert restored.id == invoice.id
+    assert restored.status == InvoiceStatus.PAID
+    assert restored.total_amount == invoice.total_amount
+    assert recovered.vehicles[vehicle.id].state == VehicleState.CLEANING
+    assert len(recovered.payments) == 1
+
+def test_compaction_folds_journal_into_snapshot(db, journal, journaled, customer, vehicle, clock):
+    """ Verifies compaction removes folded segments and later records still replay on top. """
+    reservations, rentals, accounting = journaled
+    _, agreement, _ = _rent_and_pay(reservations, rentals, accounting, customer, vehicle, clock)
+
+    journal.compact().join()
+
+    segments = [n for n in os.listdir(journal.directory) if n.startswith("journal-")]
+    assert len(segments) == 1  # only the fresh, open segment is left
+
+    # A mutation after compaction lands in the new segment
+    later = reservations.create_reservation(
+        customer, vehicle.vehicle_class, vehicle.location, vehicle.location,
+        clock.now(), clock.now() + timedelta(days=3), Money(0), [], None
+    )
+    reservations.cancel_reservation(later.id)
+    journal.flush()
+
+    recovered = journal.recover()
+
+    assert agreement.id in recovered.rental_agreements
+    assert recovered.reservations[later.id].status == ReservationStatus.CANCELLED
+    assert len(recovered.reservations) == 2
+
+
+def test_completed_service_replays(db, journal, journaled, vehicle, clock):
+    """ Verifies that registered plans and completed services come back from the journal. """
+    maintenance = MaintenanceService(db, clock, journal)
+    maintenance.register_service_plan(vehicle, "Oil Change", Kilometers(5000), None)
+    vehicle.odometer = Kilometers(14800)
+    maintenance.record_completed_service(vehicle.maintenance_records[0])
+    journal.flush()
+
+    recovered = journal.recover()
+
+    plan = recovered.vehicles[vehicle.id].maintenance_records[0]
+    assert plan.last_service_odometer == Kilometers(14800)
+    assert plan.due_odometer == 14800 + 5000 - 500
+
+def test_batch_calls_replay(db, journal, journaled, customer, vehicle, clock):
+    """ Verifies that batch pickups and returns are journaled like single calls. """
+    reservations, rentals, _ = journaled
+    res = reservations.create_reservation(
+        customer, vehicle.vehicle_class, vehicle.location, vehicle.location,
+        clock.now(), clock.now() + timedelta(days=1), Money(0), [], None
+    )
+    token = uuid.uuid4().hex
+    agreement = rentals.pickup_many([(res.id, vehicle.id, token)]).succeeded[token]
+    clock._frozen_time = clock.now() + timedelta(days=1)
+    invoice = rentals.return_many([(agreement.id, Kilometers(10080), FuelLevel(0.5))]).succeeded[agreement.id]
+    journal.flush()
+
+    recovered = journal.recover()
+    assert recovered.agreements_by_token[token].id == agreement.id
+    assert recovered.invoices_by_agreement[agreement.id].total_amount == invoice.total_amount
+    assert recovered.vehicles[vehicle.id].state == VehicleState.CLEANING
+
+
+def test_recover_from_empty_directory(tmp_path, db, journal, journaled, customer, vehicle, clock):
+    """ A fresh directory recovers to an empty state; after a checkpoint, to the checkpoint plus the journal. """
+    empty = Journal(str(tmp_path / "empty"))
+    try:
+        assert len(empty.recover().vehicles) == 0
+    finally:
+        empty.close()
+
+    _, first, _ = _rent_and_pay(*journaled, customer, vehicle, clock)
+    seq = journal.checkpoint(db)
+
+    segments = [n for n in os.listdir(journal.directory) if n.startswith("journal-")]
+    assert segments == [f"journal-{seq + 1:012d}.log"]
+
+    vehicle.state = VehicleState.AVAILABLE
+    journal.checkpoint(db)
+    _, second, invoice = _rent_and_pay(*journaled, customer, vehicle, clock)
+    journal.flush()
+
+    recovered = journal.recover()
+    assert recovered.customers[customer.id].email == customer.email
+    assert first.id in recovered.rental_agreements and second.id in recovered.rental_agreements
+    assert recovered.invoices_by_agreement[second.id].status == InvoiceStatus.PAID
+    assert len(recovered.payments) == 2
+
+
+def test_batch_journals_returns_made_before_an_error(db, journal, journaled, customer, vehicle, clock):
+    """ Verifies that an unexpected error mid-batch keeps the returns already made journaled, and the failed one untouched. """
+    reservations, rentals, _ = journaled
+    second = Vehicle("XYZ-9", Kilometers(500), FuelLevel(1.0), vehicle.vehicle_class, vehicle.location)
+    db.vehicles[second.id] = second
+    journal.checkpoint(db)
+    picked = []
+    for car in (vehicle, second):
+        res = reservations.create_reservation(
+            customer, car.vehicle_class, car.location, car.location,
+            clock.now(), clock.now() + timedelta(days=1), Money(0), [], None
+        )
+        picked.append(rentals.pickup_vehicle(res.id, car.id, uuid.uuid4().hex))
+    first, broken = picked
+
+    class FailingRule(BaseDailyRateRule):
+        def cache_key(self, context):
+            return context.agreement.id.int
+
+        def charges_for(self, context):
+            if context.agreement is broken:
+                raise RuntimeError("Rate service unavailable")
+            return super().charges_for(context)
+
+    rentals.pricing_policy = PricingPolicy([FailingRule()])
+    clock._frozen_time = clock.now() + timedelta(days=1)
+    with pytest.raises(RuntimeError):
+        rentals.return_many([(first.id, Kilometers(10080), FuelLevel(0.5)), (broken.id, Kilometers(600), FuelLevel(1.0))])
+
+    assert broken.return_time is None and broken.end_odometer is None and second.state == VehicleState.RENTED
+    journal.flush()
+    recovered = journal.recover()
+    assert first.id in recovered.invoices_by_agreement
+    assert broken.id not in recovered.invoices_by_agreement
+    assert recovered.rental_agreements[broken.id].return_time is None
@@ -2,7 +2,7 @@ import pytest
 from datetime import timedelta
 
 from crfms.domain.values import Kilometers, FuelLevel
-from crfms.domain.fleet import Vehicle, MaintenanceRecord, VehicleState
+from crfms.domain.fleet import Vehicle, Location, MaintenanceRecord, VehicleState
 from crfms.domain.users import Customer
 
 def test_maintenance_due_by_odometer(db, vehicle, clock, maintenance_service):
@@ -86,4 +86,81 @@ def test_maintenance_service_listing(db, vehicle, location, clock, maintenance_s
     # Check list
     due_list = maintenance_service.list_due_vehicles(location)
     assert len(due_list) == 1
-    assert due_list[0].license_plate == vehicle.license_plate
\ No newline at end of file
+    assert due_list[0].license_plate == vehicle.license_plate
+
+
+def _fleet(db, vehicle, count):
+    vehicles = [vehicle]
+    for i in range(1, count):
+        v = Vehicle(f"FLT-{i}", Kilometers(10000), FuelLevel(1.0), vehicle.vehicle_class, vehicle.location)
+        db.vehicles[v.id] = v
+        vehicles.append(v)
+    return vehicles
+
+def test_next_due_queries(db, vehicle, clock, maintenance_service):
+    """ Verifies that the next vehicles coming due are ordered by km headroom and by date. """
+    fleet = _fleet(db, vehicle, 4)
+    for i, v in enumerate(fleet):
+        maintenance_service.register_service_plan(v, "Oil Change", Kilometers(1000 * (i + 1)), None)
+        maintenance_service.register_service_plan(v, "Inspection", None, timedelta(days=100 - i))
+
+    by_km = maintenance_service.next_due_by_km(2)
+    assert [(v.license_plate, km) for v, km in by_km] == [("ABC-123", 500), ("FLT-1", 1500)]
+
+    # Driving the third car moves it to the front
+    fleet[2].odometer = Kilometers(12400)
+    assert maintenance_service.next_due_by_km(1)[0] == (fleet[2], 100)
+
+    by_time = maintenance_service.next_due_by_time(4)
+    assert [v for v, _ in by_time] == list(reversed(fleet))
+    assert by_time[0][1] == clock.now() + timedelta(days=97)
+
+def test_completed_service_rearms_plan(db, vehicle, location, clock, maintenance_service):
+    """ Verifies that recording a service takes the vehicle off the due list until the next interval. """
+    maintenance_service.register_service_plan(vehicle, "Oil Change", Kilometers(5000), None)
+    vehicle.odometer = Kilometers(14600)
+    assert maintenance_service.list_due_vehicles(location) == [vehicle]
+    assert vehicle.can_be_assigned(clock) is False
+
+    maintenance_service.record_completed_service(vehicle.maintenance_records[0])
+
+    assert vehicle.maintenance_records[0].due_odometer == 14600 + 5000 - 500
+    assert maintenance_service.list_due_vehicles(location) == []
+    assert vehicle.can_be_assigned(clock) is True
+
+def test_due_schedule_matches_scan(db, vehicle, location, clock, maintenance_service):
+    """ Verifies that the heap-based due list equals the per-vehicle scan. """
+    fleet = _fleet(db, vehicle, 30)
+    for i, v in enumerate(fleet):
+        maintenance_service.register_service_plan(v, "Tires", Kilometers(500 + 100 * i), None)
+        maintenance_service.register_service_plan(v, "Inspection", None, timedelta(days=i))
+        v.odometer = Kilometers(10000 + 37 * i)
+
+    scheduled = maintenance_service.list_due_vehicles(location)
+    maintenance_service._schedule = lambda: None
+    scanned = maintenance_service.list_due_vehicles(location)
+    assert sorted(v.license_plate for v in scheduled) == sorted(v.license_plate for v in scanned)
+    assert 0 < len(scanned) < len(fleet)
+
+
+def test_due_vehicles_per_branch(db, vehicle, location, clock, maintenance_service):
+    """ Verifies that each branch lists only its own due vehicles, also after a vehicle moves. """
+    airport = Location(name="Airport", address="1 Runway Rd")
+    fleet = _fleet(db, vehicle, 6)
+    for i, v in enumerate(fleet):
+        if i % 2:
+            v.location = airport
+        maintenance_service.register_service_plan(v, "Oil Change", Kilometers(1000), None)
+        if i < 4:
+            v.odometer = Kilometers(10600)
+
+    def due_at(branch):
+        return sorted(v.license_plate for v in maintenance_service.list_due_vehicles(branch))
+
+    assert due_at(location) == ["ABC-123", "FLT-2"]
+    assert due_at(airport) == ["FLT-1", "FLT-3"]
+
+    fleet[2].location = airport
+    assert due_at(location) == ["ABC-123"]
+    assert due_at(airport) == ["FLT-1", "FLT-2", "FLT-3"]
+    assert len(maintenance_service.next_due_by_km(6)) == 6
@@ -0,0 +1,69 @@
+import pytest
+from datetime import timedelta
+
+from crfms.domain.values import Money
+from crfms.domain.users import Customer
+from crfms.domain.rental import Reservation, RentalAgreement, Invoice
+from crfms.persistence.records import CODECS
+from crfms.persistence.snapshot import write_snapshot, read_snapshot
+from crfms.persistence.sectioned import write_sectioned
+from crfms.persistence.parallel import parallel_read_snapshot, parallel_load_sectioned
+
+
+@pytest.fixture
+def populated(db, vehicle, clock):
+    """ Fills the database with a few dozen customers, reservations, agreements and invoices. """
+    for i in range(40):
+        customer = Customer(first_name=f"C{i}", last_name="Test", email=f"c{i}@mail.com")
+        db.customers[customer.id] = customer
+        reservation = Reservation(
+            customer=customer, vehicle_class=vehicle.vehicle_class,
+            pickup_location=vehicle.location, return_location=vehicle.location,
+            pickup_time=clock.now(), return_time=clock.now() + timedelta(days=1 + i % 3),
+            deposit_amount=Money(0)
+        )
+        agreement = RentalAgreement(
+            reservation=reservation, vehicle=vehicle, pickup_time=clock.now(),
+            start_odometer=vehicle.odometer, start_fuel_level=vehicle.fuel_level,
+            due_time=reservation.return_time
+        )
+        invoice = Invoice(rental_agreement=agreement, total_amount=Money(10.0 * i))
+        db.reservations[reservation.id] = reservation
+        db.rental_agreements[agreement.id] = agreement
+        db.invoices[invoice.id] = invoice
+        db.agreements_by_token[agreement.id.hex] = agreement
+    return db
+
+def _encoded(db):
+    return {name: sorted(str(encode(e)) for e in getattr(db, name).values())
+            for name, (encode, _) in CODECS.items()}
+
+def _assert_linked(db, vehicle):
+    agreements = list(db.rental_agreements.values())
+    assert all(a.vehicle is db.vehicles[vehicle.id] for a in agreements)
+    assert all(a.reservation is db.reservations[a.reservation.id] for a in agreements)
+    assert all(i.rental_agreement is db.rental_agreements[i.rental_agreement.id] for i in db.invoices.values())
+    assert len(db.agreements_by_token) == len(agreements)
+
+
+def test_parallel_line_snapshot_matches_serial(tmp_path, populated, vehicle):
+    """ Verifies the process-pool loader gives the same, fully linked state as the serial loader. """
+    path = str(tmp_path / "snapshot.jsonl")
+    write_snapshot(populated, path, seq=3)
+
+    serial, _ = read_snapshot(path)
+    parallel, seq = parallel_read_snapshot(path, workers=2)
+
+    assert seq == 3
+    assert _encoded(parallel) == _encoded(serial)
+    _assert_linked(parallel, vehicle)
+
+def test_parallel_sectioned_load(tmp_path, populated, vehicle):
+    """ Verifies chunked section decoding re-links references across sections. """
+    path = str(tmp_path / "snapshot.sec")
+    write_sectioned(populated, path)
+
+    loaded = parallel_load_sectioned(path, workers=2)
+
+    assert _encoded(loaded) == _encoded(populated)
+    _assert_linked(loaded, vehicle)
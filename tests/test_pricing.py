@@ -6,7 +6,10 @@ from crfms.domain.values import Money, Kilometers, FuelLevel, FixedClock
 from crfms.domain.fleet import VehicleClass, Vehicle, Location, VehicleState, AddOn, InsuranceTier
 from crfms.domain.users import Customer
 from crfms.domain.rental import Reservation, RentalAgreement, ReservationStatus
-from crfms.domain.pricing import PricingPolicy, BaseDailyRateRule, PerDayAddOnRule, InsuranceRule
+from crfms.domain.pricing import PricingPolicy, PricingRule, PricingContext, BaseDailyRateRule, PerDayAddOnRule, InsuranceRule, SeasonalRateRule
+from crfms.domain.rates import RateBook
+from crfms.domain.values import ChargeItem
+from crfms.services.quotes import QuoteService
 
 @pytest.mark.parametrize(
     "base_rate_val, duration_days, addons_data, insurance_rate_val, expected_total",
@@ -101,5 +104,187 @@ def test_pricing_calculation(
     # Assert
     calculated_total = sum(item.amount.value for item in charges)
     assert calculated_total == expected_total
+    assert policy.total_amount(agreement) == Money(expected_total)
     expected_items = 1 + len(addons_data) + (1 if insurance else 0)
-    assert len(charges) == expected_items
\ No newline at end of file
+    assert len(charges) == expected_items
+
+
+def test_money_is_exact_in_cents():
+    " Float amounts are stored as whole cents, so repeated sums don't drift."
+    dime = Money(0.1)
+    assert dime + Money(0.2) == Money(0.3)
+    assert Money.sum([dime] * 1_000_000) == Money(100_000)
+    assert Money(value=19.99) * 3 == Money.of_cents(5997)
+    assert (Money(10) - Money(12.5)).value == -2.5
+
+def test_common_money_amounts_are_interned():
+    " Small amounts are shared, but still behave as separate frozen values."
+    assert Money(50.0) is Money(value=50)
+    assert Money(0) is Money.sum([])
+    with pytest.raises(Exception):
+        Money(50.0).cents = 1
+
+class _FlatCleaningRule(PricingRule):
+    """ A rule written against the agreement only, like third-party rules. """
+    def calculate_charges(self, agreement):
+        return [ChargeItem("Cleaning", Money(15))]
+
+def test_compiled_policy_matches_rule_by_rule(customer, location):
+    " The compiled plan gives the same charges, keeps per-rule timings and runs plain rules too."
+    suv = VehicleClass(name="SUV", base_rate=Money(90.0))
+    vehicle = Vehicle("CMP-1", Kilometers(1000), FuelLevel(1.0), suv, location)
+    start = datetime(2025, 1, 1, 9, 0)
+    reservation = Reservation(
+        customer=customer, vehicle_class=suv, pickup_location=location, return_location=location,
+        pickup_time=start, return_time=start + timedelta(days=2), deposit_amount=Money(0),
+        add_ons=[AddOn(name="GPS", daily_rate=Money(7.5))],
+        insurance=InsuranceTier(name="Full", daily_rate=Money(19.99))
+    )
+    rules = [BaseDailyRateRule(), PerDayAddOnRule(), InsuranceRule(), _FlatCleaningRule()]
+    policy = PricingPolicy(rules)
+    compiled = policy.compile(profile=True)
+
+    for hours, km, fuel in [(0, 0, 1.0), (47, 150, 1.0), (49, 260, 0.5), (75, 900, 0.25)]:
+        agreement = RentalAgreement(
+            reservation=reservation, vehicle=vehicle, pickup_time=start,
+            start_odometer=Kilometers(1000), start_fuel_level=FuelLevel(1.0),
+            due_time=start + timedelta(days=2), return_time=start + timedelta(hours=hours),
+            end_odometer=Kilometers(1000 + km), end_fuel_level=FuelLevel(fuel)
+        )
+        fees = (Kilometers(100), Money(0.5), Money(75.0), Money(25.0))
+        assert agreement.calculate_final_charges(compiled, *fees) == agreement.calculate_final_charges(policy, *fees)
+
+    context = PricingContext.of(agreement)
+    assert (context.days, context.mileage_days, context.hours_late, context.driven_km) == (4, 4, 27, 900)
+    assert [(name, calls) for name, calls, _ in compiled.rule_timings()] == [
+        ("BaseDailyRateRule", 4), ("PerDayAddOnRule", 4), ("InsuranceRule", 4), ("_FlatCleaningRule", 4)
+    ]
+
+def test_quotes_are_cached_and_invalidated_by_rate_changes(customer, location):
+    " Quotes match the agreement price, are reused, and only the ones using a changed rate are dropped."
+    economy = VehicleClass(name="Economy", base_rate=Money(50.0))
+    suv = VehicleClass(name="SUV", base_rate=Money(90.0))
+    gps = AddOn(name="GPS", daily_rate=Money(7.5))
+    full = InsuranceTier(name="Full", daily_rate=Money(19.99))
+    quotes = QuoteService(PricingPolicy([BaseDailyRateRule(), PerDayAddOnRule(), InsuranceRule()]), max_size=3)
+
+    start = datetime(2025, 1, 1, 9, 0)
+    reservation = Reservation(
+        customer=customer, vehicle_class=economy, pickup_location=location, return_location=location,
+        pickup_time=start, return_time=start + timedelta(days=2, hours=1), deposit_amount=Money(0),
+        add_ons=[gps], insurance=full
+    )
+    agreement = RentalAgreement(
+        reservation=reservation, vehicle=Vehicle("Q-1", Kilometers(0), FuelLevel(1.0), economy, location),
+        pickup_time=start, start_odometer=Kilometers(0), start_fuel_level=FuelLevel(1.0),
+        due_time=reservation.return_time, return_time=reservation.return_time
+    )
+    assert quotes.quote(reservation) == quotes.pricing_policy.calculate_total(agreement)
+    assert quotes.quote_total(reservation) == Money(3 * (50 + 7.5 + 19.99))
+
+    # Same class, days and extras: served from the cache
+    quotes.quote_for(economy, start, start + timedelta(hours=50), [gps], full)
+    suv_quote = quotes.quote_for(suv, start, start + timedelta(days=1))
+    assert (quotes.hits, quotes.misses) == (2, 2)
+
+    gps.daily_rate = Money(8.0)
+    assert quotes.stats()["invalidations"] == 1
+    assert quotes.quote_total(reservation) == Money(3 * (50 + 8 + 19.99))
+    assert quotes.quote_for(suv, start, start + timedelta(days=1)) == suv_quote
+    assert quotes.hits == 3
+
+    # Least recently used quotes are evicted and their sources no longer watched
+    for days in range(1, 4):
+        quotes.quote_for(economy, start, start + timedelta(days=days))
+    assert quotes.stats()["size"] == 3 and quotes.evictions == 2
+    assert not gps._watchers and not suv._watchers
+
+def test_plain_rules_cannot_quote(customer, location):
+    " Rules that only read the agreement report that a quote is not possible."
+    quotes = QuoteService(PricingPolicy([_FlatCleaningRule()]))
+    economy = VehicleClass(name="Economy", base_rate=Money(50.0))
+    with pytest.raises(ValueError):
+        quotes.quote_for(economy, datetime(2025, 1, 1), datetime(2025, 1, 2))
+
+
+def test_seasonal_rates_match_day_by_day_pricing():
+    " Walking the rate segments gives the same charge as pricing every day on its own."
+    import random
+    rng = random.Random(7)
+    class_id, branch = uuid.uuid4(), uuid.uuid4()
+    base_rate = Money(50.0)
+    origin = datetime(2025, 1, 1)
+    book = RateBook()
+    for _ in range(40):
+        start = origin + timedelta(hours=rng.randrange(0, 24 * 400))
+        end = None if rng.random() < 0.1 else start + timedelta(hours=rng.randrange(1, 24 * 60))
+        weekend = Money.of_cents(rng.randrange(1000, 9000)) if rng.random() < 0.5 else None
+        daily = None if rng.random() < 0.1 else Money.of_cents(rng.randrange(1000, 9000))
+        book.set_rate(class_id, rng.choice([None, branch]), start, end, daily, weekend)
+
+    def day_by_day(table, pickup, days):
+        total = Money(0)
+        for day in range(days):
+            segment = table.segment_at(pickup + timedelta(days=day))
+            rate = base_rate
+            if segment is not None:
+                rate = segment.daily_rate if segment.daily_rate is not None else base_rate
+                if segment.weekend_rate is not None and (pickup + timedelta(days=day)).weekday() >= 5:
+                    rate = segment.weekend_rate
+            total += rate
+        return total
+
+    for location_id in (branch, None):
+        table = book.table(class_id, location_id)
+        charges = {}
+        for _ in range(300):
+            pickup = origin + timedelta(minutes=rng.randrange(-60 * 24 * 30, 60 * 24 * 450))
+            days = rng.randrange(0, 120)
+            assert table.charge(pickup, days, base_rate) == day_by_day(table, pickup, days)
+            # Rentals that cross the segments alike cost the same
+            key = (days, table.crossed(pickup, days))
+            assert charges.setdefault(key, table.charge(pickup, days, base_rate)) == table.charge(pickup, days, base_rate)
+
+def test_seasonal_rate_rule_uses_versioned_rate_book(customer, location):
+    " Agreements and quotes are priced from the rate book, by branch, and quotes follow rate changes."
+    economy = VehicleClass(name="Economy", base_rate=Money(50.0))
+    elsewhere = Location(name="Elsewhere", address="2 Side St")
+    book = RateBook()
+    summer, autumn = datetime(2025, 6, 1), datetime(2025, 9, 1)
+    first = book.set_rate(economy.id, None, summer, autumn, Money(80.0), weekend_rate=Money(95.0))
+    book.set_rate(economy.id, location.id, summer, None, Money(70.0))
+    policy = PricingPolicy([SeasonalRateRule(book), PerDayAddOnRule()])
+    quotes = QuoteService(policy)
+
+    # Fri 30 May to Tue 3 June: two base days, then Sun, Mon at the class-wide summer rates
+    pickup = datetime(2025, 5, 30, 10, 0)
+    assert quotes.quote_for(economy, pickup, pickup + timedelta(days=4), location=elsewhere)[0].amount == Money(50 + 50 + 95 + 80)
+    assert quotes.quote_for(economy, pickup, pickup + timedelta(days=4), location=location)[0].amount == Money(50 + 50 + 70 + 70)
+
+    reservation = Reservation(
+        customer=customer, vehicle_class=economy, pickup_location=location, return_location=location,
+        pickup_time=pickup, return_time=pickup + timedelta(days=4), deposit_amount=Money(0)
+    )
+    agreement = RentalAgreement(
+        reservation=reservation, vehicle=Vehicle("S-1", Kilometers(0), FuelLevel(1.0), economy, location),
+        pickup_time=pickup, start_odometer=Kilometers(0), start_fuel_level=FuelLevel(1.0),
+        due_time=reservation.return_time, return_time=reservation.return_time
+    )
+    assert policy.calculate_total(agreement) == quotes.quote(reservation)
+    assert quotes.hits == 1
+
+    # Pickups at other times in the same segments share a quote: Mon 10:00 and the next Mon 15:30
+    monday = datetime(2025, 6, 2, 10, 0)
+    later = monday + timedelta(days=7, hours=5, minutes=30)
+    assert quotes.quote_for(economy, monday, monday + timedelta(days=3), location=elsewhere)[0].amount == Money(3 * 80)
+    assert quotes.quote_for(economy, later, later + timedelta(days=3), location=elsewhere)[0].amount == Money(3 * 80)
+    assert quotes.hits == 2
+    # ...unless a different weekday meets the weekend rate
+    assert quotes.quote_for(economy, later + timedelta(days=4), later + timedelta(days=7), location=elsewhere)[0].amount == Money(80 + 95 + 95)
+    assert quotes.hits == 2
+
+    # A new version is priced at once; the old one stays readable
+    book.set_rate(economy.id, location.id, summer, autumn, Money(60.0))
+    assert quotes.quote(reservation)[0].amount == Money(50 + 50 + 60 + 60)
+    assert book.table(economy.id, location.id, version=first).segment_at(summer).daily_rate == Money(80.0)
+    assert book.table(economy.id, location.id).segment_at(autumn).daily_rate == Money(70.0)
@@ -1,10 +1,13 @@
 import pytest
+import random
 from datetime import datetime, timedelta
 import uuid
 
 from crfms.domain.values import Money, Kilometers, FuelLevel
-from crfms.domain.fleet import VehicleState
-from crfms.domain.rental import Reservation, RentalAgreement
+from crfms.domain.fleet import Vehicle, VehicleState, VehicleClass, MaintenanceRecord
+from crfms.domain.rental import Reservation, ReservationStatus, RentalAgreement
+from crfms.domain.pricing import PricingPolicy, BaseDailyRateRule
+from crfms.services.assignment import plan_assignments, expected_km, _rank
 
 def test_idempotent_pickup(db, rental_service, reservation_service, customer, vehicle, clock):
     """
@@ -98,6 +101,28 @@ def test_return_with_charges_and_penalties(db, rental_service, reservation_servi
     assert vehicle.state == VehicleState.CLEANING
     assert invoice.status.name == "PENDING"
 
+def test_idempotent_return(db, rental_service, reservation_service, customer, vehicle, clock):
+    """ Verifies that returning the same agreement twice gives back the first invoice. """
+    pickup_time = clock.now()
+    due_time = pickup_time + timedelta(days=1)
+
+    reservation = reservation_service.create_reservation(
+        customer, vehicle.vehicle_class, vehicle.location, vehicle.location,
+        pickup_time, due_time, Money(0), [], None
+    )
+    pickup_token = uuid.uuid4().hex
+    agreement = rental_service.pickup_vehicle(reservation.id, vehicle.id, pickup_token)
+
+    assert db.agreements_by_token[pickup_token] is agreement
+
+    clock._frozen_time = due_time
+    invoice1 = rental_service.return_vehicle(agreement.id, Kilometers(10050), FuelLevel(1.0))
+    invoice2 = rental_service.return_vehicle(agreement.id, Kilometers(10050), FuelLevel(1.0))
+
+    assert invoice2 is invoice1
+    assert len(db.invoices) == 1
+    assert db.invoices_by_agreement[agreement.id] is invoice1
+
 @pytest.mark.parametrize("has_conflict, expected_success", [
     (False, True),  # No conflict, extension approved
     (True, False)   # Conflict exists, extension denied
@@ -143,4 +168,233 @@ def test_extension_conflict_logic(
     if expected_success:
         assert agreement.due_time == new_due_time
     else:
-        assert agreement.due_time == original_due
\ No newline at end of file
+        assert agreement.due_time == original_due
+
+def test_extension_ignores_cancelled_and_other_class(
+    db, rental_service, reservation_service, customer, vehicle, clock
+):
+    """ Verifies that cancelled bookings and bookings for other classes don't block an extension. """
+    start_time = clock.now()
+    original_due = start_time + timedelta(days=1)
+
+    res = reservation_service.create_reservation(
+        customer, vehicle.vehicle_class, vehicle.location, vehicle.location,
+        start_time, original_due, Money(0), [], None
+    )
+    agreement = rental_service.pickup_vehicle(res.id, vehicle.id, uuid.uuid4().hex)
+
+    conflict_start = original_due + timedelta(days=1)
+    conflict_end = conflict_start + timedelta(hours=12)
+
+    # Same class, but cancelled
+    cancelled = reservation_service.create_reservation(
+        customer, vehicle.vehicle_class, vehicle.location, vehicle.location,
+        conflict_start, conflict_end, Money(0), [], None
+    )
+    reservation_service.cancel_reservation(cancelled.id)
+
+    # Overlapping, but for a different class
+    suv = VehicleClass(name="SUV", base_rate=Money(value=90.0))
+    suv_car = Vehicle("SUV-1", Kilometers(100), FuelLevel(1.0), suv, vehicle.location)
+    db.vehicles[suv_car.id] = suv_car
+    reservation_service.create_reservation(
+        customer, suv, vehicle.location, vehicle.location,
+        conflict_start, conflict_end, Money(0), [], None
+    )
+
+    new_due_time = original_due + timedelta(days=2)
+    assert rental_service.extend_rental(agreement.id, new_due_time) is True
+    assert agreement.due_time == new_due_time
+
+def test_pickup_wave_assignment(db, rental_service, reservation_service, maintenance_service, customer, vehicle, location, clock):
+    """ Verifies best-fit assignment by km headroom, fuel and service dates, and what is left unserved. """
+    def car(plate, fuel, km_plan=None, time_plan=None):
+        v = Vehicle(plate, Kilometers(20000), FuelLevel(fuel), vehicle.vehicle_class, location)
+        db.vehicles[v.id] = v
+        if km_plan or time_plan:
+            maintenance_service.register_service_plan(v, "Service", km_plan and Kilometers(km_plan), time_plan)
+        return v
+
+    wide = car("WIDE-1", 1.0, km_plan=1000)         # 500 km headroom
+    tight = car("TIGHT-1", 0.9, km_plan=750)        # 250 km headroom
+    emptier = car("TIGHT-2", 0.4, km_plan=750)      # 250 km headroom, less fuel
+    soon = car("SOON-1", 1.0, time_plan=timedelta(days=2))
+    car("GONE-1", 1.0).state = VehicleState.RENTED
+
+    start = clock.now() + timedelta(days=1)
+    def book(hours, offset=0):
+        return reservation_service.create_reservation(
+            customer, vehicle.vehicle_class, location, location,
+            start + timedelta(minutes=offset), start + timedelta(hours=hours), Money(0), [], None
+        )
+
+    week = book(7 * 24)          # 700 km: only the cars without km plans; SOON-1 falls due on the way
+    five = book(5 * 24, 1)       # 500 km
+    two = book(2 * 24, 2)        # 200 km
+    one = book(24, 3)            # 100 km
+    short = book(6, 4)
+    later = book(24, 6 * 60)     # outside the wave
+
+    extra = Reservation(
+        customer=customer, vehicle_class=vehicle.vehicle_class,
+        pickup_location=location, return_location=location,
+        pickup_time=start + timedelta(minutes=5), return_time=start + timedelta(hours=6),
+        deposit_amount=Money(0)
+    )
+    db.reservations[extra.id] = extra
+
+    plan = rental_service.assign_pickup_wave(location, start, start + timedelta(hours=1))
+    assert plan.assignments == {
+        week.id: vehicle, five.id: wide, two.id: tight, one.id: emptier, short.id: soon
+    }
+    assert plan.unassigned == [extra]
+    assert later.id not in plan.assignments
+
+    # Picked-up reservations leave the wave, their cars go back to the pool
+    rental_service.pickup_vehicle(week.id, vehicle.id, uuid.uuid4().hex)
+    db.reservations[extra.id].status = ReservationStatus.CANCELLED
+    plan = rental_service.assign_pickup_wave(location, start, start + timedelta(hours=1))
+    assert week.id not in plan.assignments and plan.unassigned == []
+    assert vehicle not in plan.assignments.values()
+
+def _assign_by_scan(reservations, vehicles, allowance):
+    """ The same greedy as plan_assignments, looking at every car for every reservation. """
+    ranks = {id(v): _rank(v, tie) for tie, v in enumerate(vehicles)}
+    order = sorted(reservations, key=lambda r: r.pickup_time)
+    order.sort(key=lambda r: (expected_km(r, allowance), r.return_time), reverse=True)
+
+    free, assignments, left_over = list(vehicles), {}, []
+    for r in order:
+        fits = [v for v in free if ranks[id(v)][0] >= expected_km(r, allowance) and ranks[id(v)][2] > r.return_time]
+        if fits:
+            best = min(fits, key=lambda v: ranks[id(v)])
+            assignments[r.id] = best
+            free.remove(best)
+        else:
+            left_over.append(r)
+    for r in left_over:
+        fits = [v for v in free if ranks[id(v)][2] > r.return_time]
+        if fits:
+            best = min(fits, key=lambda v: (-ranks[id(v)][0],) + ranks[id(v)][1:])
+            assignments[r.id] = best
+            free.remove(best)
+    return assignments
+
+def test_assignment_never_hands_out_cars_falling_due(customer, vehicle_class, location, clock):
+    """ Verifies the plan against a full scan, and that no car falls due before its trip ends. """
+    rng = random.Random(3)
+    start = clock.now()
+    vehicles = []
+    for i in range(60):
+        v = Vehicle(f"R-{i}", Kilometers(10000), FuelLevel(rng.choice([0.5, 1.0])), vehicle_class, location)
+        if i % 3:
+            v.maintenance_records.append(MaintenanceRecord(
+                vehicle=v, service_type="Service",
+                odometer_threshold=Kilometers(rng.randint(6, 20) * 100), last_service_odometer=Kilometers(10000),
+                time_threshold=timedelta(days=rng.randint(1, 10)), last_service_date=start
+            ))
+        vehicles.append(v)
+    reservations = [
+        Reservation(
+            customer=customer, vehicle_class=vehicle_class, pickup_location=location, return_location=location,
+            pickup_time=start + timedelta(minutes=i), return_time=start + timedelta(hours=rng.randint(6, 24 * 12)),
+            deposit_amount=Money(0)
+        )
+        for i in range(80)
+    ]
+
+    plan = plan_assignments(reservations, vehicles, 100)
+
+    assert plan.assignments == _assign_by_scan(reservations, vehicles, 100)
+    assert len(set(map(id, plan.assignments.values()))) == len(plan.assignments)
+    returns = {r.id: r.return_time for r in reservations}
+    assert all(_rank(v, 0)[2] > returns[r_id] for r_id, v in plan.assignments.items())
+    assert plan.unassigned and len(plan.unassigned) + len(plan.assignments) == len(reservations)
+
+def test_batch_pickup_and_return(db, rental_service, reservation_service, customer, vehicle, location, clock):
+    """ Verifies that batch calls process good items, report bad ones per item and price like single calls. """
+    second = Vehicle("XYZ-9", Kilometers(500), FuelLevel(1.0), vehicle.vehicle_class, location)
+    db.vehicles[second.id] = second
+    book = lambda: reservation_service.create_reservation(
+        customer, vehicle.vehicle_class, location, location,
+        clock.now(), clock.now() + timedelta(days=1), Money(0), [], None
+    )
+    first_res, second_res = book(), book()
+    tokens = [uuid.uuid4().hex for _ in range(4)]
+
+    picked = rental_service.pickup_many([
+        (first_res.id, vehicle.id, tokens[0]),
+        (second_res.id, vehicle.id, tokens[1]),      # car already taken by the first item
+        (uuid.uuid4(), second.id, tokens[2]),        # unknown reservation
+        (second_res.id, second.id, tokens[3]),
+        (first_res.id, vehicle.id, tokens[0]),       # retried item
+    ])
+    assert set(picked.succeeded) == {tokens[0], tokens[3]}
+    assert picked.failed == {
+        tokens[1]: "Vehicle cannot be assigned (maintenance due or rented).",
+        tokens[2]: "Reservation not found.",
+    }
+    assert second.state == VehicleState.RENTED
+
+    clock._frozen_time = clock.now() + timedelta(days=1, hours=3)
+    first, other = picked.succeeded[tokens[0]], picked.succeeded[tokens[3]]
+    single = rental_service.return_vehicle(first.id, Kilometers(10250), FuelLevel(0.5))
+
+    missing = uuid.uuid4()
+    returned = rental_service.return_many([
+        (first.id, Kilometers(0), FuelLevel(0.0)),   # already returned: the same invoice comes back
+        (missing, Kilometers(0), FuelLevel(0.0)),
+        (other.id, Kilometers(750), FuelLevel(0.5)),
+    ])
+    assert returned.succeeded[first.id] is single
+    assert returned.failed == {missing: "Rental agreement not found."}
+    assert returned.succeeded[other.id].total_amount == single.total_amount
+    assert second.state == VehicleState.CLEANING
+
+
+def test_failed_return_leaves_agreement_unchanged(db, rental_service, reservation_service, customer, vehicle, clock):
+    """ Verifies that a return rejected in a batch does not touch the agreement or the car. """
+    reservation = reservation_service.create_reservation(
+        customer, vehicle.vehicle_class, vehicle.location, vehicle.location,
+        clock.now(), clock.now() + timedelta(days=1), Money(0), [], None
+    )
+    agreement = rental_service.pickup_vehicle(reservation.id, vehicle.id, uuid.uuid4().hex)
+
+    returned = rental_service.return_many([(agreement.id, None, FuelLevel(0.5))])
+
+    assert returned.failed == {agreement.id: "End odometer and fuel level are required."}
+    assert (agreement.return_time, agreement.end_odometer, agreement.end_fuel_level) == (None, None, None)
+    assert vehicle.state == VehicleState.RENTED
+    assert agreement.id not in db.invoices_by_agreement
+
+def test_batch_return_prices_alike_agreements_once(db, rental_service, reservation_service, customer, vehicle, clock):
+    """ Verifies that a batch prices the rules once per charge key and bills like single returns. """
+    calls = []
+
+    class CountingRule(BaseDailyRateRule):
+        def charges_for(self, context):
+            calls.append(context.agreement.id)
+            return super().charges_for(context)
+
+    rental_service.pricing_policy = PricingPolicy([CountingRule()])
+    cars = [vehicle] + [
+        Vehicle(f"B-{i}", Kilometers(1000), FuelLevel(1.0), vehicle.vehicle_class, vehicle.location) for i in range(5)
+    ]
+    agreements = []
+    for car in cars:
+        db.vehicles[car.id] = car
+        reservation = reservation_service.create_reservation(
+            customer, car.vehicle_class, car.location, car.location,
+            clock.now(), clock.now() + timedelta(days=2), Money(0), [], None
+        )
+        agreements.append(rental_service.pickup_vehicle(reservation.id, car.id, uuid.uuid4().hex))
+
+    clock._frozen_time = clock.now() + timedelta(days=2, hours=3)
+    single = rental_service.return_vehicle(agreements[0].id, agreements[0].start_odometer + Kilometers(350), FuelLevel(0.5))
+    batch = rental_service.return_many([
+        (agreement.id, agreement.start_odometer + Kilometers(350), FuelLevel(0.5)) for agreement in agreements[1:]
+    ])
+
+    assert len(calls) == 2  # once for the single return, once for the whole batch
+    assert all(invoice.charge_items == single.charge_items for invoice in batch.succeeded.values())
+    assert all(invoice.total_amount == single.total_amount for invoice in batch.succeeded.values())
@@ -0,0 +1,60 @@
+import pytest
+import uuid
+
+from crfms.domain.values import Money, Kilometers, FuelLevel
+from crfms.domain.users import Customer
+from crfms.domain.rental import Reservation, RentalAgreement, Invoice
+from crfms.persistence.sectioned import write_sectioned, SectionedSnapshot
+
+
+@pytest.fixture
+def container(tmp_path, db, customer, vehicle, clock):
+    """ Writes a sectioned snapshot with an extra, unrelated customer and one invoice. """
+    bystander = Customer(first_name="Will", last_name="Turner", email="will@mail.com")
+    db.customers[bystander.id] = bystander
+
+    reservation = Reservation(
+        customer=customer, vehicle_class=vehicle.vehicle_class,
+        pickup_location=vehicle.location, return_location=vehicle.location,
+        pickup_time=clock.now(), return_time=clock.now(), deposit_amount=Money(0)
+    )
+    agreement = RentalAgreement(
+        reservation=reservation, vehicle=vehicle, pickup_time=clock.now(),
+        start_odometer=vehicle.odometer, start_fuel_level=vehicle.fuel_level,
+        due_time=clock.now()
+    )
+    invoice = Invoice(rental_agreement=agreement, total_amount=Money(120.0))
+    db.reservations[reservation.id] = reservation
+    db.rental_agreements[agreement.id] = agreement
+    db.invoices[invoice.id] = invoice
+    db.agreements_by_token[agreement.id.hex] = agreement
+
+    path = str(tmp_path / "snapshot.sec")
+    write_sectioned(db, path)
+    return path, invoice, bystander
+
+
+def test_header_and_single_record_lookup(container, customer):
+    """ Verifies section counts come from the header and records can be found by ID. """
+    path, invoice, bystander = container
+
+    with SectionedSnapshot(path) as snap:
+        assert snap.count("customers") == 2
+        assert snap.count("invoices") == 1
+        assert snap.record("customers", bystander.id)["email"] == "will@mail.com"
+        assert snap.record("customers", uuid.uuid4()) is None
+
+def test_partial_load_only_pulls_referenced_records(container, customer, vehicle):
+    """ Verifies loading vehicles and invoices hydrates only the records they reference. """
+    path, invoice, bystander = container
+
+    with SectionedSnapshot(path) as snap:
+        db = snap.load(["vehicles", "invoices"])
+
+    loaded = db.invoices[invoice.id]
+    assert loaded.total_amount == Money(120.0)
+    assert loaded.rental_agreement.vehicle is db.vehicles[vehicle.id]
+    assert loaded.rental_agreement.reservation.customer is db.customers[customer.id]
+    # The unrelated customer was never decoded
+    assert bystander.id not in db.customers
+    assert db.invoices_by_agreement[loaded.rental_agreement.id] is loaded
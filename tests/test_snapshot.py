@@ -0,0 +1,122 @@
+import pytest
+from datetime import timedelta
+
+from crfms.domain.values import Money, ValueCache
+from crfms.domain.rental import Reservation, RentalAgreement, Invoice
+from crfms.persistence.snapshot import write_snapshot, read_snapshot, iter_snapshot, stream_snapshot
+
+
+@pytest.fixture
+def snapshot_path(tmp_path, db, customer, vehicle, clock):
+    """ Writes a snapshot holding the conftest data plus two invoices. """
+    for days in (1, 2):
+        reservation = Reservation(
+            customer=customer,
+            vehicle_class=vehicle.vehicle_class,
+            pickup_location=vehicle.location,
+            return_location=vehicle.location,
+            pickup_time=clock.now(),
+            return_time=clock.now() + timedelta(days=days),
+            deposit_amount=Money(0)
+        )
+        agreement = RentalAgreement(
+            reservation=reservation,
+            vehicle=vehicle,
+            pickup_time=clock.now(),
+            start_odometer=vehicle.odometer,
+            start_fuel_level=vehicle.fuel_level,
+            due_time=reservation.return_time
+        )
+        invoice = Invoice(rental_agreement=agreement, total_amount=Money(50.0 * days))
+        db.reservations[reservation.id] = reservation
+        db.rental_agreements[agreement.id] = agreement
+        db.invoices[invoice.id] = invoice
+
+    path = str(tmp_path / "snapshot.jsonl")
+    write_snapshot(db, path, seq=7)
+    return path
+
+
+def test_iterator_mode_streams_one_collection(snapshot_path, db):
+    """ Verifies that the iterator yields only the requested section, as flat records. """
+    records = list(iter_snapshot(snapshot_path, ["invoices"]))
+
+    assert [c for c, _ in records] == ["invoices", "invoices"]
+    assert sorted(r["total_amount"] for _, r in records) == [50.0, 100.0]
+    # References stay IDs, nothing is hydrated
+    assert all(r["rental_agreement"] in {a.id.hex for a in db.rental_agreements.values()} for _, r in records)
+
+def test_callback_mode(snapshot_path):
+    """ Verifies that callbacks are called per record of their collection. """
+    seen = {"invoices": 0, "rental_agreements": 0}
+    stream_snapshot(snapshot_path, {
+        "invoices": lambda r: seen.__setitem__("invoices", seen["invoices"] + 1),
+        "rental_agreements": lambda r: seen.__setitem__("rental_agreements", seen["rental_agreements"] + 1),
+    })
+
+    assert seen == {"invoices": 2, "rental_agreements": 2}
+
+def test_full_load_restores_shared_objects(snapshot_path, db, vehicle):
+    """ Verifies the full loader rebuilds the graph with one object per entity. """
+    loaded, seq = read_snapshot(snapshot_path)
+
+    assert seq == 7
+    assert len(loaded.invoices) == 2
+    agreements = list(loaded.rental_agreements.values())
+    assert agreements[0].vehicle is agreements[1].vehicle is loaded.vehicles[vehicle.id]
+    assert agreements[0].reservation.customer is agreements[1].reservation.customer
+
+def test_shared_entities_are_stored_once(tmp_path, db, customer, vehicle, clock):
+    """ Verifies a customer and vehicle shared by many rentals are written once and referenced by ID. """
+    for days in range(1, 6):
+        reservation = Reservation(
+            customer=customer, vehicle_class=vehicle.vehicle_class,
+            pickup_location=vehicle.location, return_location=vehicle.location,
+            pickup_time=clock.now(), return_time=clock.now() + timedelta(days=days),
+            deposit_amount=Money(0)
+        )
+        db.reservations[reservation.id] = reservation
+
+    path = str(tmp_path / "shared.jsonl")
+    write_snapshot(db, path)
+
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    assert text.count(customer.email) == 1
+    assert text.count(vehicle.license_plate) == 1
+    assert text.count(customer.id.hex) == 1 + 5  # its own record + one reference per reservation
+
+    loaded, _ = read_snapshot(path)
+    customers = {id(r.customer) for r in loaded.reservations.values()}
+    assert customers == {id(loaded.customers[customer.id])}
+
+
+def test_load_shares_repeated_values(snapshot_path):
+    """ Verifies that repeated odometer/fuel values are one shared object after loading. """
+    values = ValueCache()
+    loaded, _ = read_snapshot(snapshot_path, values)
+
+    first, second = loaded.rental_agreements.values()
+    assert first.start_odometer is second.start_odometer
+    assert first.start_fuel_level is second.start_fuel_level
+    # The vehicle's own odometer and fuel level are hits as well
+    assert first.start_odometer is first.vehicle.odometer
+    stats = values.stats()
+    assert stats["hits"] >= 4
+    assert 0 < stats["hit_rate"] < 1
+
+    # Each load has its own cache, so its stats cover that load alone
+    again = ValueCache()
+    reloaded, _ = read_snapshot(snapshot_path, again)
+    assert again.stats() == stats
+    assert next(iter(reloaded.rental_agreements.values())).start_odometer is not first.start_odometer
+
+def test_charge_items_count_one_lookup():
+    """ A charge item is one hit or miss; its interned description is not counted again. """
+    values = ValueCache()
+    first = values.charge_item("Late", Money(5))
+    assert (values.hits, values.misses) == (0, 1)
+
+    assert values.charge_item("Late", Money(5)) is first
+    assert values.description("Late") is first.description
+    assert (values.hits, values.misses) == (2, 1)
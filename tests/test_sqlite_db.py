@@ -0,0 +1,178 @@
+import pytest
+from datetime import datetime, timedelta
+import uuid
+
+from crfms.domain.values import FixedClock, Money, Kilometers, FuelLevel
+from crfms.domain.fleet import Location, VehicleClass, Vehicle, VehicleState
+from crfms.domain.users import Customer
+from crfms.domain.pricing import PricingPolicy, BaseDailyRateRule
+from crfms.domain.rental import InvoiceStatus
+from crfms.services.rental import RentalService
+from crfms.services.reservation import ReservationService
+from crfms.services.accounting import AccountingService
+from crfms.services.inventory import InventoryService
+from crfms.services.maintenance import MaintenanceService
+from crfms.adapters.notifications import InMemoryNotificationAdapter
+from crfms.adapters.payments import FakePaymentAdapter
+from crfms.persistence.sqlite_db import SqliteDatabase
+
+
+@pytest.fixture
+def sqlite_path(tmp_path):
+    """ Path to a fresh SQLite file. """
+    return str(tmp_path / "crfms.db")
+
+@pytest.fixture
+def seeded(sqlite_path):
+    """ A SQLite database with one customer, branch, class and vehicle. """
+    db = SqliteDatabase(sqlite_path)
+
+    customer = Customer(first_name="Jack", last_name="Sparrow", email="jack@mail.com")
+    db.customers[customer.id] = customer
+
+    location = Location(name="Some Place", address="123 Street")
+    db.locations[location.id] = location
+
+    vc = VehicleClass(name="Economy", base_rate=Money(value=50.0))
+    db.vehicle_classes[vc.id] = vc
+
+    vehicle = Vehicle(
+        license_plate="ABC-123",
+        odometer=Kilometers(10000),
+        fuel_level=FuelLevel(1.0),
+        vehicle_class=vc,
+        location=location
+    )
+    db.vehicles[vehicle.id] = vehicle
+
+    yield db, customer, location, vehicle
+    db.pool.close_all()
+
+
+def test_services_run_on_sqlite(seeded, sqlite_path):
+    """ Runs reservation -> pickup -> return -> payment on SQLite and reads it back from disk. """
+    db, customer, location, vehicle = seeded
+    clock = FixedClock(datetime(2025, 11, 1, 9, 0))
+    notifier = InMemoryNotificationAdapter()
+
+    reservations = ReservationService(db, clock, notifier)
+    rentals = RentalService(
+        db=db,
+        clock=clock,
+        pricing_policy=PricingPolicy(rules=[BaseDailyRateRule()]),
+        daily_mileage_allowance=Kilometers(100),
+        mileage_overage_fee_per_km=Money(value=0.5),
+        fuel_refill_charge=Money(value=75.0),
+        late_fee_per_hour=Money(value=25.0)
+    )
+    accounting = AccountingService(db, FakePaymentAdapter(), notifier)
+    inventory = InventoryService(db, clock)
+
+    res = reservations.create_reservation(
+        customer, vehicle.vehicle_class, location, location,
+        clock.now(), clock.now() + timedelta(days=2), Money(0), [], None
+    )
+    token = uuid.uuid4().hex
+    agreement = rentals.pickup_vehicle(res.id, vehicle.id, token)
+
+    assert rentals.pickup_vehicle(res.id, vehicle.id, token) is agreement
+    assert inventory.get_availability(location)["Economy"]["available"] == 0
+
+    clock._frozen_time = clock.now() + timedelta(days=2)
+    invoice = rentals.return_vehicle(agreement.id, Kilometers(10150), FuelLevel(1.0))
+    accounting.finalize_payment(invoice)
+
+    assert invoice.total_amount.value == 100.0
+    assert db.vehicles.in_state(VehicleState.CLEANING) == [vehicle]
+
+    db.close()
+
+    # Reopen and hydrate from disk
+    reopened = SqliteDatabase(sqlite_path)
+    stored_invoice = reopened.invoices_by_agreement[agreement.id]
+
+    assert stored_invoice.status == InvoiceStatus.PAID
+    assert stored_invoice.total_amount.value == 100.0
+    assert stored_invoice.rental_agreement.end_odometer == Kilometers(10150)
+    assert stored_invoice.rental_agreement.vehicle is reopened.vehicles[vehicle.id]
+    assert reopened.vehicles[vehicle.id].state == VehicleState.CLEANING
+    assert len(reopened.payments) == 1
+    reopened.pool.close_all()
+
+def test_index_queries_follow_changes(seeded):
+    """ Verifies that SQL-backed index queries see in-memory state changes right away. """
+    db, customer, location, vehicle = seeded
+
+    assert db.vehicles.at_location(location.id) == [vehicle]
+    assert db.vehicles.classes_at(location.id) == [vehicle.vehicle_class.id]
+
+    vehicle.state = VehicleState.OUT_OF_SERVICE
+
+    assert db.vehicles.in_state(VehicleState.AVAILABLE) == []
+    assert db.vehicles.in_state(VehicleState.OUT_OF_SERVICE) == [vehicle]
+
+
+def test_service_changes_survive_without_commit(seeded, sqlite_path):
+    """ Every change a service makes is written through, so nothing is lost if commit() never runs. """
+    db, customer, location, vehicle = seeded
+    clock = FixedClock(datetime(2025, 11, 1, 9, 0))
+    notifier = InMemoryNotificationAdapter()
+    rentals = RentalService(
+        db=db, clock=clock, pricing_policy=PricingPolicy(rules=[BaseDailyRateRule()]),
+        daily_mileage_allowance=Kilometers(100), mileage_overage_fee_per_km=Money(value=0.5),
+        fuel_refill_charge=Money(value=75.0), late_fee_per_hour=Money(value=25.0)
+    )
+    maintenance = MaintenanceService(db, clock)
+    maintenance.register_service_plan(vehicle, "Oil", Kilometers(5000), timedelta(days=180))
+
+    res = ReservationService(db, clock, notifier).create_reservation(
+        customer, vehicle.vehicle_class, location, location,
+        clock.now(), clock.now() + timedelta(days=1), Money(0), [], None
+    )
+    agreement = rentals.pickup_vehicle(res.id, vehicle.id, uuid.uuid4().hex)
+    clock._frozen_time = clock.now() + timedelta(days=1)
+    invoice = rentals.return_vehicle(agreement.id, Kilometers(10400), FuelLevel(0.5))
+    AccountingService(db, FakePaymentAdapter(), notifier).finalize_payment(invoice)
+    maintenance.record_completed_service(vehicle.maintenance_records[0], Kilometers(10400))
+
+    # Simulated crash: connections go away without commit()
+    db.pool.close_all()
+
+    reopened = SqliteDatabase(sqlite_path)
+    stored = reopened.invoices_by_agreement[agreement.id]
+    assert stored.status == InvoiceStatus.PAID
+    assert stored.total_amount == invoice.total_amount
+    assert [item.description for item in stored.charge_items] == [item.description for item in invoice.charge_items]
+    assert stored.rental_agreement.end_odometer == Kilometers(10400)
+    assert stored.rental_agreement.end_fuel_level == FuelLevel(0.5)
+    assert reopened.vehicles[vehicle.id].maintenance_records[0].last_service_odometer == Kilometers(10400)
+    assert reopened.commit() == 0
+    reopened.pool.close_all()
+
+
+def test_agreements_are_found_by_reservation(seeded, sqlite_path):
+    """ The indexed reservation lookup serves pickup waves on SQLite and survives a reopen. """
+    db, customer, location, vehicle = seeded
+    clock = FixedClock(datetime(2025, 11, 1, 9, 0))
+    rentals = RentalService(
+        db=db, clock=clock, pricing_policy=PricingPolicy(rules=[BaseDailyRateRule()]),
+        daily_mileage_allowance=Kilometers(100), mileage_overage_fee_per_km=Money(value=0.5),
+        fuel_refill_charge=Money(value=75.0), late_fee_per_hour=Money(value=25.0)
+    )
+    res = ReservationService(db, clock, InMemoryNotificationAdapter()).create_reservation(
+        customer, vehicle.vehicle_class, location, location,
+        clock.now(), clock.now() + timedelta(days=1), Money(0), [], None
+    )
+    window = (clock.now(), clock.now() + timedelta(hours=1))
+
+    assert db.rental_agreements.for_reservation(res.id) is None
+    assert rentals.assign_pickup_wave(location, *window).assignments == {res.id: vehicle}
+
+    agreement = rentals.pickup_vehicle(res.id, vehicle.id, uuid.uuid4().hex)
+    assert db.rental_agreements.for_reservation(res.id) is agreement
+    assert rentals.assign_pickup_wave(location, *window).assignments == {}
+
+    db.pool.close_all()
+    reopened = SqliteDatabase(sqlite_path)
+    assert reopened.rental_agreements.for_reservation(res.id).id == agreement.id
+    reopened.pool.close_all()
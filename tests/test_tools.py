@@ -0,0 +1,90 @@
+import os
+import subprocess
+import sys
+import pytest
+from datetime import timedelta
+
+from crfms.domain.values import Money
+from crfms.domain.rental import Reservation, RentalAgreement, Invoice, InvoiceStatus
+from crfms.persistence.snapshot import write_snapshot, read_snapshot
+from crfms.persistence.sectioned import MAGIC
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(script, *args):
+    """ Runs a CLI script from the repository root, like the README does. """
+    result = subprocess.run(
+        [sys.executable, script, *args], cwd=ROOT, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout
+
+@pytest.fixture
+def snapshot(tmp_path, db, customer, vehicle, clock):
+    """ A line snapshot with one vehicle, one active rental and three paid invoices. """
+    for i, amount in enumerate([0.1, 0.2, 0.3, 40.0]):
+        reservation = Reservation(
+            customer=customer, vehicle_class=vehicle.vehicle_class,
+            pickup_location=vehicle.location, return_location=vehicle.location,
+            pickup_time=clock.now(), return_time=clock.now() + timedelta(days=1),
+            deposit_amount=Money(0)
+        )
+        agreement = RentalAgreement(
+            reservation=reservation, vehicle=vehicle, pickup_time=clock.now(),
+            start_odometer=vehicle.odometer, start_fuel_level=vehicle.fuel_level,
+            due_time=reservation.return_time
+        )
+        db.reservations[reservation.id] = reservation
+        db.rental_agreements[agreement.id] = agreement
+        if i < 3:
+            agreement.return_time = reservation.return_time
+            invoice = Invoice(rental_agreement=agreement, total_amount=Money(amount), status=InvoiceStatus.PAID)
+            db.invoices[invoice.id] = invoice
+
+    path = str(tmp_path / "snapshot.jsonl")
+    write_snapshot(db, path)
+    return path
+
+@pytest.mark.parametrize("workers", ["1", "2"])
+def test_reporter_reads_snapshots(snapshot, workers):
+    """ The report loads a line snapshot, serially or in a process pool. """
+    out = _run("reporter.py", snapshot, "--workers", workers)
+
+    assert "- Economy: 1" in out
+    assert "- Active Rentals: 1" in out
+    assert "- Completed Rentals: 3" in out
+
+def test_reporter_sums_revenue_in_cents(snapshot):
+    """ The revenue totals come from Money.sum over the stored cents. """
+    out = _run("reporter.py", snapshot)
+
+    assert "- Total Revenue (Paid):    $0.60" in out
+    assert "- Pending Revenue:         $0.00" in out
+    assert "1. jack@mail.com: $0.60" in out
+
+@pytest.mark.parametrize("workers", ["1", "2"])
+def test_converter_round_trip(tmp_path, snapshot, workers):
+    """ Converts to a sectioned container and back without losing entities. """
+    sectioned, lines = str(tmp_path / "snapshot.bin"), str(tmp_path / "back.jsonl")
+
+    _run("converter.py", snapshot, sectioned, "--workers", workers)
+    with open(sectioned, "rb") as f:
+        assert f.read(len(MAGIC)) == MAGIC
+    _run("converter.py", sectioned, lines, "--workers", workers)
+
+    original, back = read_snapshot(snapshot)[0], read_snapshot(lines)[0]
+    assert set(back.invoices) == set(original.invoices)
+    assert set(back.rental_agreements) == set(original.rental_agreements)
+    assert "- Completed Rentals: 3" in _run("reporter.py", sectioned)
+
+def test_reporter_loads_reported_sections_only(tmp_path, snapshot):
+    """ Loading just the reported sections of a container gives the same report as the whole line snapshot. """
+    sectioned = str(tmp_path / "snapshot.bin")
+    _run("converter.py", snapshot, sectioned)
+
+    def report(path):
+        return _run("reporter.py", path).split(" CRFMS SYSTEM REPORT ")[1]
+
+    assert report(sectioned) == report(snapshot)
+    assert "1. jack@mail.com: $0.60" in report(sectioned)
@@ -0,0 +1,89 @@
+import pytest
+import random
+from datetime import datetime, timedelta
+
+np = pytest.importorskip("numpy")
+
+from crfms.domain.values import Money, Kilometers, FuelLevel
+from crfms.domain.fleet import VehicleClass, Vehicle, Location
+from crfms.domain.rental import Reservation, RentalAgreement, Invoice, LATE_FEE, MILEAGE_FEE, FUEL_CHARGE
+from crfms.domain.pricing import PricingPolicy, BaseDailyRateRule
+from crfms.persistence.snapshot import write_snapshot
+from crfms.persistence.sectioned import write_sectioned
+from crfms.persistence.what_if import what_if_revenue
+from crfms.services.batch_pricing import BatchPricingEngine
+
+STORED_FEES = (Kilometers(100), Money(0.35), Money(75.0), Money(12.5))
+NEW_FEES = (Kilometers(150), Money(0.5), Money(60.0), Money(20.0))
+
+
+@pytest.fixture
+def history(db, customer, location):
+    """ Invoices priced with STORED_FEES for two classes at two branches, plus one rental still out. """
+    rng = random.Random(11)
+    policy = PricingPolicy([BaseDailyRateRule()])
+    branches = [location, Location(name="Airport", address="1 Runway Rd")]
+    classes = [VehicleClass(name="Economy", base_rate=Money(50.0)), VehicleClass(name="SUV", base_rate=Money(95.0))]
+    for entity in branches[1:]:
+        db.locations[entity.id] = entity
+    for entity in classes:
+        db.vehicle_classes[entity.id] = entity
+
+    start = datetime(2025, 3, 1, 8, 0)
+    for i in range(120):
+        vehicle_class, branch = rng.choice(classes), rng.choice(branches)
+        vehicle = Vehicle(f"W-{i}", Kilometers(1000), FuelLevel(1.0), vehicle_class, branch)
+        pickup = start + timedelta(minutes=rng.randint(0, 60 * 24 * 60))
+        due = pickup + timedelta(days=rng.randint(1, 7))
+        reservation = Reservation(
+            customer=customer, vehicle_class=vehicle_class, pickup_location=branch, return_location=branch,
+            pickup_time=pickup, return_time=due, deposit_amount=Money(0)
+        )
+        agreement = RentalAgreement(
+            reservation=reservation, vehicle=vehicle, pickup_time=pickup, due_time=due,
+            start_odometer=Kilometers(1000), start_fuel_level=FuelLevel(1.0)
+        )
+        if i:
+            agreement.return_time = due + timedelta(minutes=rng.randint(-600, 3000))
+            agreement.end_odometer = Kilometers(1000 + rng.randint(0, 1500))
+            agreement.end_fuel_level = FuelLevel(rng.choice([1.0, 0.5]))
+            invoice = Invoice(rental_agreement=agreement, charge_items=agreement.calculate_final_charges(policy, *STORED_FEES))
+            invoice.calculate_total()
+            db.invoices[invoice.id] = invoice
+        db.vehicles[vehicle.id] = vehicle
+        db.reservations[reservation.id] = reservation
+        db.rental_agreements[agreement.id] = agreement
+    return db
+
+def _expected(db):
+    """ Re-prices invoice by invoice on the entities, keeping the non-penalty lines. """
+    policy = PricingPolicy([BaseDailyRateRule()])
+    penalties = (LATE_FEE, MILEAGE_FEE, FUEL_CHARGE)
+    groups = {}
+    for invoice in db.invoices.values():
+        agreement = invoice.rental_agreement
+        kept = [item for item in invoice.charge_items if item.description not in penalties]
+        new_items = [item for item in agreement.calculate_final_charges(policy, *NEW_FEES) if item.description in penalties]
+        key = (agreement.reservation.vehicle_class.name, agreement.reservation.pickup_location.name)
+        count, stored, what_if = groups.get(key, (0, Money(0), Money(0)))
+        groups[key] = (count + 1, stored + invoice.total_amount, what_if + Money.sum(i.amount for i in kept + new_items))
+    return groups
+
+@pytest.mark.parametrize("writer", [lambda db, path: write_snapshot(db, path), write_sectioned])
+def test_what_if_matches_invoice_by_invoice_repricing(tmp_path, history, writer):
+    """ Verifies the process-pool totals per class and branch against re-pricing each invoice. """
+    path = str(tmp_path / "history")
+    writer(history, path)
+
+    report = what_if_revenue(path, BatchPricingEngine(*NEW_FEES), workers=2)
+
+    assert {
+        (row.vehicle_class, row.location): (row.invoices, row.stored, row.what_if) for row in report.rows
+    } == _expected(history)
+    assert report.skipped == 0
+    assert report.stored == Money.sum(invoice.total_amount for invoice in history.invoices.values())
+    assert report.delta == report.what_if - report.stored
+    assert report.delta != Money(0)
+
+    unchanged = what_if_revenue(path, BatchPricingEngine(*STORED_FEES), workers=2)
+    assert unchanged.delta == Money(0)
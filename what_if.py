@@ -0,0 +1,54 @@
+import argparse
+import sys
+import os
+
+# Ensure src is in pythonpath
+sys.path.append(os.path.join(os.getcwd(), 'src'))
+
+from crfms.domain.values import Money, Kilometers
+from crfms.persistence.what_if import what_if_revenue
+from crfms.services.batch_pricing import BatchPricingEngine
+
+def main():
+    parser = argparse.ArgumentParser(description="CRFMS What-If Penalty Re-pricing")
+    parser.add_argument("snapshot", help="Path to a line or sectioned snapshot")
+    parser.add_argument("--late-fee", type=float, required=True, help="Late fee per started hour")
+    parser.add_argument("--mileage-allowance", type=int, required=True, help="Free km per rental day")
+    parser.add_argument("--overage-fee", type=float, required=True, help="Fee per km over the allowance")
+    parser.add_argument("--fuel-charge", type=float, required=True, help="Refill charge when returned with less fuel")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (default: CPU count)")
+
+    args = parser.parse_args()
+
+    engine = BatchPricingEngine(
+        daily_mileage_allowance=Kilometers(args.mileage_allowance),
+        mileage_overage_fee_per_km=Money(args.overage_fee),
+        fuel_refill_charge=Money(args.fuel_charge),
+        late_fee_per_hour=Money(args.late_fee)
+    )
+
+    print(f"Re-pricing {args.snapshot} with {args.workers} workers...")
+    try:
+        report = what_if_revenue(args.snapshot, engine, args.workers)
+    except Exception as e:
+        print(f"Error re-pricing snapshot: {e}")
+        sys.exit(1)
+
+    print(" CRFMS WHAT-IF REPORT ")
+    print(f"\n{'Class':<16}{'Branch':<20}{'Invoices':>10}{'Stored':>16}{'What-if':>16}{'Delta':>14}")
+    for row in report.rows:
+        print(
+            f"{row.vehicle_class:<16.16}{row.location:<20.20}{row.invoices:>10,}"
+            f"{row.stored.value:>16,.2f}{row.what_if.value:>16,.2f}{row.delta.value:>+14,.2f}"
+        )
+
+    invoices = sum(row.invoices for row in report.rows)
+    print(
+        f"\n{'Total':<36}{invoices:>10,}"
+        f"{report.stored.value:>16,.2f}{report.what_if.value:>16,.2f}{report.delta.value:>+14,.2f}"
+    )
+    if report.skipped:
+        print(f"   ({report.skipped} invoices skipped: agreement not returned or missing)")
+
+if __name__ == "__main__":
+    main()